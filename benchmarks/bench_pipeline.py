@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de todas las etapas del pipeline con datos sintéticos (sin red).
+
+Etapas (cada una con su entrada sintética de n filas, ver datos_sinteticos.py):
+  limpieza  src.cleaning.stream_clean sobre un transacciones.txt crudo (13 columnas)
+  pares     src.od_builder.build_pairs
+  recableo  src.null_model.recableo_matching
+  ruteo     snap + src.routing.Router.route_many + geometrías, en una grilla
+  ch        lo mismo que ruteo pero con la contraction hierarchy (src.ch); la
+            construcción se hace al preparar y se reporta aparte (seg_construir_ch)
+  bs        tabla de cruces + calcular_barrier_scores (global y direccional) de
+            scripts/50_compute_bs.py, real + 2 nulos contra una vía en diagonal
+
+Cada (etapa, n) corre en un proceso nuevo: el pico de RSS (ru_maxrss) es el de
+esa etapa sola. Se mide sólo la etapa, no la generación de datos. El resultado
+va a JSON (segundos, filas/s, RSS antes y pico) y, con --baseline, se compara
+contra una corrida guardada: tiempo o memoria por encima de la tolerancia es
+una regresión (código de salida 1).
+
+Uso:
+  python benchmarks/bench_pipeline.py --max-exp 5
+  python benchmarks/bench_pipeline.py --etapas ruteo bs --guardar-baseline
+  python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json
+"""
+
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import importlib.util
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import datos_sinteticos as sint  # noqa: E402
+
+ETAPAS = ["limpieza", "pares", "recableo", "ruteo", "ch", "bs"]
+# El recableo genera O(n² · fracción del anillo) candidatos: con la grilla densa
+# de 60 × 60, 10⁵ pares son ~10⁹ candidatos
+MAX_N_RECABLEO = 10 ** 4
+OUT_PATH = Path("benchmarks/resultados.json")
+BASELINE_PATH = Path("benchmarks/baseline.json")
+
+
+# ---------- Etapas: preparan la entrada y devuelven la función a medir ----------
+def _etapa_limpieza(n, args, tmp):
+    from src.cleaning import stream_clean
+    raw = sint.escribir_transacciones(tmp / "transacciones.txt", n, seed=args.seed, lado=args.lado)
+    return lambda: stream_clean(raw, tmp / "cleaned.parquet")
+
+def _etapa_pares(n, args, tmp):
+    from src.od_builder import build_pairs
+    df = sint.transacciones_limpias(n, seed=args.seed, lado=args.lado)
+    return lambda: build_pairs(df)
+
+def _etapa_recableo(n, args, tmp):
+    from src.null_model import recableo_matching
+    df = sint.pares_od(n, lado=args.lado, seed=args.seed)
+    return lambda: recableo_matching(df, args.bin_km, args.tol_bins, seed=args.seed, metodo=args.candidatos)
+
+def _etapa_ruteo(n, args, tmp, ch=None):
+    from src.routing import Router, snap_od
+    router = Router.from_networkx(sint.grilla(args.lado, seed=args.seed), ch=ch)
+    df = sint.pares_od(n, lado=args.lado, seed=args.seed)
+
+    def correr():
+        od = snap_od(df, router.graph.snapper)
+        rutas, _ = router.route_many(od["nodo_origen"].to_numpy(), od["nodo_destino"].to_numpy(), geometria=True)
+        return rutas.unicas()
+    return correr
+
+def _etapa_ch(n, args, tmp):
+    from src.ch import build_ch
+    from src.routing import CSRGraph
+    grafo = CSRGraph.from_networkx(sint.grilla(args.lado, seed=args.seed))
+    t0 = time.perf_counter()
+    ch = build_ch(grafo)
+    seg_construir = time.perf_counter() - t0
+    ch.route_many([0], [len(ch) - 1])  # compila (o carga) las consultas antes de medir
+    correr = _etapa_ruteo(n, args, tmp, ch=ch)
+    correr.extra = {"seg_construir_ch": round(seg_construir, 4), "n_atajos": ch.n_atajos}
+    return correr
+
+def _script_bs():
+    spec = importlib.util.spec_from_file_location("compute_bs", RAIZ / "scripts" / "50_compute_bs.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def _etapa_bs(n, args, tmp):
+    bs = _script_bs()
+    barreras = [("Sintetica", sint.via_ferrea(args.lado, seed=args.seed))]
+    real = sint.rutas(sint.pares_od(n, lado=args.lado, seed=args.seed), seed=args.seed)
+    nulos = {f"nulo_{k}": sint.rutas(sint.pares_od(n, lado=args.lado, seed=args.seed + 1 + k), seed=k)
+             for k in range(2)}
+
+    def correr():
+        tabla = bs.tabla_cruces(real, nulos, barreras)
+        with redirect_stdout(io.StringIO()):
+            bs.calcular_barrier_scores(tabla, list(nulos), ["Sintetica"])
+            bs.calcular_barrier_scores_direccion(tabla, list(nulos), ["Sintetica"])
+    return correr
+
+_PREPARAR = {"limpieza": _etapa_limpieza, "pares": _etapa_pares, "recableo": _etapa_recableo,
+             "ruteo": _etapa_ruteo, "ch": _etapa_ch, "bs": _etapa_bs}
+
+
+# ---------- Medición ----------
+def _rss_pico_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1 << 20) if sys.platform == "darwin" else pico / 1024  # bytes en macOS, KiB en Linux
+
+def medir(etapa, n, args) -> dict:
+    """Corre una etapa en este proceso: prepara la entrada, mide tiempo y pico de RSS."""
+    with tempfile.TemporaryDirectory() as tmp:
+        correr = _PREPARAR[etapa](n, args, Path(tmp))
+        rss_antes = _rss_pico_mb()
+        t0 = time.perf_counter()
+        correr()
+        seg = time.perf_counter() - t0
+    return {
+        "etapa": etapa,
+        "n": n,
+        "seg": round(seg, 4),
+        "filas_por_seg": round(n / seg, 1) if seg > 0 else None,
+        "rss_antes_mb": round(rss_antes, 1),
+        "rss_pico_mb": round(_rss_pico_mb(), 1),
+        **getattr(correr, "extra", {}),
+    }
+
+def medir_en_subproceso(etapa, n, args) -> dict:
+    cmd = [sys.executable, __file__, "--medir", etapa, str(n), "--seed", str(args.seed), "--lado", str(args.lado),
+           "--bin-km", str(args.bin_km), "--tol-bins", str(args.tol_bins), "--candidatos", args.candidatos]
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=args.timeout, cwd=RAIZ)
+    except subprocess.TimeoutExpired:
+        return {"etapa": etapa, "n": n, "error": f"timeout ({args.timeout} s)"}
+    if res.returncode != 0:
+        error = (res.stderr.strip().splitlines() or [f"código {res.returncode}"])[-1]
+        return {"etapa": etapa, "n": n, "error": error}
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+# ---------- Baseline ----------
+def comparar(resultados, baseline, tol_tiempo, tol_memoria, min_seg=0.05) -> list[dict]:
+    """
+    Regresiones: misma (etapa, n) con tiempo o pico de RSS por encima de
+    (1 + tol) × baseline. Tiempos de baseline menores a `min_seg` son ruido y no se comparan.
+    """
+    base = {(r["etapa"], r["n"]): r for r in baseline.get("resultados", []) if "error" not in r}
+    regresiones = []
+    for r in resultados:
+        b = base.get((r["etapa"], r["n"]))
+        if b is None:
+            continue
+        if "error" in r:  # antes terminaba (p. ej. ahora se queda sin memoria)
+            regresiones.append({"etapa": r["etapa"], "n": r["n"], "metrica": "error",
+                                "actual": r["error"], "baseline": b["seg"], "razon": None})
+            continue
+        for metrica, tol in (("seg", tol_tiempo), ("rss_pico_mb", tol_memoria)):
+            if metrica == "seg" and b["seg"] < min_seg:
+                continue
+            if r[metrica] > (1 + tol) * b[metrica]:
+                regresiones.append({"etapa": r["etapa"], "n": r["n"], "metrica": metrica,
+                                    "actual": r[metrica], "baseline": b[metrica],
+                                    "razon": round(r[metrica] / b[metrica], 2)})
+    return regresiones
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del pipeline con datos sintéticos.")
+    ap.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS, help="Etapas a medir (default: todas).")
+    ap.add_argument("--min-exp", type=int, default=3, help="Desde n = 10^min_exp (default: 3).")
+    ap.add_argument("--max-exp", type=int, default=6, help="Hasta n = 10^max_exp (default: 6).")
+    ap.add_argument("--max-n-recableo", type=int, default=MAX_N_RECABLEO,
+                    help=f"Tope de n para recableo (default: {MAX_N_RECABLEO:,}).")
+    ap.add_argument("--lado", type=int, default=60, help="Nodos por lado de la grilla sintética (default: 60).")
+    ap.add_argument("--bin-km", type=float, default=0.5, help="Ancho de bin del recableo (default: 0.5).")
+    ap.add_argument("--tol-bins", type=int, default=1, help="Tolerancia del recableo (default: 1).")
+    ap.add_argument("--candidatos", choices=["balltree", "bloques"], default="bloques",
+                    help="Búsqueda de candidatos del recableo (default: bloques, memoria acotada).")
+    ap.add_argument("--seed", type=int, default=123)
+    ap.add_argument("--timeout", type=float, default=1800, help="Segundos máximos por (etapa, n) (default: 1800).")
+    ap.add_argument("--out", default=str(OUT_PATH), help=f"JSON de resultados (default: {OUT_PATH})")
+    ap.add_argument("--baseline", default=None, help="JSON de una corrida anterior para detectar regresiones.")
+    ap.add_argument("--guardar-baseline", action="store_true", help=f"Guarda también los resultados en {BASELINE_PATH}")
+    ap.add_argument("--tol-tiempo", type=float, default=0.25, help="Regresión si el tiempo sube más que esto (default: 0.25).")
+    ap.add_argument("--tol-memoria", type=float, default=0.25, help="Regresión si el pico de RSS sube más que esto (default: 0.25).")
+    ap.add_argument("--medir", nargs=2, metavar=("ETAPA", "N"), help=argparse.SUPPRESS)  # modo hijo
+    args = ap.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir(args.medir[0], int(args.medir[1]), args)))
+        return
+
+    resultados = []
+    print(f"{'etapa':>9} {'n':>10} {'seg':>9} {'filas/s':>12} {'RSS pico MB':>12}")
+    for etapa in args.etapas:
+        for e in range(args.min_exp, args.max_exp + 1):
+            n = 10 ** e
+            if etapa == "recableo" and n > args.max_n_recableo:
+                continue
+            r = medir_en_subproceso(etapa, n, args)
+            resultados.append(r)
+            if "error" in r:
+                print(f"{etapa:>9} {n:>10,} ERROR: {r['error']}")
+            else:
+                print(f"{etapa:>9} {n:>10,} {r['seg']:>9.3f} {r['filas_por_seg']:>12,.0f} {r['rss_pico_mb']:>12,.0f}")
+
+    salida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {k: getattr(args, k) for k in ("lado", "bin_km", "tol_bins", "candidatos", "seed")},
+        "resultados": resultados,
+    }
+    for path in [Path(args.out)] + ([BASELINE_PATH] if args.guardar_baseline else []):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(salida, indent=2), encoding="utf-8")
+        print(f"✔ Resultados en {path}")
+
+    if args.baseline:
+        regresiones = comparar(resultados, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                               args.tol_tiempo, args.tol_memoria)
+        for r in regresiones:
+            print(f"⚠️ Regresión {r['etapa']} n={r['n']:,}: {r['metrica']} {r['actual']} vs {r['baseline']} (×{r['razon']})")
+        if regresiones:
+            sys.exit(1)
+        print(f"✔ Sin regresiones respecto de {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark del matching 1–a–1 del modelo nulo (src.null_model.emparejar_csr).
+
+Genera candidatos CSR sintéticos con grado fijo (lo que produce el BallTree con
+bins angostos) y mide el tiempo del matching para n = 10³ … 10⁶ pares.
+
+Uso:
+  python benchmarks/bench_recableo.py --grado 50 --max-exp 6
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.null_model import emparejar_csr  # noqa: E402
+
+
+def candidatos_sinteticos(n, grado, rng):
+    """Candidatos CSR con `grado` destinos por origen, concentrados cerca de i (como en el espacio)."""
+    indptr = np.arange(0, n * grado + 1, grado, dtype=np.int64)
+    desplazamiento = rng.integers(-5 * grado, 5 * grado, size=n * grado)
+    indices = np.clip(np.repeat(np.arange(n), grado) + desplazamiento, 0, n - 1)
+    return indptr, indices
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de escalado de emparejar_csr.")
+    ap.add_argument("--grado", type=int, default=50, help="Candidatos por origen (default: 50).")
+    ap.add_argument("--max-exp", type=int, default=6, help="Hasta n = 10^max_exp (default: 6).")
+    ap.add_argument("--seed", type=int, default=123)
+    args = ap.parse_args()
+
+    print(f"{'n':>10} {'candidatos':>12} {'seg':>8} {'pares/s':>12} {'sin_posibles':>13}")
+    for e in range(3, args.max_exp + 1):
+        n = 10 ** e
+        indptr, indices = candidatos_sinteticos(n, args.grado, np.random.default_rng(args.seed))
+        t0 = time.perf_counter()
+        _, sin_posibles = emparejar_csr(indptr, indices, np.random.default_rng(args.seed))
+        dt = time.perf_counter() - t0
+        print(f"{n:>10,} {len(indices):>12,} {dt:>8.2f} {n / dt:>12,.0f} {len(sin_posibles):>13,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Datos sintéticos para los benchmarks (sin red ni descargas): transacciones SUBE
+crudas en el esquema de 13 columnas, pares OD, una grilla vial y una vía férrea
+en diagonal que la corta.
+
+Todo es determinista dada la semilla. Las coordenadas caen en una caja de CABA
+para pasar los filtros de src.cleaning.
+"""
+
+import sys
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import LineString
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.cleaning import COLUMNS  # noqa: E402
+
+LAT0, LON0 = -34.66, -58.50
+PASO = 0.002  # grados entre nodos de la grilla (~200 m)
+
+
+def paradas(n_paradas, lado, rng):
+    """Coordenadas de paradas dentro de la grilla (las transacciones se repiten en ellas)."""
+    span = (lado - 1) * PASO
+    return rng.uniform([LAT0, LON0], [LAT0 + span, LON0 + span], size=(n_paradas, 2))
+
+def transacciones(n, lado=60, n_paradas=2000, seed=0, malformadas=0.01) -> pd.DataFrame:
+    """
+    n transacciones crudas (todo texto, columnas de src.cleaning.COLUMNS), ~4 por
+    tarjeta, 80 % con id_tarifa 11 y 90 % con etapa_red_sube 0.
+    """
+    rng = np.random.default_rng(seed)
+    p = paradas(n_paradas, lado, rng)[rng.integers(0, n_paradas, n)]
+    df = pd.DataFrame({
+        "id": np.arange(n),
+        "id_tarjeta": rng.integers(0, max(n // 4, 1), n),
+        "modo": rng.choice(["BUS", "TREN", "SUBTE"], n, p=[0.8, 0.15, 0.05]),
+        "lat": p[:, 0],
+        "lon": p[:, 1],
+        "sexo": rng.choice(["F", "M"], n),
+        "interno_bus": rng.integers(1, 500, n),
+        "tipo_trx_tren": "",
+        "etapa_red_sube": np.where(rng.random(n) < 0.9, 0, 1),
+        "id_linea": rng.integers(1, 200, n),
+        "id_ramal": rng.integers(1, 400, n),
+        "id_tarifa": np.where(rng.random(n) < 0.8, 11, 1),
+        "hora": rng.integers(5, 23, n),
+    }, columns=COLUMNS)
+    df["malformada"] = rng.random(n) < malformadas
+    return df
+
+def escribir_transacciones(path, n, seed=0, **kwargs):
+    """Archivo crudo como data/raw/transacciones.txt: sin encabezado, con algunas filas de 12 campos."""
+    df = transacciones(n, seed=seed, **kwargs)
+    mal = df.pop("malformada").to_numpy()
+    df[~mal].to_csv(path, header=False, index=False)
+    df[mal].iloc[:, :-1].to_csv(path, mode="a", header=False, index=False)  # 12 campos
+    return path
+
+def transacciones_limpias(n, seed=0, **kwargs) -> pd.DataFrame:
+    """Transacciones ya tipadas como las deja src.cleaning (entrada de build_pairs)."""
+    df = transacciones(n, seed=seed, **kwargs).drop(columns="malformada")
+    return df.assign(id_tarjeta=df["id_tarjeta"].astype(str))
+
+def pares_od(n, lado=60, n_paradas=2000, seed=0) -> pd.DataFrame:
+    """n pares OD entre paradas de la grilla."""
+    rng = np.random.default_rng(seed)
+    p = paradas(n_paradas, lado, rng)
+    o, d = rng.integers(0, n_paradas, n), rng.integers(0, n_paradas, n)
+    return pd.DataFrame({
+        "id_tarjeta": np.arange(n).astype(str),
+        "lat_origen": p[o, 0], "lon_origen": p[o, 1],
+        "lat_destino": p[d, 0], "lon_destino": p[d, 1],
+    })
+
+def grilla(lado=60, seed=0) -> nx.MultiDiGraph:
+    """Grilla lado × lado bidireccional (como tests/conftest.py), longitudes en m con ruido."""
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    for i in range(lado):
+        for j in range(lado):
+            G.add_node(i * lado + j, y=LAT0 + i * PASO, x=LON0 + j * PASO)
+    for i in range(lado):
+        for j in range(lado):
+            u = i * lado + j
+            for v in ([u + 1] if j < lado - 1 else []) + ([u + lado] if i < lado - 1 else []):
+                largo = 225.0 * (1 + rng.random())
+                G.add_edge(u, v, length=largo)
+                G.add_edge(v, u, length=largo * (1 + 0.1 * rng.random()))
+    return G
+
+def via_ferrea(lado=60, seed=0) -> LineString:
+    """Vía en diagonal (con quiebres) que cruza toda la grilla de suroeste a noreste."""
+    rng = np.random.default_rng(seed)
+    span = (lado - 1) * PASO
+    t = np.linspace(0, 1, 12)
+    ruido = np.r_[0, rng.uniform(-0.05, 0.05, len(t) - 2), 0] * span
+    return LineString(np.c_[LON0 - PASO + t * (span + 2 * PASO), LAT0 + 0.3 * span + 0.4 * span * t + ruido])
+
+def rutas(df_od, seed=0, vertices=4) -> pd.DataFrame:
+    """Rutas sintéticas (polilíneas con `vertices` puntos intermedios) para el BS, con columna `ruta`."""
+    rng = np.random.default_rng(seed)
+    n = len(df_od)
+    o = df_od[["lon_origen", "lat_origen"]].to_numpy()
+    d = df_od[["lon_destino", "lat_destino"]].to_numpy()
+    t = np.linspace(0, 1, vertices + 2)[None, :, None]
+    coords = o[:, None, :] + t * (d - o)[:, None, :]
+    coords[:, 1:-1] += rng.normal(0, PASO, (n, vertices, 2))
+    return df_od.assign(ruta=shapely.linestrings(coords))
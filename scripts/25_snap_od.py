@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Snap de los pares OD a nodos del grafo vial (una sola vez para todo el pipeline).
+Arma un KD-tree sobre los nodos proyectados y resuelve todos los orígenes y
+destinos en una consulta vectorizada.
+
+Entrada:
+  - data/processed/od_pairs.parquet
+Salida (mismo archivo por default, agrega columnas):
+  - nodo_origen, nodo_destino, snap_m_origen, snap_m_destino, fuera_de_red
+
+30_route_paths.py, 40_create_null_model.py y 41_route_paths_null.py reutilizan
+estas columnas en lugar de volver a buscar el nodo más cercano.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.graph_store import add_graph_args, graph_for_od  # noqa: E402
+from src.metrics import RunMetrics  # noqa: E402
+from src.routing import snap_od  # noqa: E402
+
+OD_PATH = Path("data/processed/od_pairs.parquet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snap de pares OD a nodos del grafo (KD-tree).")
+    parser.add_argument("--in", dest="in_path", default=str(OD_PATH),
+                        help="Pares OD (default: data/processed/od_pairs.parquet)")
+    parser.add_argument("--out", dest="out_path", default=None,
+                        help="Salida (default: sobrescribe --in agregando columnas)")
+    parser.add_argument("--max-snap-m", type=float, default=500.0,
+                        help="Distancia máxima al nodo más cercano; más lejos se marca fuera_de_red (default: 500)")
+    add_graph_args(parser)
+    args = parser.parse_args()
+
+    in_path = Path(args.in_path)
+    if not in_path.exists():
+        print(f"[ERROR] No existe {in_path}. Corré scripts/20_build_od.py primero.", file=sys.stderr)
+        sys.exit(1)
+
+    df_od = pd.read_parquet(in_path)
+    print(f"→ Pares OD cargados: {len(df_od):,}")
+
+    print("→ Cargando grafo (caché en disco; la primera vez se descarga de OSM)…")
+    grafo = graph_for_od(df_od, args)
+
+    df_od = snap_od(df_od, grafo.snapper, max_snap_m=args.max_snap_m)
+
+    out_path = Path(args.out_path or in_path)
+    df_od.to_parquet(out_path, index=False)
+
+    print(f"✔ Snap listo: {len(df_od):,} pares → {out_path}")
+    print(f"   Fuera de red (> {args.max_snap_m:g} m): {int(df_od['fuera_de_red'].sum()):,}")
+
+
+if __name__ == "__main__":
+    with RunMetrics(Path(__file__).stem):
+        main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Exporta rutas (GeoParquet de 30_route_paths.py / 41_route_paths_null.py) a
+GeoJSON, bajo demanda, para inspección en QGIS o mapas web.
+
+Entradas:
+  - data/processed/routes_osmnx.parquet   (o --in, uno o más archivos)
+Salidas:
+  - el mismo nombre con extensión .geojson (o --out si se exporta un solo archivo)
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.io_utils import ROUTE_GEOMETRY, export_geojson, route_columns  # noqa: E402
+from src.metrics import RunMetrics  # noqa: E402
+
+IN_PATH = Path("data/processed/routes_osmnx.parquet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta rutas GeoParquet a GeoJSON.")
+    parser.add_argument("--in", dest="in_paths", nargs="+", default=[str(IN_PATH)],
+                        help=f"GeoParquet(s) de rutas (default: {IN_PATH})")
+    parser.add_argument("--out", default=None, help="Salida GeoJSON (sólo con un archivo de entrada)")
+    args = parser.parse_args()
+
+    if args.out and len(args.in_paths) > 1:
+        parser.error("--out sólo se admite con un único archivo de entrada")
+
+    for in_path in map(Path, args.in_paths):
+        if not in_path.exists():
+            print(f"[ERROR] No existe {in_path}", file=sys.stderr)
+            sys.exit(1)
+        if ROUTE_GEOMETRY not in route_columns(in_path):
+            print(f"[Aviso] {in_path} no tiene geometrías (--solo-cruces); se omite.")
+            continue
+        out_path = Path(args.out) if args.out else in_path.with_suffix(".geojson")
+        export_geojson(in_path, out_path)
+        print(f"✔ {in_path} → {out_path}")
+
+
+if __name__ == "__main__":
+    with RunMetrics(Path(__file__).stem):
+        main()
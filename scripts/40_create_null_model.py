@@ -11,144 +11,94 @@ Entrada:
 Salida:
   - data/processed/od_pairs_null.parquet
   - data/processed/null_model_summary.csv (frecuencias por bin real vs. nulo)
+  Con --replicates K:
+  - data/processed/od_pairs_null/replica=<k>/…  (dataset Parquet particionado por réplica)
+  - data/processed/null_model_summary.csv        (con columna replica)
 
 Parámetros:
-  --bin-km    (ancho de bin en km, default 1)
-  --tol-bins  (tolerancia en bins, default 1)
-  --seed      (semilla aleatoria)
+  --bin-km      (ancho de bin en km, default 1)
+  --tol-bins    (tolerancia en bins, default 1)
+  --seed        (semilla aleatoria)
+  --replicates  (cantidad de réplicas del ensamble, default 1)
+  --workers     (procesos para el ensamble, default 1)
+  --distancia   (haversine | red; con red los bins son de distancia en el grafo vial,
+                 con una matriz dispersa muchos-a-muchos cortada en --radio-red-km)
+  --candidatos  (balltree | bloques: matriz completa por tiles acotados por --max-mem-mb,
+                 opcionalmente en float32)
 """
 
+import sys
+import shutil
 from pathlib import Path
 import argparse
 import numpy as np
 import pandas as pd
-from random import Random
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.graph_store import add_graph_args, graph_for_od  # noqa: E402
+from src.metrics import RunMetrics  # noqa: E402
+from src.null_model import recableo_matching, recableo_replicas  # noqa: E402
+from src.routing import SNAP_COLUMNS, marcar_fuera_de_red, snap_od  # noqa: E402
 
 IN_PATH = Path("data/processed/od_pairs.parquet")
 OUT_DIR = Path("data/processed")
 OUT_PARQUET = OUT_DIR / "od_pairs_null.parquet"
 OUT_SUMMARY = OUT_DIR / "null_model_summary.csv"
-
-# ---------- Utilidades de distancia ----------
-def haversine_km_vec(lat1, lon1, lat2, lon2):
-    """
-    Distancia Haversine vectorizada en km (lat/lon en grados).
-    Acepta escalares o arrays; usa broadcasting NumPy.
-    """
-    R = 6371.0088
-    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2.0)**2
-    return 2 * R * np.arcsin(np.sqrt(a))
-
-def indice_bin(dist_km, bins):
-    """Ubica la distancia en un bin 0-based; intervalos (a, b]."""
-    return np.searchsorted(bins, dist_km, side="right") - 1
-
-# ---------- Core del modelo nulo ----------
-def posibles_destinos_por_origen(df, bins, bin_real, tol_bins=1, allow_keep=True):
-    """
-    Para cada origen i, retorna índices j de destinos compatibles por bin ± tol_bins.
-    df debe tener columnas lat_origen/lon_origen/lat_destino/lon_destino.
-    """
-    n = len(df)
-    latO = df["lat_origen"].to_numpy()
-    lonO = df["lon_origen"].to_numpy()
-    latD = df["lat_destino"].to_numpy()
-    lonD = df["lon_destino"].to_numpy()
-
-    destinos_por_origen = {}
-    for i in range(n):
-        # distancia del origen i a TODOS los destinos j (vectorizada)
-        dist_i = haversine_km_vec(latO[i], lonO[i], latD, lonD)
-        bins_j = np.searchsorted(bins, dist_i, side="right") - 1
-
-        mask = np.abs(bins_j - bin_real[i]) <= tol_bins
-        if not allow_keep:
-            mask &= (np.arange(n) != i)  # evita quedarse con su mismo destino
-
-        destinos_por_origen[i] = np.where(mask)[0].tolist()
-
-    return destinos_por_origen
-
-def recableo_matching(df, ancho_bin_km=1, tol_bins=1, allow_keep=True, seed=None):
+OUT_DATASET = OUT_DIR / "od_pairs_null"
+
+def grafo_y_snap(df, args):
+    """Para --distancia red: grafo de la caché y nodos de snap (si el OD no los trae)."""
+    grafo = graph_for_od(df, args)
+    if set(SNAP_COLUMNS) <= set(df.columns):
+        df = marcar_fuera_de_red(df, args.max_snap_m, grafo)
+    else:
+        df = snap_od(df, grafo.snapper, max_snap_m=args.max_snap_m)
+    print(f"→ Distancia de red: {int(df['fuera_de_red'].sum()):,} pares fuera de red (sin recableo)")
+    return df, grafo
+
+def opciones_candidatos(args):
+    return {"metodo": args.candidatos, "max_mem_mb": args.max_mem_mb,
+            "dtype": np.float32 if args.float32 else np.float64}
+
+def generar_ensamble(df, args, grafo=None):
     """
-    Retorna:
-      df_rec       : DataFrame con nuevos destinos y distancia_km recalculada
-      emparejados  : cantidad de orígenes con destino asignado
-      sin_posibles : lista de índices i sin destino compatible disponible
-      summary      : DataFrame con comparación de distribución de distancias (real vs nulo)
+    K réplicas con candidatos compartidos → dataset Parquet particionado por réplica.
+    El dataset se borra antes: una corrida con menos réplicas no deja particiones
+    replica=k viejas que 41/50 lean como parte del ensamble.
     """
-    rng = Random(seed)
-
-    # Asegurar columna distancia_km (real)
-    if "distancia_km" not in df.columns:
-        df = df.copy()
-        df["distancia_km"] = haversine_km_vec(
-            df["lat_origen"].to_numpy(), df["lon_origen"].to_numpy(),
-            df["lat_destino"].to_numpy(), df["lon_destino"].to_numpy()
+    if OUT_DATASET.exists():
+        shutil.rmtree(OUT_DATASET)
+    resumenes = []
+    for replica, df_null, emp, sin_pos, summary in recableo_replicas(
+        df,
+        replicas=args.replicates,
+        ancho_bin_km=args.bin_km,
+        tol_bins=args.tol_bins,
+        allow_keep=args.allow_keep,
+        seed=args.seed,
+        workers=args.workers,
+        graph=grafo,
+        radio_red_km=args.radio_red_km,
+        **opciones_candidatos(args),
+    ):
+        df_null = df_null.assign(replica=replica)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df_null, preserve_index=False),
+            OUT_DATASET,
+            partition_cols=["replica"],
+            basename_template=f"part-{replica}-{{i}}.parquet",
+            existing_data_behavior="delete_matching",
         )
+        resumenes.append(summary.reset_index().assign(replica=replica, emparejados=emp,
+                                                      sin_posibles=len(sin_pos)))
+        print(f"   Réplica {replica}: emparejados {emp} | sin posibles {len(sin_pos)}")
 
-    # Construcción de bins
-    max_d = float(np.nanmax(df["distancia_km"].to_numpy()))
-    if max_d == 0:
-        max_d = 0.5
-    bins = np.arange(0, max_d + ancho_bin_km, ancho_bin_km)
-
-    # Bin real de cada trayecto
-    bin_real = df["distancia_km"].apply(lambda d: indice_bin(d, bins)).to_numpy()
-
-    # Pre-cálculo de candidatos por origen
-    destinos_por_origen = posibles_destinos_por_origen(
-        df, bins=bins, bin_real=bin_real, tol_bins=tol_bins, allow_keep=allow_keep
-    )
-
-    # Conjuntos para matching 1–a–1
-    disponibles_dest = set(range(len(df)))
-    pendientes = list(range(len(df)))
-    rng.shuffle(pendientes)
-
-    nuevo_latD = df["lat_destino"].copy()
-    nuevo_lonD = df["lon_destino"].copy()
-    sin_posibles = []
-
-    while pendientes:
-        i = pendientes.pop()
-        candidatos = [j for j in destinos_por_origen[i] if j in disponibles_dest]
-        if not candidatos:
-            sin_posibles.append(i)
-            continue
-        j = rng.choice(candidatos)
-        nuevo_latD.iat[i] = df.at[j, "lat_destino"]
-        nuevo_lonD.iat[i] = df.at[j, "lon_destino"]
-        disponibles_dest.remove(j)
-
-    # Crear df resultante
-    df_rec = df.copy()
-    df_rec["lat_destino"] = nuevo_latD
-    df_rec["lon_destino"] = nuevo_lonD
-
-    # Recalcular distancias para el nulo
-    df_rec["distancia_km"] = haversine_km_vec(
-        df_rec["lat_origen"].to_numpy(), df_rec["lon_origen"].to_numpy(),
-        df_rec["lat_destino"].to_numpy(), df_rec["lon_destino"].to_numpy()
-    )
-
-    emparejados = len(df) - len(sin_posibles)
-
-    # Comparación de distribuciones (frecuencia por bin)
-    real_bins = pd.cut(df["distancia_km"], bins=bins, include_lowest=True)
-    nulo_bins = pd.cut(df_rec["distancia_km"], bins=bins, include_lowest=True)
-    freq_real = real_bins.value_counts().sort_index()
-    freq_nulo = nulo_bins.value_counts().sort_index()
-
-    prob_real = (freq_real / max(freq_real.sum(), 1)).rename("prob_real")
-    prob_nulo = (freq_nulo / max(freq_nulo.sum(), 1)).rename("prob_nulo")
-    summary = pd.concat([prob_real, prob_nulo], axis=1)
-    summary.index.name = "bin"
-
-    return df_rec, emparejados, sin_posibles, summary
+    pd.concat(resumenes).sort_values(["replica", "bin"]).to_csv(OUT_SUMMARY, index=False)
+    print(f"✔ Ensamble generado: {args.replicates} réplicas × {len(df):,} filas")
+    print(f"   - {OUT_DATASET}/")
+    print(f"   - {OUT_SUMMARY}")
 
 # ---------- Main CLI ----------
 def main():
@@ -158,6 +108,23 @@ def main():
     parser.add_argument("--seed", type=int, default=123, help="Semilla aleatoria (default: 123).")
     parser.add_argument("--allow-keep", action="store_true",
                         help="Permite que un origen conserve su mismo destino si cae dentro del bin (off por default).")
+    parser.add_argument("--replicates", type=int, default=1,
+                        help="Cantidad de réplicas del modelo nulo (default: 1 → od_pairs_null.parquet).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para correr las réplicas en paralelo (default: 1).")
+    parser.add_argument("--distancia", choices=["haversine", "red"], default="haversine",
+                        help="Distancia que preservan los bins: línea recta o de red vial (default: haversine).")
+    parser.add_argument("--radio-red-km", type=float, default=None,
+                        help="Corte de la matriz de distancias de red (default: 2 × máx. haversine + tolerancia).")
+    parser.add_argument("--max-snap-m", type=float, default=500.0,
+                        help="Con --distancia red: snap máximo al nodo más cercano (default: 500)")
+    parser.add_argument("--candidatos", choices=["balltree", "bloques"], default="balltree",
+                        help="Búsqueda de candidatos: BallTree por anillos o matriz por tiles (default: balltree).")
+    parser.add_argument("--max-mem-mb", type=float, default=256,
+                        help="Con --candidatos bloques: memoria de los tiles de distancias (default: 256 MB).")
+    parser.add_argument("--float32", action="store_true",
+                        help="Con --candidatos bloques: distancias en float32 (mitad de memoria; bordes de bin ±1e-6)")
+    add_graph_args(parser)
     args = parser.parse_args()
 
     if not IN_PATH.exists():
@@ -173,12 +140,23 @@ def main():
     if missing:
         raise ValueError(f"Faltan columnas en OD: {missing}")
 
+    grafo = None
+    if args.distancia == "red":
+        df, grafo = grafo_y_snap(df, args)
+
+    if args.replicates > 1:
+        generar_ensamble(df, args, grafo)
+        return
+
     df_null, emp, sin_pos, summary = recableo_matching(
         df,
         ancho_bin_km=args.bin_km,
         tol_bins=args.tol_bins,
         allow_keep=args.allow_keep,
         seed=args.seed,
+        graph=grafo,
+        radio_red_km=args.radio_red_km,
+        **opciones_candidatos(args),
     )
 
     df_null.to_parquet(OUT_PARQUET, index=False)
@@ -190,5 +168,6 @@ def main():
     print(f"   - {OUT_SUMMARY}")
 
 if __name__ == "__main__":
-    main()
+    with RunMetrics(Path(__file__).stem):
+        main()
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Barrido de sensibilidad del modelo nulo: corre el recableo para todas las
+combinaciones de ancho de bin × tolerancia × semilla y resume cada una.
+
+Las distancias y el índice ordenado de candidatos se calculan una sola vez;
+cada (bin-km, tol-bins) deriva sus candidatos de ese índice (ver
+src.null_model.barrido_parametros). Cada celda es idéntica a correr
+40_create_null_model.py con esos parámetros (distancia haversine).
+
+Memoria: el índice guarda todos los pares (i, j) dentro del mayor radio del
+barrido (el bin más ancho con la mayor tolerancia), ~16 bytes por candidato
+(índice int64 + distancia float64) y ~40 bytes por candidato en el pico de la
+construcción (filas y orden del lexsort). Con N pares y C candidatos medios son
+~40·N·C bytes: 1e6 pares con 2 000 candidatos ≈ 80 GB, así que en datos
+densos conviene barrer pocos anchos grandes por corrida o correr cada celda con
+40_create_null_model.py --candidatos bloques --max-mem-mb (solo el radio de esa
+celda, construcción en bloques de memoria acotada). Con --workers > 1
+cada proceso recibe su propia copia del índice (× workers).
+
+Entrada:
+  - data/processed/od_pairs.parquet
+
+Salida:
+  - data/processed/null_model_sweep.csv
+    (bin_km, tol_bins, seed, emparejados, sin_posibles, candidatos_medios,
+     js_div: Jensen–Shannon entre distribuciones por bin, ks: Kolmogorov–Smirnov)
+
+Parámetros:
+  --bin-km     (uno o más anchos de bin en km, default 0.5 1 2)
+  --tol-bins   (una o más tolerancias, default 0 1 2)
+  --seeds      (una o más semillas, default 123)
+  --workers    (procesos, una config por tarea, default 1)
+"""
+
+import sys
+from pathlib import Path
+import argparse
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.metrics import RunMetrics  # noqa: E402
+from src.null_model import barrido_parametros  # noqa: E402
+
+IN_PATH = Path("data/processed/od_pairs.parquet")
+OUT_PATH = Path("data/processed/null_model_sweep.csv")
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros del modelo nulo (bin-km × tol-bins × seeds).")
+    parser.add_argument("--bin-km", type=float, nargs="+", default=[0.5, 1.0, 2.0],
+                        help="Anchos de bin en km (default: 0.5 1 2).")
+    parser.add_argument("--tol-bins", type=int, nargs="+", default=[0, 1, 2],
+                        help="Tolerancias en bins (default: 0 1 2).")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[123], help="Semillas (default: 123).")
+    parser.add_argument("--allow-keep", action="store_true",
+                        help="Permite que un origen conserve su mismo destino (como en 40_create_null_model.py).")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos en paralelo (default: 1).")
+    parser.add_argument("--out", default=str(OUT_PATH), help=f"CSV de salida (default: {OUT_PATH})")
+    args = parser.parse_args()
+
+    if not IN_PATH.exists():
+        raise FileNotFoundError(f"No se encontró {IN_PATH}. Corré antes scripts/20_build_od.py")
+
+    df = pd.read_parquet(IN_PATH, columns=["lat_origen", "lon_origen", "lat_destino", "lon_destino"])
+    n_combos = len(args.bin_km) * len(args.tol_bins) * len(args.seeds)
+    print(f"→ Barrido: {n_combos} combinaciones sobre {len(df):,} pares OD")
+
+    res = barrido_parametros(df, args.bin_km, args.tol_bins, args.seeds,
+                             allow_keep=args.allow_keep, workers=args.workers)
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    res.to_csv(out, index=False)
+    print(res.to_string(index=False))
+    print(f"✔ Barrido guardado en {out}")
+
+if __name__ == "__main__":
+    with RunMetrics(Path(__file__).stem):
+        main()
@@ -4,62 +4,171 @@
 """
 Calcula Barrier Score global y direccional usando las funciones provistas por el usuario.
 
+Una sola definición en todas las salidas (JSON global, JSON direccional y CSV
+de --bootstrap), la de src.barriers.barrier_score con el modelo nulo como
+esperado: BS = (cruces_nulo - cruces_reales) / cruces_nulo. BS > 0 → el real
+cruza menos de lo esperado (barrera más fuerte); sin cruces nulos el BS es null.
+
+Los cruces se calculan una sola vez en una tabla (modelo, ruta_id, barrera,
+direccion, direccion_od) con una fila por ruta que cruza cada barrera; ambos
+scores son agregaciones group-by sobre ella. La tabla se guarda en Parquet con
+clave = hash de los archivos de entrada, así una corrida repetida no relee rutas.
+
+La dirección de cada cruce (--direccion) es por defecto el lado de la barrera
+en que empieza y termina el viaje (src.barriers.crossing_direction: sur_norte =
+del lado sur al lado norte del trazado, en bloque para todos los extremos; en
+barreras meridionales los sentidos son oeste_este/este_oeste), o con
+--direccion latitud la comparación de latitudes de inicio y fin anterior.
+`direccion` usa los extremos de la ruta y `direccion_od` los puntos OD.
+
+Las rutas se leen con proyección de columnas: si traen cruza_<linea> (ruteo
+--solo-cruces) no se decodifica ninguna geometría. Se aceptan también los .pkl
+anteriores.
+
 Entradas:
-  --obs data/processed/routes_osmnx.pkl
-  --null-glob "data/processed/routes_null*.pkl"
+  --obs data/processed/routes_osmnx.parquet
+  --null-glob "data/processed/routes_null*.parquet"
   --barreras data/external/trenes_caba.geojson
 
 Salidas:
   data/processed/barrier_scores_global.json
   data/processed/barrier_scores_directional.json
+  data/processed/barrier_scores_stats.csv   (con --bootstrap N: IC, z-score y p-valor
+                                            por barrera y dirección, ver src/bs_stats.py)
+  data/interim/bs_cruces/<hash>.parquet   (caché de la tabla de cruces)
 """
 
 import argparse
 import glob
+import hashlib
 import json
+import sys
 from pathlib import Path
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.geometry import LineString, MultiLineString
-
-
-def direccion_geometrica(ruta):
-    coords = list(ruta.coords)
-    lat_inicio = coords[0][1]
-    lat_fin = coords[-1][1]
-    if lat_fin > lat_inicio:
-        return "sur_norte"
-    elif lat_fin < lat_inicio:
-        return "norte_sur"
+import shapely
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src import metrics  # noqa: E402
+from src.barriers import (DEFINICION_BS, SENTIDOS, barrier_score, crossing_column, crossing_direction,  # noqa: E402
+                          crossing_matrix, direction_labels, load_barriers)
+from src.bs_stats import conteos_nulos, estadisticas_bs, patrones_observados  # noqa: E402
+from src.io_utils import ROUTE_GEOMETRY, load_routes, route_columns, route_fingerprint  # noqa: E402
+from src.metrics import RunMetrics  # noqa: E402
+
+CACHE_CRUCES = Path("data/interim/bs_cruces")
+MODELO_REAL = "real"
+MODOS_DIRECCION = ["lado", "latitud"]
+VERSION_CRUCES = 2  # 2: sentidos este/oeste en barreras meridionales
+
+
+def sentidos_barreras(lista_de_barreras, modo="lado"):
+    """Nombres (hacia +1, hacia -1) de los sentidos de cruce de cada barrera; por latitud siempre sur/norte."""
+    return {n: direction_labels(b) if modo == "lado" else SENTIDOS["zonal"] for n, b in lista_de_barreras}
+
+def _titulo(sentido):
+    return " → ".join(p.capitalize() for p in sentido.split("_"))
+
+def _direccion_lat(ini, fin):
+    return np.select([fin > ini, fin < ini], ["sur_norte", "norte_sur"], "horizontal")
+
+def extremos_od(df):
+    return tuple(df[c].to_numpy(dtype=float) for c in ("lon_origen", "lat_origen", "lon_destino", "lat_destino"))
+
+def extremos_ruta(df):
+    """
+    (lon_ini, lat_ini, lon_fin, lat_fin) de cada ruta, vectorizado: de la geometría
+    o, sin ella (--solo-cruces), de *_inicio_ruta/*_fin_ruta. Rutas anteriores sin
+    lon_inicio_ruta usan los puntos OD.
+    """
+    if "ruta" in df.columns:
+        rutas = df["ruta"].to_numpy()
+        ini, fin = shapely.get_point(rutas, 0), shapely.get_point(rutas, -1)
+        return shapely.get_x(ini), shapely.get_y(ini), shapely.get_x(fin), shapely.get_y(fin)
+    columnas = ["lon_inicio_ruta", "lat_inicio_ruta", "lon_fin_ruta", "lat_fin_ruta"]
+    if set(columnas) <= set(df.columns):
+        return tuple(df[c].to_numpy(dtype=float) for c in columnas)
+    return extremos_od(df)
+
+def direcciones(df):
+    """Dirección por latitud de cada ruta; sin geometría (--solo-cruces) usa lat_inicio_ruta/lat_fin_ruta."""
+    if "ruta" in df.columns:
+        _, ini, _, fin = extremos_ruta(df)
     else:
-        return "horizontal"
+        ini, fin = df["lat_inicio_ruta"].to_numpy(dtype=float), df["lat_fin_ruta"].to_numpy(dtype=float)
+    return pd.Series(_direccion_lat(ini, fin), index=df.index)
+
+def marcar_cruces(df, lista_de_barreras):
+    """
+    Matriz bool rutas × barreras con una sola consulta STRtree.
+    Las rutas de --solo-cruces no traen geometría: se usan sus columnas cruza_*.
+    """
+    if "ruta" not in df.columns:
+        faltan = [n for n, _ in lista_de_barreras if crossing_column(n) not in df.columns]
+        if faltan:
+            raise ValueError(f"Rutas sin geometría ni columnas de cruce para: {faltan}")
+        return df[[crossing_column(n) for n, _ in lista_de_barreras]].to_numpy(dtype=bool)
+    return crossing_matrix(df["ruta"].to_numpy(), [b for _, b in lista_de_barreras]).toarray()
+
+def direcciones_por_lado(sub, k, lista_de_barreras, extremos):
+    """Dirección de cada cruce según el lado de su barrera k: una llamada por barrera."""
+    out = np.full(len(sub), "mismo_lado", dtype=object)
+    xy = extremos(sub)
+    for j, (_, barrera) in enumerate(lista_de_barreras):
+        m = k == j
+        if m.any():
+            out[m] = crossing_direction(barrera, *(a[m] for a in xy))
+    return out
+
+def tabla_cruces_modelo(df, modelo, lista_de_barreras, modo="lado"):
+    """Filas (ruta, barrera) que cruzan, con dirección según extremos de la ruta y según puntos OD."""
+    ruta_id, k = np.nonzero(marcar_cruces(df, lista_de_barreras))
+    sub = df.iloc[ruta_id]
+    if modo == "latitud":
+        direccion = direcciones(sub).to_numpy()
+        direccion_od = _direccion_lat(sub["lat_origen"].to_numpy(), sub["lat_destino"].to_numpy())
+    else:
+        direccion = direcciones_por_lado(sub, k, lista_de_barreras, extremos_ruta)
+        direccion_od = direcciones_por_lado(sub, k, lista_de_barreras, extremos_od)
+    return pd.DataFrame({
+        "modelo": modelo,
+        "ruta_id": ruta_id,
+        "barrera": np.array([n for n, _ in lista_de_barreras], dtype=object)[k],
+        "direccion": direccion,
+        "direccion_od": direccion_od,
+    })
+
+def tabla_cruces(df_real, dict_df_nulo, lista_de_barreras, modo="lado"):
+    partes = [tabla_cruces_modelo(df_real, MODELO_REAL, lista_de_barreras, modo)]
+    partes += [tabla_cruces_modelo(df, nombre, lista_de_barreras, modo) for nombre, df in dict_df_nulo.items()]
+    return pd.concat(partes, ignore_index=True)
+
+def calcular_barrier_scores(tabla, modelos_nulos, nombres_barreras, sentidos=None):
+    cruces = tabla.groupby(["barrera", "modelo"]).size()
+    por_dir = tabla[tabla["modelo"] == MODELO_REAL].groupby(["barrera", "direccion_od"]).size()
 
-def calcular_barrier_scores(df_real, dict_df_nulo, lista_de_barreras):
     resultados = {}
-    for nombre_barrera, barrera in lista_de_barreras:
+    for nombre_barrera in nombres_barreras:
         print(f"\n📍 Barrier Score para '{nombre_barrera}'")
 
-        nombre_columna = f"cruza_{nombre_barrera.lower().replace(' ', '_')}"
-        df_real[nombre_columna] = df_real["ruta"].apply(lambda r: r.crosses(barrera))
-        cruces_reales = df_real[nombre_columna].sum()
-
-        df_cruza_real = df_real[df_real[nombre_columna] == True]
-        cruces_sur_norte = (df_cruza_real["lat_destino"] > df_cruza_real["lat_origen"]).sum()
-        cruces_norte_sur = (df_cruza_real["lat_destino"] < df_cruza_real["lat_origen"]).sum()
+        cruces_reales = int(cruces.get((nombre_barrera, MODELO_REAL), 0))
+        ida, vuelta = (sentidos or {}).get(nombre_barrera, SENTIDOS["zonal"])
+        cruces_ida = int(por_dir.get((nombre_barrera, ida), 0))
+        cruces_vuelta = int(por_dir.get((nombre_barrera, vuelta), 0))
 
-        print(f"→ Cruces modelo real: {cruces_reales} (Sur a norte: {cruces_sur_norte}, Norte a sur: {cruces_norte_sur})")
+        print(f"→ Cruces modelo real: {cruces_reales} ({_titulo(ida)}: {cruces_ida}, {_titulo(vuelta)}: {cruces_vuelta})")
 
         resultados[nombre_barrera] = {
-            "cruces_reales": int(cruces_reales),
-            "norte_sur": int(cruces_norte_sur),
-            "sur_norte": int(cruces_sur_norte),
+            "cruces_reales": cruces_reales,
+            vuelta: cruces_vuelta,
+            ida: cruces_ida,
+            "definicion": DEFINICION_BS,
             "modelos_nulos": {}
         }
 
-        for nombre_modelo, df_nulo in dict_df_nulo.items():
-            df_nulo[nombre_columna] = df_nulo["ruta"].apply(lambda r: r.crosses(barrera))
-            cruces_nulo = df_nulo[nombre_columna].sum()
+        for nombre_modelo in modelos_nulos:
+            cruces_nulo = int(cruces.get((nombre_barrera, nombre_modelo), 0))
 
             if cruces_nulo == 0:
                 print(f"⚠️ {nombre_modelo}: Sin cruces en el modelo nulo.")
@@ -69,69 +178,51 @@ def calcular_barrier_scores(df_real, dict_df_nulo, lista_de_barreras):
                 }
                 continue
 
-            score = (cruces_nulo - cruces_reales) / cruces_reales
+            score = barrier_score(cruces_reales, cruces_nulo)
             print(f"→ {nombre_modelo}: {cruces_nulo} cruces → Barrier Score = {score:.3f}")
 
             resultados[nombre_barrera]["modelos_nulos"][nombre_modelo] = {
-                "cruces_nulo": int(cruces_nulo),
+                "cruces_nulo": cruces_nulo,
                 "barrier_score": round(score, 3)
             }
 
     return resultados
 
-def calcular_barrier_scores_direccion(df_real, dict_df_nulo, lista_de_barreras):
-    resultados = {}
-    for nombre_barrera, barrera in lista_de_barreras:
-        print(f"\n📍 Barrier Score para '{nombre_barrera}' (según dirección geométrica)")
+def calcular_barrier_scores_direccion(tabla, modelos_nulos, nombres_barreras, sentidos=None):
+    por_dir = tabla.groupby(["barrera", "modelo", "direccion"]).size()
+
+    def n(barrera, modelo, direccion):
+        return int(por_dir.get((barrera, modelo, direccion), 0))
 
-        nombre_columna = f"cruza_{nombre_barrera.lower().replace(' ', '_')}"
-        df_real[nombre_columna] = df_real["ruta"].apply(lambda r: r.crosses(barrera))
-        df_cruza_real = df_real[df_real[nombre_columna]].copy()
-        df_cruza_real["direccion"] = df_cruza_real["ruta"].apply(direccion_geometrica)
+    resultados = {}
+    for nombre_barrera in nombres_barreras:
+        print(f"\n📍 Barrier Score para '{nombre_barrera}' (según extremos de la ruta)")
+        direcciones_barrera = (sentidos or {}).get(nombre_barrera, SENTIDOS["zonal"])
 
-        cruces_sur_norte_real = df_cruza_real[df_cruza_real["direccion"] == "sur_norte"]
-        cruces_norte_sur_real = df_cruza_real[df_cruza_real["direccion"] == "norte_sur"]
+        reales = {d: n(nombre_barrera, MODELO_REAL, d) for d in direcciones_barrera}
 
         print(f"→ Modelo real:")
-        print(f"   • Sur → Norte: {len(cruces_sur_norte_real)}")
-        print(f"   • Norte → Sur: {len(cruces_norte_sur_real)}")
+        for d, cruces in reales.items():
+            print(f"   • {_titulo(d)}: {cruces}")
 
         resultados[nombre_barrera] = {
-            "cruces_reales": {
-                "sur_norte": int(len(cruces_sur_norte_real)),
-                "norte_sur": int(len(cruces_norte_sur_real)),
-            },
+            "cruces_reales": reales,
+            "definicion": DEFINICION_BS,
             "modelos_nulos": {}
         }
 
-        for nombre_modelo, df_nulo in dict_df_nulo.items():
-            df_nulo[nombre_columna] = df_nulo["ruta"].apply(lambda r: r.crosses(barrera))
-            df_cruza_nulo = df_nulo[df_nulo[nombre_columna]].copy()
-            df_cruza_nulo["direccion"] = df_cruza_nulo["ruta"].apply(direccion_geometrica)
-
-            cruces_sur_norte_nulo = df_cruza_nulo[df_cruza_nulo["direccion"] == "sur_norte"]
-            cruces_norte_sur_nulo = df_cruza_nulo[df_cruza_nulo["direccion"] == "norte_sur"]
-
-            n_sur_norte = len(cruces_sur_norte_nulo)
-            n_norte_sur = len(cruces_norte_sur_nulo)
-
-            bs_sur_norte = (n_sur_norte - len(cruces_sur_norte_real)) / len(cruces_sur_norte_real) if n_sur_norte > 0 else None
-            bs_norte_sur = (n_norte_sur - len(cruces_norte_sur_real)) / len(cruces_norte_sur_real) if n_norte_sur > 0 else None
-
+        for nombre_modelo in modelos_nulos:
             print(f"→ {nombre_modelo}:")
-            print(f"   • Sur → Norte: {n_sur_norte} → Barrier Score = {bs_sur_norte if bs_sur_norte is not None else '–'}")
-            print(f"   • Norte → Sur: {n_norte_sur} → Barrier Score = {bs_norte_sur if bs_norte_sur is not None else '–'}")
-
-            resultados[nombre_barrera]["modelos_nulos"][nombre_modelo] = {
-                "sur_norte": {
-                    "cruces_nulo": int(n_sur_norte),
-                    "barrier_score": round(bs_sur_norte, 3) if bs_sur_norte is not None else None
-                },
-                "norte_sur": {
-                    "cruces_nulo": int(n_norte_sur),
-                    "barrier_score": round(bs_norte_sur, 3) if bs_norte_sur is not None else None
+            por_modelo = {}
+            for d in direcciones_barrera:
+                cruces_nulo = n(nombre_barrera, nombre_modelo, d)
+                bs = barrier_score(reales[d], cruces_nulo) if cruces_nulo > 0 else None
+                print(f"   • {_titulo(d)}: {cruces_nulo} → Barrier Score = {bs if bs is not None else '–'}")
+                por_modelo[d] = {
+                    "cruces_nulo": cruces_nulo,
+                    "barrier_score": round(bs, 3) if bs is not None else None
                 }
-            }
+            resultados[nombre_barrera]["modelos_nulos"][nombre_modelo] = por_modelo
 
     return resultados
 
@@ -139,24 +230,44 @@ def calcular_barrier_scores_direccion(df_real, dict_df_nulo, lista_de_barreras):
 # Helpers de IO / barreras
 # -------------------------------------------------------------------
 
-def load_observed(path: Path) -> pd.DataFrame:
-    return pd.read_pickle(path)
+def columnas_bs(path, nombres_barreras) -> list[str]:
+    """Columnas mínimas para el BS: cruces precalculados si están, si no la geometría."""
+    disponibles = set(route_columns(path))
+    od = ["lat_origen", "lon_origen", "lat_destino", "lon_destino"]
+    cruces = [crossing_column(n) for n in nombres_barreras] + ["lat_inicio_ruta", "lat_fin_ruta"]
+    if set(cruces) <= disponibles:
+        return od + cruces + [c for c in ("lon_inicio_ruta", "lon_fin_ruta") if c in disponibles]
+    return od + [ROUTE_GEOMETRY]
 
-def load_nulls(glob_pat: str) -> dict[str, pd.DataFrame]:
+def load_observed(path: Path, nombres_barreras=None) -> pd.DataFrame:
+    columnas = None if nombres_barreras is None else columnas_bs(path, nombres_barreras)
+    return load_routes(path, columns=columnas)
+
+def null_paths(glob_pat: str) -> dict[str, Path]:
     paths = sorted(glob.glob(glob_pat))
     if not paths:
         raise FileNotFoundError(f"No se encontraron nulos con patrón: {glob_pat}")
-    return {Path(p).stem: pd.read_pickle(p) for p in paths}
-
-def load_barreras(path: Path) -> list[tuple[str, LineString | MultiLineString]]:
-    gdf = gpd.read_file(path)
-    if "Linea" in gdf.columns:
-        lista = []
-        for name, sub in gdf.groupby("Linea"):
-            lista.append((str(name), sub.unary_union))
-        return lista
-    else:
-        return [(f"barrera_{i}", geom) for i, geom in enumerate(gdf.geometry)]
+    return {Path(p).stem: Path(p) for p in paths}
+
+def unidades_observadas(path):
+    """Unidad de remuestreo de cada ruta observada: id_tarjeta si está, si no la ruta."""
+    if "id_tarjeta" in route_columns(path):
+        return load_routes(path, columns=["id_tarjeta"])["id_tarjeta"].to_numpy()
+    return np.arange(len(load_routes(path, columns=["lat_origen"])))
+
+def clave_entradas(obs_path, nulos, barreras_path, modo="lado") -> str:
+    """
+    Hash del modo de dirección, de las rutas observadas y los nulos (con su nombre)
+    y de las barreras. De las rutas sólo se lee el footer Parquet (route_fingerprint),
+    no los datos; el GeoJSON de barreras es chico y se hashea entero.
+    """
+    h = hashlib.sha1(f"{modo}:{VERSION_CRUCES}".encode())
+    for nombre, path in [(MODELO_REAL, obs_path), *nulos.items()]:
+        h.update(nombre.encode())
+        h.update(route_fingerprint(path))
+    h.update(b"barreras")
+    h.update(Path(barreras_path).read_bytes())
+    return h.hexdigest()[:16]
 
 # -------------------------------------------------------------------
 # Main
@@ -164,19 +275,47 @@ def load_barreras(path: Path) -> list[tuple[str, LineString | MultiLineString]]:
 
 def main():
     ap = argparse.ArgumentParser(description="Compute BS global y direccional (todas las líneas).")
-    ap.add_argument("--obs", default="data/processed/routes_osmnx.pkl", help="Pickle de rutas observadas")
-    ap.add_argument("--null-glob", default="data/processed/routes_null*.pkl", help="Patrón de pickles de nulos")
+    ap.add_argument("--obs", default="data/processed/routes_osmnx.parquet", help="Rutas observadas (GeoParquet o .pkl)")
+    ap.add_argument("--null-glob", default="data/processed/routes_null*.parquet", help="Patrón de rutas de nulos")
     ap.add_argument("--barreras", default="data/external/trenes_caba.geojson", help="GeoJSON de ferrocarriles")
     ap.add_argument("--out-global", default="data/processed/barrier_scores_global.json", help="Salida JSON (BS global)")
     ap.add_argument("--out-dir", default="data/processed/barrier_scores_directional.json", help="Salida JSON (BS direccional)")
+    ap.add_argument("--cache-cruces", default=str(CACHE_CRUCES),
+                    help=f"Directorio de la caché de tablas de cruces (default: {CACHE_CRUCES})")
+    ap.add_argument("--sin-cache-cruces", action="store_true", help="Recalcula los cruces sin leer ni escribir la caché")
+    ap.add_argument("--direccion", choices=MODOS_DIRECCION, default="lado",
+                    help="Dirección del cruce: lado de la barrera en origen y destino, o latitud (default: lado)")
+    ap.add_argument("--bootstrap", type=int, default=0,
+                    help="Réplicas bootstrap (tarjetas) para IC, z-score y p-valor del BS (default: 0 = no)")
+    ap.add_argument("--alpha", type=float, default=0.05, help="Nivel de los IC bootstrap (default: 0.05)")
+    ap.add_argument("--seed", type=int, default=123, help="Semilla del bootstrap (default: 123)")
+    ap.add_argument("--out-stats", default="data/processed/barrier_scores_stats.csv",
+                    help="Salida CSV de --bootstrap")
     args = ap.parse_args()
 
-    obs = load_observed(Path(args.obs))
-    nulls = load_nulls(args.null_glob)
-    barreras = load_barreras(Path(args.barreras))
+    nulos = null_paths(args.null_glob)
+    barreras = load_barriers(Path(args.barreras))
+    nombres = [n for n, _ in barreras]
+    sentidos = sentidos_barreras(barreras, args.direccion)
 
-    res_global = calcular_barrier_scores(obs.copy(), {k: v.copy() for k, v in nulls.items()}, barreras)
-    res_dir = calcular_barrier_scores_direccion(obs.copy(), {k: v.copy() for k, v in nulls.items()}, barreras)
+    cache_path = Path(args.cache_cruces) / f"{clave_entradas(args.obs, nulos, args.barreras, args.direccion)}.parquet"
+    if not args.sin_cache_cruces and cache_path.exists():
+        print(f"→ Tabla de cruces desde caché: {cache_path}")
+        tabla = pd.read_parquet(cache_path)
+    else:
+        with metrics.timer("cargar_rutas"):
+            obs = load_observed(Path(args.obs), nombres)
+            rutas_nulas = {k: load_observed(p, nombres) for k, p in nulos.items()}
+        with metrics.timer("tabla_cruces"):
+            tabla = tabla_cruces(obs, rutas_nulas, barreras, args.direccion)
+        if not args.sin_cache_cruces:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tabla.to_parquet(cache_path, index=False)
+
+    metrics.info(nulos=len(nulos), barreras=len(nombres), filas_tabla=len(tabla))
+    with metrics.timer("barrier_scores"):
+        res_global = calcular_barrier_scores(tabla, list(nulos), nombres, sentidos)
+        res_dir = calcular_barrier_scores_direccion(tabla, list(nulos), nombres, sentidos)
 
     Path(args.out_global).parent.mkdir(parents=True, exist_ok=True)
     with open(args.out_global, "w", encoding="utf-8") as f:
@@ -189,6 +328,17 @@ def main():
     print(f"  - Global     → {args.out_global}")
     print(f"  - Direccional→ {args.out_dir}")
 
+    if args.bootstrap:
+        grupos = unidades_observadas(args.obs)
+        patrones = patrones_observados(tabla[tabla["modelo"] == MODELO_REAL], nombres, len(grupos), grupos=grupos)
+        with metrics.timer("bootstrap"):
+            stats = estadisticas_bs(patrones, conteos_nulos(tabla, list(nulos), nombres), nombres,
+                                    n_boot=args.bootstrap, alpha=args.alpha, seed=args.seed,
+                                    sentidos=[sentidos[n] for n in nombres])
+        stats.to_csv(args.out_stats, index=False)
+        print(f"  - Estadística→ {args.out_stats} ({args.bootstrap} réplicas bootstrap, {len(nulos)} nulos)")
+
 
 if __name__ == "__main__":
-    main()
+    with RunMetrics(Path(__file__).stem):
+        main()
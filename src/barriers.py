@@ -1,5 +1,18 @@
+import hashlib
+import warnings
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
+import shapely
+from scipy.sparse import csr_matrix
+from shapely import STRtree
+
+from src import metrics
+
+# Fórmula de barrier_score, guardada junto a los resultados: hasta 2026-10 el JSON
+# de 50_compute_bs.py usaba (nulo - real) / real, así que no son comparables
+DEFINICION_BS = "(cruces_nulo - cruces_reales) / cruces_nulo"
 
 def barrier_score(observed:int, expected:float) -> float:
     # BS > 0 → menos cruces que los esperados (barrera más fuerte)
@@ -12,3 +25,241 @@ def directional_bs(obs_ns:int, exp_ns:float, obs_sn:int, exp_sn:float) -> dict:
         'BS_NS': barrier_score(obs_ns, exp_ns),
         'BS_SN': barrier_score(obs_sn, exp_sn),
     }
+
+def crossing_matrix(rutas, barreras) -> csr_matrix:
+    """
+    Matriz dispersa booleana rutas × barreras: True si la ruta cruza la barrera.
+
+    Un STRtree sobre las rutas y una sola consulta con todas las barreras
+    (preparadas) y predicate="crosses": los predicados corren en C, sin un
+    `.crosses` de Python por ruta. Las rutas None no cruzan nada.
+    """
+    rutas = np.asarray(rutas, dtype=object)
+    barreras = np.asarray(barreras, dtype=object)
+    shapely.prepare(barreras)
+    with metrics.timer("crosses"):
+        idx_barrera, idx_ruta = STRtree(rutas).query(barreras, predicate="crosses")
+    metrics.count("rutas_crosses", len(rutas))
+    datos = np.ones(len(idx_ruta), dtype=bool)
+    return csr_matrix((datos, (idx_ruta, idx_barrera)), shape=(len(rutas), len(barreras)))
+
+# ---------- Cruces a nivel arista ----------
+def edge_crossings(graph, barreras, tol=1e-9) -> np.ndarray:
+    """
+    Marca cada arista del CSRGraph que cruza cada barrera: array bool
+    (n_aristas × n_barreras), alineado con graph.indices. La arista es el
+    segmento recto entre sus nodos, igual que en la geometría de las rutas.
+
+    Un nodo sobre la barrera (a menos de `tol`, en unidades del grafo) cuenta para
+    la arista que llega a él y no para la que sale: un camino que la atraviesa
+    por ese nodo suma un cruce, como en `LineString.crosses` (difiere sólo si el
+    camino termina justo sobre la barrera).
+    """
+    n = len(graph)
+    origen = np.repeat(np.arange(n), np.diff(graph.indptr))
+    destino = np.asarray(graph.indices)
+    coords = np.stack([np.c_[graph.x[origen], graph.y[origen]],
+                       np.c_[graph.x[destino], graph.y[destino]]], axis=1)
+    flags = crossing_matrix(shapely.linestrings(coords), barreras).toarray()
+
+    barreras = np.asarray(barreras, dtype=object)
+    idx_barrera, idx_nodo = STRtree(shapely.points(graph.x, graph.y)).query(
+        barreras, predicate="dwithin", distance=tol)
+    sobre = np.zeros((n, len(barreras)), dtype=bool)
+    sobre[idx_nodo, idx_barrera] = True
+    flags |= sobre[destino] & ~sobre[origen]
+    return flags
+
+def _hash_barreras(lista_de_barreras) -> str:
+    h = hashlib.sha1()
+    for nombre, geom in lista_de_barreras:
+        h.update(str(nombre).encode())
+        h.update(shapely.to_wkb(geom))
+    return h.hexdigest()[:12]
+
+def load_or_build_edge_crossings(graph, lista_de_barreras) -> np.ndarray:
+    """
+    edge_crossings persistido junto al grafo en la caché (cruces_<hash>.npy,
+    con hash de nombres y geometrías de las barreras). Sin cache_dir se calcula.
+    """
+    if graph.cache_dir is None:
+        with metrics.timer("cruces_aristas"):
+            return edge_crossings(graph, [b for _, b in lista_de_barreras])
+    path = Path(graph.cache_dir) / f"cruces_{_hash_barreras(lista_de_barreras)}.npy"
+    if not path.exists():
+        with metrics.timer("cruces_aristas"):
+            np.save(path, edge_crossings(graph, [b for _, b in lista_de_barreras]))
+    return np.load(path, mmap_mode="r")
+
+def route_crossings(graph, caminos, flags) -> np.ndarray:
+    """
+    Cantidad de aristas que cruzan cada barrera a lo largo de cada camino
+    (posiciones de nodo, como las devuelve route_od): int (n_rutas × n_barreras).
+    Sin geometrías: se ubica cada par (u, v) consecutivo en el CSR y se suman
+    los flags de edge_crossings. Los caminos None quedan en 0.
+    """
+    n = len(graph)
+    flags = np.asarray(flags)
+    largos = np.array([0 if c is None else len(c) for c in caminos], dtype=np.int64)
+    cuenta = np.zeros((len(caminos), flags.shape[1]), dtype=np.int32)
+    if largos.sum() == 0:
+        return cuenta
+
+    nodos = np.concatenate([c for c in caminos if c is not None]).astype(np.int64)
+    ruta = np.repeat(np.arange(len(caminos)), largos)
+    paso = ruta[1:] == ruta[:-1]  # pares consecutivos dentro de la misma ruta
+    u, v, ruta = nodos[:-1][paso], nodos[1:][paso], ruta[1:][paso]
+
+    # Clave global fila*n + columna: en el CSR está ordenada (columnas ordenadas por fila)
+    claves = np.repeat(np.arange(n, dtype=np.int64), np.diff(graph.indptr)) * n + graph.indices
+    pos = np.searchsorted(claves, u * n + v)
+
+    np.add.at(cuenta, ruta, flags[pos].astype(np.int32))
+    return cuenta
+
+# ---------- Lado de la barrera ----------
+# Nombre de los sentidos de cruce (hacia el lado +1, hacia el lado -1) según el
+# eje dominante de la barrera: +1 es el norte en las zonales y el este en las meridionales
+SENTIDOS = {"zonal": ("sur_norte", "norte_sur"), "meridional": ("oeste_este", "este_oeste")}
+_REFERENCIA = {"zonal": np.array([1.0, 0.0]), "meridional": np.array([0.0, -1.0])}
+
+def barrier_axis(barrera) -> str:
+    """"zonal" si la barrera se extiende más de oeste a este que de sur a norte, si no "meridional"."""
+    x0, y0, x1, y1 = shapely.bounds(barrera)
+    return "zonal" if x1 - x0 >= y1 - y0 else "meridional"
+
+def direction_labels(barrera) -> tuple[str, str]:
+    """Sentidos de cruce (hacia el lado +1, hacia el lado -1) de side_of_line para esta barrera."""
+    return SENTIDOS[barrier_axis(barrera)]
+
+def _segmentos_orientados(barrera):
+    """
+    Segmentos (x0, y0, x1, y1) de la barrera con cada tramo (tras line_merge)
+    orientado según una única dirección de referencia por barrera: oeste → este
+    si es zonal, norte → sur si es meridional (ver barrier_axis). Así la
+    izquierda es el mismo lado (norte o este) en todos los tramos, aunque estén
+    separados o sean casi perpendiculares al eje. También retorna si cada
+    segmento sigue en el próximo (mismo tramo).
+    """
+    ref = _REFERENCIA[barrier_axis(barrera)]
+    normal = np.array([-ref[1], ref[0]])  # izquierda de la referencia
+    segmentos, sigue = [], []
+    for parte in shapely.get_parts(shapely.line_merge(barrera)):
+        xy = shapely.get_coordinates(parte)
+        avance = xy[-1] - xy[0]
+        if avance @ ref < 0 or (avance @ ref == 0 and avance @ normal < 0):
+            xy = xy[::-1]
+        seg = np.c_[xy[:-1], xy[1:]]
+        seg = seg[(seg[:, 0] != seg[:, 2]) | (seg[:, 1] != seg[:, 3])]  # sin segmentos de largo 0
+        segmentos.append(seg)
+        sigue.append(np.arange(len(seg)) < len(seg) - 1)
+    return np.concatenate(segmentos), np.concatenate(sigue)
+
+def side_of_line(barrera, lon, lat) -> np.ndarray:
+    """
+    Lado de cada punto respecto de la barrera: +1 a la izquierda del trazado
+    orientado (norte en barreras zonales, este en meridionales), -1 del otro
+    lado, 0 sobre la línea o si el punto no es finito. Una sola consulta
+    STRtree.query_nearest ubica el segmento más cercano de todos los puntos y el
+    lado es el signo del producto vectorial contra ese segmento; si lo más cercano
+    es un vértice, cuentan los dos segmentos que lo comparten (a la izquierda de
+    ambos si el trazado gira a la izquierda, de alguno si gira a la derecha).
+    Más allá de los extremos vale la prolongación del último segmento. Los
+    extremos OD se repiten mucho (paradas): se clasifica cada coordenada una vez.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    out = np.zeros(len(lon), dtype=np.int8)
+    finito = np.isfinite(lon) & np.isfinite(lat)
+    if not finito.any():
+        return out
+    unicos, inversa = np.unique(lon[finito] + 1j * lat[finito], return_inverse=True)
+    lon, lat = unicos.real, unicos.imag
+    seg, sigue = _segmentos_orientados(barrera)
+    lineas = shapely.linestrings(seg.reshape(-1, 2, 2))
+    with metrics.timer("lado_barrera"):
+        _, cercano = STRtree(lineas).query_nearest(shapely.points(lon, lat), all_matches=False)
+
+    x0, y0, x1, y1 = seg.T
+    dx, dy = x1 - x0, y1 - y0
+    t = ((lon - x0[cercano]) * dx[cercano] + (lat - y0[cercano]) * dy[cercano]) / \
+        (dx[cercano] ** 2 + dy[cercano] ** 2)
+    previo = np.r_[False, sigue[:-1]]
+    a = np.where((t <= 0) & previo[cercano], cercano - 1, cercano)
+    b = np.where((t >= 1) & sigue[cercano], cercano + 1, cercano)
+
+    def cruz(s):
+        return dx[s] * (lat - y0[s]) - dy[s] * (lon - x0[s])
+
+    giro = dx[a] * dy[b] - dy[a] * dx[b]
+    lado = np.where(giro > 0, np.minimum(cruz(a), cruz(b)), np.maximum(cruz(a), cruz(b)))
+    out[finito] = np.sign(lado).astype(np.int8)[inversa.ravel()]
+    return out
+
+def crossing_direction(barrera, lon_ini, lat_ini, lon_fin, lat_fin) -> np.ndarray:
+    """
+    Dirección del cruce según el lado de la barrera en que empieza y termina el
+    viaje, con los nombres de direction_labels: "sur_norte"/"norte_sur" en
+    barreras zonales, "oeste_este"/"este_oeste" en meridionales, o "mismo_lado"
+    (cruza y vuelve, o un extremo sobre la línea).
+    """
+    hacia_positivo, hacia_negativo = direction_labels(barrera)
+    lado = side_of_line(barrera, np.r_[lon_ini, lon_fin], np.r_[lat_ini, lat_fin])
+    ini, fin = lado[:len(lado) // 2], lado[len(lado) // 2:]
+    return np.select([(ini < 0) & (fin > 0), (ini > 0) & (fin < 0)], [hacia_positivo, hacia_negativo], "mismo_lado")
+
+def crossing_column(nombre_barrera) -> str:
+    return f"cruza_{nombre_barrera.lower().replace(' ', '_')}"
+
+def load_barriers(path) -> list:
+    """Barreras del GeoJSON como [(nombre, geometría)], una por 'Linea' si existe."""
+    import geopandas as gpd
+    gdf = gpd.read_file(path)
+    if "Linea" in gdf.columns:
+        return [(str(nombre), sub.union_all()) for nombre, sub in gdf.groupby("Linea")]
+    return [(f"barrera_{i}", geom) for i, geom in enumerate(gdf.geometry)]
+
+def load_line(path, nombre="sarmiento"):
+    """
+    Traza (unión de geometrías) de las líneas del GeoJSON cuya 'Linea' contiene
+    `nombre` (sin distinguir mayúsculas); si no hay ninguna, o el archivo no
+    trae 'Linea', la unión de todas, con un aviso.
+    """
+    import geopandas as gpd
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"No se encontró {path}. Corré scripts/01_download_shapes.sh")
+    gdf = gpd.read_file(path)
+    if "Linea" in gdf.columns:
+        sub = gdf[gdf["Linea"].str.contains(nombre, case=False, na=False)]
+        if not sub.empty:
+            return sub.union_all()
+    warnings.warn(f"No se encontró '{nombre}' en {path}: se usan todas las líneas")
+    return gdf.union_all()
+
+def annotate_crossings(df, graph, caminos, lista_de_barreras) -> pd.DataFrame:
+    """
+    Columnas de cruce sin armar geometrías: por barrera, cruces_<b> (aristas del
+    camino que la cruzan) y cruza_<b> (al menos una), más lat/lon_inicio_ruta y
+    lat/lon_fin_ruta para la dirección. Descarta las filas sin camino o de un solo
+    nodo (tampoco forman LineString en el modo con geometrías).
+    """
+    flags = load_or_build_edge_crossings(graph, lista_de_barreras)
+    ok = np.array([c is not None and len(c) > 1 for c in caminos], dtype=bool)
+    caminos = [c for c, k in zip(caminos, ok) if k]
+    with metrics.timer("cruces_rutas"):
+        cuenta = route_crossings(graph, caminos, flags)
+
+    out = df[ok].copy()
+    for k, (nombre, _) in enumerate(lista_de_barreras):
+        col = crossing_column(nombre)
+        out[col.replace("cruza_", "cruces_", 1)] = cuenta[:, k]
+        out[col] = cuenta[:, k] > 0
+    x, y = np.asarray(graph.x), np.asarray(graph.y)
+    ini = [c[0] for c in caminos]
+    fin = [c[-1] for c in caminos]
+    out["lat_inicio_ruta"] = y[ini] if caminos else []
+    out["lat_fin_ruta"] = y[fin] if caminos else []
+    out["lon_inicio_ruta"] = x[ini] if caminos else []
+    out["lon_fin_ruta"] = x[fin] if caminos else []
+    return out
@@ -0,0 +1,182 @@
+"""
+Estadística del Barrier Score sobre el ensamble de nulos: distribución bootstrap,
+intervalos por percentiles, z-score y p-valor empírico, por barrera y dirección.
+
+Todo trabaja con arrays de conteos (..., barrera, dirección) donde la última
+dimensión es (total, hacia el lado +1, hacia el lado -1) de la barrera: con
+nombres DIRECCIONES = (total, sur_norte, norte_sur) en las zonales y
+(total, oeste_este, este_oeste) en las meridionales (src.barriers.SENTIDOS):
+  - el modelo real como patrones únicos de cruce por unidad (tarjeta) y barrera,
+    con su frecuencia: remuestrear tarjetas con reposición equivale a un
+    multinomial sobre los patrones, así cada réplica bootstrap es un producto
+    (pesos × patrones) sin copiar filas ni DataFrames;
+  - las K réplicas nulas como un array (K, barrera, dirección); sus K valores son
+    la distribución de permutación (recableo) para z-score y p-valor.
+
+El BS es el de src.barriers.barrier_score: (esperado - observado) / esperado,
+con esperado = cruces de los nulos; es la misma definición de los JSON de
+scripts/50_compute_bs.py (allí con cada réplica nula como esperado).
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from src.barriers import SENTIDOS
+
+DIRECCIONES = ("total", *SENTIDOS["zonal"])
+# posición en la última dimensión de cada sentido de cruce, zonal o meridional
+_POSICION = {nombre: k + 1 for sentidos in SENTIDOS.values() for k, nombre in enumerate(sentidos)}
+
+
+def _codigos(valores, categorias):
+    """Posición de cada valor en `categorias` (-1 si no está)."""
+    return pd.Index(list(categorias)).get_indexer(np.asarray(valores, dtype=object))
+
+def _direcciones(valores):
+    """Posición de cada dirección de cruce (1 o 2; 0 si no tiene sentido, p. ej. mismo_lado)."""
+    return pd.Series(np.asarray(valores, dtype=object)).map(_POSICION).fillna(0).to_numpy(dtype=np.int64)
+
+def _conteos_por_fila(tabla, nombres_barreras, n_filas, columna_direccion):
+    """Matriz dispersa filas × (barrera·dirección) con la cantidad de cruces."""
+    b = _codigos(tabla["barrera"], nombres_barreras)
+    d = _direcciones(tabla[columna_direccion])
+    fila = tabla["ruta_id"].to_numpy()
+    ok = b >= 0
+    filas = np.r_[fila[ok], fila[ok & (d > 0)]]
+    cols = np.r_[b[ok] * 3, b[ok & (d > 0)] * 3 + d[ok & (d > 0)]]
+    return csr_matrix((np.ones(len(filas), dtype=np.int64), (filas, cols)),
+                      shape=(n_filas, 3 * len(nombres_barreras)))
+
+def patrones_observados(tabla_real, nombres_barreras, n_filas, grupos=None, columna_direccion="direccion"):
+    """
+    Patrones únicos de cruce (total, hacia +1, hacia -1) del modelo real, por
+    barrera, y cuántas unidades tienen cada uno.
+
+    `grupos` asigna cada fila de rutas a su unidad de remuestreo (p. ej. id_tarjeta);
+    por default cada ruta es una unidad. Las unidades sin cruces forman el patrón
+    (0, 0, 0). Retorna una lista alineada con nombres_barreras de
+    (patrones (P_b, 3), frecuencias (P_b,)).
+    """
+    X = _conteos_por_fila(tabla_real, nombres_barreras, n_filas, columna_direccion)
+    if grupos is not None:
+        codigos, unicos = pd.factorize(pd.Series(grupos), sort=False)
+        agrupar = csr_matrix((np.ones(n_filas, dtype=np.int64), (codigos, np.arange(n_filas))),
+                             shape=(len(unicos), n_filas))
+        X = agrupar @ X
+    X = X.tocsc()
+    n_unidades = X.shape[0]
+
+    salida = []
+    for b in range(len(nombres_barreras)):
+        cols = X[:, 3 * b:3 * b + 3].tocsr()
+        filas = np.flatnonzero(np.diff(cols.indptr))
+        densos = cols[filas].toarray()
+        # clave entera por patrón: np.unique 1-D en lugar de axis=0
+        base = int(densos.max(initial=0)) + 1
+        clave = (densos[:, 0] * base + densos[:, 1]) * base + densos[:, 2]
+        _, primera, frecuencias = np.unique(clave, return_index=True, return_counts=True)
+        patrones = densos[primera]
+        sin_cruces = n_unidades - len(filas)
+        if sin_cruces:
+            patrones = np.vstack([np.zeros((1, 3), np.int64), patrones])
+            frecuencias = np.r_[sin_cruces, frecuencias]
+        salida.append((patrones, frecuencias))
+    return salida
+
+def observados(patrones):
+    """Cruces reales (barrera, dirección) a partir de patrones_observados."""
+    return np.array([f @ p for p, f in patrones]).reshape(len(patrones), 3)
+
+def conteos_nulos(tabla, modelos_nulos, nombres_barreras, columna_direccion="direccion"):
+    """Cruces de cada réplica nula: array (K, barrera, dirección)."""
+    out = np.zeros((len(modelos_nulos), len(nombres_barreras), 3), dtype=np.int64)
+    sub = tabla[tabla["modelo"].isin(list(modelos_nulos))]
+    m = _codigos(sub["modelo"], modelos_nulos)
+    b = _codigos(sub["barrera"], nombres_barreras)
+    d = _direcciones(sub[columna_direccion])
+    ok = b >= 0
+    np.add.at(out, (m[ok], b[ok], 0), 1)
+    ok &= d > 0
+    np.add.at(out, (m[ok], b[ok], d[ok]), 1)
+    return out
+
+def barrier_score_vec(observado, esperado):
+    """barrier_score sobre arrays (NaN donde esperado <= 0)."""
+    observado = np.asarray(observado, dtype=float)
+    esperado = np.asarray(esperado, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(esperado > 0, (esperado - observado) / np.where(esperado > 0, esperado, 1), np.nan)
+
+def bootstrap_bs(patrones, nulos, n_boot=10_000, seed=None, bloque=1000):
+    """
+    Distribución bootstrap del BS: (n_boot, barrera, dirección).
+
+    En cada réplica se remuestrean las unidades reales (multinomial sobre los
+    patrones de cada barrera: las tres direcciones de una barrera salen del mismo
+    remuestreo, las barreras entre sí son independientes) y las K réplicas nulas
+    (multinomial sobre réplicas, esperado = media remuestreada, común a todas).
+    Se procesa en bloques de `bloque` réplicas para acotar la memoria de los pesos.
+    """
+    rng = np.random.default_rng(seed)
+    K, B = nulos.shape[:2]
+    N = nulos.reshape(K, -1).astype(float)
+
+    out = np.empty((n_boot, B, 3))
+    for ini in range(0, n_boot, bloque):
+        r = min(bloque, n_boot - ini)
+        obs = np.empty((r, B, 3))
+        for b, (p, f) in enumerate(patrones):
+            n = int(f.sum())
+            obs[:, b] = rng.multinomial(n, f / n, size=r) @ p
+        esp = (rng.multinomial(K, np.full(K, 1 / K), size=r) @ N / K).reshape(r, B, 3)
+        out[ini:ini + r] = barrier_score_vec(obs, esp)
+    return out
+
+def estadisticas_bs(patrones, nulos, nombres_barreras, n_boot=10_000, alpha=0.05, seed=None, sentidos=None):
+    """
+    Resumen por barrera y dirección: cruces reales, esperado (media de nulos) y su
+    desvío, BS puntual, IC bootstrap por percentiles (1 - alpha), z-score de los
+    cruces reales frente a los nulos y p-valor empírico de permutación (una cola:
+    proporción de nulos con tan pocos cruces como el real, (1 + #{nulo <= real}) / (K + 1)).
+    `sentidos` nombra las direcciones de cada barrera (src.barriers.direction_labels,
+    alineado con nombres_barreras); por default las de DIRECCIONES.
+    """
+    observado = observados(patrones)
+    K = len(nulos)
+    esperado = nulos.mean(axis=0)
+    desvio = nulos.std(axis=0, ddof=1) if K > 1 else np.full(esperado.shape, np.nan)
+    bs = barrier_score_vec(observado, esperado)
+
+    dist = bootstrap_bs(patrones, nulos, n_boot=n_boot, seed=seed) if n_boot else None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(desvio > 0, (observado - esperado) / np.where(desvio > 0, desvio, 1), np.nan)
+    p = (1 + (nulos <= observado).sum(axis=0)) / (K + 1)
+
+    if dist is not None:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # barreras sin esperado: todo NaN
+            ci_inf, ci_sup = np.nanpercentile(dist, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    else:
+        ci_inf = ci_sup = np.full(bs.shape, np.nan)
+
+    nombres_dir = np.array([("total", *(sentidos[b] if sentidos else DIRECCIONES[1:]))
+                            for b in range(len(nombres_barreras))], dtype=object).reshape(-1, 3)
+    barrera, direccion = np.meshgrid(np.arange(len(nombres_barreras)), np.arange(3), indexing="ij")
+    return pd.DataFrame({
+        "barrera": np.asarray(nombres_barreras, dtype=object)[barrera.ravel()],
+        "direccion": nombres_dir[barrera.ravel(), direccion.ravel()],
+        "cruces_reales": observado.ravel().astype(np.int64),
+        "esperado": esperado.ravel(),
+        "desvio_nulo": desvio.ravel(),
+        "barrier_score": bs.ravel(),
+        "ci_inf": ci_inf.ravel(),
+        "ci_sup": ci_sup.ravel(),
+        "z": z.ravel(),
+        "p_valor": p.ravel(),
+        "n_nulos": K,
+        "n_boot": n_boot,
+    })
+
@@ -0,0 +1,529 @@
+"""
+Contraction hierarchy (CH) sobre un CSRGraph, para muchas consultas punto a
+punto sobre el mismo grafo fijo (observado + cientos de réplicas nulas).
+
+Preproceso (una vez por grafo): se contraen los nodos de a uno en orden de
+importancia (2 × atajos que agregaría - aristas que saca + vecinos ya
+contraídos, con actualización perezosa). Al contraer v, cada par u → v → x sin un camino testigo igual o más
+corto que evite v recibe un atajo u → x que recuerda a v como nodo medio. La
+búsqueda de testigos es un Dijkstra local acotado en nodos asentados: cortarla
+antes sólo agrega atajos de más, nunca rompe la exactitud.
+
+Consulta: Dijkstra bidireccional que sólo sube de rango (hacia adelante desde
+el origen por `subida`, hacia atrás desde el destino por `bajada`), con
+stall-on-demand; el camino se desempaqueta reemplazando cada atajo por sus dos
+mitades.
+
+Contracción y consultas están compiladas con numba sobre arrays (etiquetas de
+tamaño n que se limpian sólo en los nodos tocados); route_many resuelve todo
+el lote en una llamada. Frente al Dijkstra agrupado por origen de route_od
+gana cuando hay pocos pares por origen (ver la etapa `ch` de
+benchmarks/bench_pipeline.py).
+
+Se persiste como arrays .npy en <directorio del grafo>/ch/ (ver graph_store);
+sin caché en disco se arma en memoria.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from numba import njit, objmode
+except ImportError as e:
+    raise ImportError("src.ch requiere numba para las consultas compiladas (pip install numba)") from e
+
+from src import metrics
+
+ARRAYS = ["rango", "sub_indptr", "sub_indices", "sub_pesos", "sub_medio",
+          "baj_indptr", "baj_indices", "baj_pesos", "baj_medio"]
+LIMITE_TESTIGOS = 60
+
+
+def _csr(filas, columnas, pesos, medio, n):
+    """Aristas (fila, columna) → arrays CSR con las columnas ordenadas dentro de cada fila."""
+    orden = np.lexsort((columnas, filas))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=n), out=indptr[1:])
+    return indptr, columnas[orden].astype(np.int32), pesos[orden].astype(float), medio[orden].astype(np.int32)
+
+
+def build_ch(graph, limite_testigos=LIMITE_TESTIGOS) -> "ContractionHierarchy":
+    """Contrae todos los nodos de `graph` (CSRGraph) y arma la jerarquía."""
+    n = len(graph)
+    u = np.repeat(np.arange(n), np.diff(graph.indptr))
+    v = np.asarray(graph.indices, dtype=np.int64)
+    w = np.asarray(graph.weights, dtype=float)
+    # una arista por par (la más corta), sin lazos
+    orden = np.lexsort((w, v, u))
+    u, v, w = u[orden], v[orden], w[orden]
+    unica = (u != v) & np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+    rango, aristas, pesos, estado = _contraer(n, u[unica], v[unica], w[unica], limite_testigos)
+    de, a, medio = aristas[:, 0], aristas[:, 1], aristas[:, 2]
+    sube, baja = estado == _SUBE, estado == _BAJA
+    return ContractionHierarchy(rango, *_csr(de[sube], a[sube], pesos[sube], medio[sube], n),
+                                *_csr(a[baja], de[baja], pesos[baja], medio[baja], n))
+
+
+# ---------- Contracción compilada ----------
+# aristas en un pool con listas enlazadas por nodo (columnas de `aristas`:
+# origen, destino, medio, siguiente saliente, siguiente entrante); una arista
+# deja de estar viva cuando se contrae su primer extremo, y queda en la
+# subida (origen contraído antes) o en la bajada (destino contraído antes)
+_VIVA, _SUBE, _BAJA = 0, 1, 2
+
+
+@njit(cache=True)
+def _crecer(aristas, pesos, estado):
+    cap = 2 * len(pesos)
+    nuevas = np.empty((cap, 5), dtype=np.int64)
+    nuevas[:len(pesos)] = aristas
+    nuevos = np.empty(cap)
+    nuevos[:len(pesos)] = pesos
+    nuevo_estado = np.empty(cap, dtype=np.int8)
+    nuevo_estado[:len(pesos)] = estado
+    return nuevas, nuevos, nuevo_estado
+
+
+@njit(cache=True)
+def _atajos(v, aristas, pesos, estado, cab_sal, cab_ent, limite_testigos,
+            dist, tocados, objetivo, claves, nodos, nuevos, costos):
+    """
+    Atajos a → x necesarios al contraer v (en `nuevos`/`costos`, retorna cuántos):
+    los pares a → v → x sin testigo igual o más corto que evite v.
+    """
+    n_nuevos = 0
+    e1 = cab_ent[v]
+    while e1 >= 0:
+        if estado[e1] == _VIVA:
+            a = aristas[e1, 0]
+            limite = -1.0
+            n_obj = 0
+            e2 = cab_sal[v]
+            while e2 >= 0:
+                if estado[e2] == _VIVA and aristas[e2, 1] != a:
+                    limite = max(limite, pesos[e1] + pesos[e2])
+                    objetivo[aristas[e2, 1]] = True
+                    n_obj += 1
+                e2 = aristas[e2, 3]
+            if n_obj:
+                # Dijkstra local desde a sin pasar por v, acotado en asentados
+                dist[a] = 0.0
+                tocados[0] = a
+                n_toc = 1
+                claves[0] = 0.0
+                nodos[0] = a
+                n_cola = 1
+                asentados = 0
+                while n_cola and n_obj and asentados < limite_testigos:
+                    d, x, n_cola = _pop(claves, nodos, n_cola)
+                    if d > dist[x]:
+                        continue
+                    if d > limite:
+                        break
+                    if objetivo[x]:
+                        objetivo[x] = False
+                        n_obj -= 1
+                    asentados += 1
+                    e = cab_sal[x]
+                    while e >= 0:
+                        y = aristas[e, 1]
+                        nd = d + pesos[e]
+                        if estado[e] == _VIVA and y != v and nd < dist[y]:
+                            if dist[y] == np.inf:
+                                tocados[n_toc] = y
+                                n_toc += 1
+                            dist[y] = nd
+                            n_cola = _push(claves, nodos, n_cola, nd, y)
+                        e = aristas[e, 3]
+                e2 = cab_sal[v]
+                while e2 >= 0:
+                    x = aristas[e2, 1]
+                    if estado[e2] == _VIVA and x != a:
+                        objetivo[x] = False
+                        c = pesos[e1] + pesos[e2]
+                        if dist[x] > c:
+                            if n_nuevos == len(costos):
+                                nuevos = np.concatenate((nuevos, nuevos))
+                                costos = np.concatenate((costos, costos))
+                            nuevos[n_nuevos, 0] = a
+                            nuevos[n_nuevos, 1] = x
+                            costos[n_nuevos] = c
+                            n_nuevos += 1
+                    e2 = aristas[e2, 3]
+                for j in range(n_toc):
+                    dist[tocados[j]] = np.inf
+        e1 = aristas[e1, 4]
+    return n_nuevos, nuevos, costos
+
+
+@njit(cache=True)
+def _contraer(n, u, v, w, limite_testigos):
+    """
+    Contracción perezosa de los n nodos (prioridad: 2 × atajos - aristas que
+    saca + vecinos ya contraídos; empates por id). Retorna (rango, aristas,
+    pesos, estado) del pool final.
+    """
+    m = len(u)
+    cap = max(2 * m, 16)
+    aristas = np.empty((cap, 5), dtype=np.int64)
+    pesos = np.empty(cap)
+    estado = np.empty(cap, dtype=np.int8)
+    cab_sal = np.full(n, -1, dtype=np.int64)
+    cab_ent = np.full(n, -1, dtype=np.int64)
+    grado = np.zeros(n, dtype=np.int64)          # aristas vivas (entrada + salida)
+    for e in range(m):
+        aristas[e, 0], aristas[e, 1], aristas[e, 2] = u[e], v[e], -1
+        aristas[e, 3], cab_sal[u[e]] = cab_sal[u[e]], e
+        aristas[e, 4], cab_ent[v[e]] = cab_ent[v[e]], e
+        pesos[e] = w[e]
+        estado[e] = _VIVA
+        grado[u[e]] += 1
+        grado[v[e]] += 1
+    n_e = m
+
+    dist = np.full(n, np.inf)
+    tocados = np.empty(n, dtype=np.int64)
+    objetivo = np.zeros(n, dtype=np.bool_)
+    claves = np.empty(cap + 1)
+    nodos = np.empty(cap + 1, dtype=np.int64)
+    nuevos = np.empty((64, 2), dtype=np.int64)
+    costos = np.empty(64)
+    vecinos_contraidos = np.zeros(n, dtype=np.int64)
+
+    # prioridad + id/(n+1): a igual prioridad sale primero el id menor
+    cola_p = np.empty(n)
+    cola_v = np.empty(n, dtype=np.int64)
+    n_cola = 0
+    for x in range(n):
+        k, nuevos, costos = _atajos(x, aristas, pesos, estado, cab_sal, cab_ent, limite_testigos,
+                                    dist, tocados, objetivo, claves, nodos, nuevos, costos)
+        n_cola = _push(cola_p, cola_v, n_cola, 2 * k - grado[x] + x / (n + 1), x)
+
+    rango = np.empty(n, dtype=np.int32)
+    nivel = 0
+    while n_cola:
+        _, x, n_cola = _pop(cola_p, cola_v, n_cola)
+        k, nuevos, costos = _atajos(x, aristas, pesos, estado, cab_sal, cab_ent, limite_testigos,
+                                    dist, tocados, objetivo, claves, nodos, nuevos, costos)
+        p = 2 * k - grado[x] + vecinos_contraidos[x] + x / (n + 1)
+        if n_cola and p > cola_p[0]:  # prioridad vieja: vuelve a la cola
+            n_cola = _push(cola_p, cola_v, n_cola, p, x)
+            continue
+        rango[x] = nivel
+        nivel += 1
+        e = cab_sal[x]
+        while e >= 0:
+            if estado[e] == _VIVA:
+                estado[e] = _SUBE
+                grado[aristas[e, 1]] -= 1
+                vecinos_contraidos[aristas[e, 1]] += 1
+            e = aristas[e, 3]
+        e = cab_ent[x]
+        while e >= 0:
+            if estado[e] == _VIVA:
+                estado[e] = _BAJA
+                grado[aristas[e, 0]] -= 1
+                vecinos_contraidos[aristas[e, 0]] += 1
+            e = aristas[e, 4]
+        for j in range(k):
+            a, b, c = nuevos[j, 0], nuevos[j, 1], costos[j]
+            e = cab_sal[a]
+            while e >= 0 and not (estado[e] == _VIVA and aristas[e, 1] == b):
+                e = aristas[e, 3]
+            if e >= 0:
+                if c < pesos[e]:
+                    pesos[e] = c
+                    aristas[e, 2] = x
+                continue
+            if n_e == len(pesos):
+                aristas, pesos, estado = _crecer(aristas, pesos, estado)
+                claves = np.empty(len(pesos) + 1)
+                nodos = np.empty(len(pesos) + 1, dtype=np.int64)
+            aristas[n_e, 0], aristas[n_e, 1], aristas[n_e, 2] = a, b, x
+            aristas[n_e, 3], cab_sal[a] = cab_sal[a], n_e
+            aristas[n_e, 4], cab_ent[b] = cab_ent[b], n_e
+            pesos[n_e] = c
+            estado[n_e] = _VIVA
+            grado[a] += 1
+            grado[b] += 1
+            n_e += 1
+    return rango, aristas[:n_e], pesos[:n_e], estado[:n_e]
+
+
+# ---------- Consultas compiladas ----------
+@njit(cache=True)
+def _push(claves, nodos, n, clave, nodo):
+    i = n
+    claves[i] = clave
+    nodos[i] = nodo
+    while i > 0:
+        p = (i - 1) >> 1
+        if claves[p] <= claves[i]:
+            break
+        claves[p], claves[i] = claves[i], claves[p]
+        nodos[p], nodos[i] = nodos[i], nodos[p]
+        i = p
+    return n + 1
+
+
+@njit(cache=True)
+def _pop(claves, nodos, n):
+    clave, nodo = claves[0], nodos[0]
+    n -= 1
+    claves[0] = claves[n]
+    nodos[0] = nodos[n]
+    i = 0
+    while True:
+        h = 2 * i + 1
+        if h >= n:
+            break
+        if h + 1 < n and claves[h + 1] < claves[h]:
+            h += 1
+        if claves[i] <= claves[h]:
+            break
+        claves[h], claves[i] = claves[i], claves[h]
+        nodos[h], nodos[i] = nodos[i], nodos[h]
+        i = h
+    return clave, nodo, n
+
+
+@njit(cache=True)
+def _buscar(s, t, s_ip, s_ix, s_w, b_ip, b_ix, b_w, dist, pred, tocados, claves, nodos):
+    """
+    Búsqueda bidireccional hacia arriba con stall-on-demand. Deja en `pred` los
+    árboles de ambos lados; retorna (distancia, encuentro, tocados por lado).
+    """
+    dist[0, s] = 0.0
+    dist[1, t] = 0.0
+    pred[0, s] = -1
+    pred[1, t] = -1
+    tocados[0, 0] = s
+    tocados[1, 0] = t
+    n_toc = np.ones(2, dtype=np.int64)
+    n_cola = np.ones(2, dtype=np.int64)
+    claves[0, 0] = claves[1, 0] = 0.0
+    nodos[0, 0] = s
+    nodos[1, 0] = t
+    mejor, encuentro = (0.0, s) if s == t else (np.inf, -1)
+
+    while True:
+        activo0 = n_cola[0] > 0 and claves[0, 0] < mejor
+        activo1 = n_cola[1] > 0 and claves[1, 0] < mejor
+        if not activo0 and not activo1:
+            break
+        lado = 0 if activo0 and (not activo1 or claves[0, 0] <= claves[1, 0]) else 1
+        d, v, n_cola[lado] = _pop(claves[lado], nodos[lado], n_cola[lado])
+        if d > dist[lado, v]:
+            continue
+        if d + dist[1 - lado, v] < mejor:
+            mejor = d + dist[1 - lado, v]
+            encuentro = v
+        if lado == 0:
+            ip, ix, w, ip_o, ix_o, w_o = s_ip, s_ix, s_w, b_ip, b_ix, b_w
+        else:
+            ip, ix, w, ip_o, ix_o, w_o = b_ip, b_ix, b_w, s_ip, s_ix, s_w
+        # stall-on-demand: si se llega a v más corto bajando desde un nodo más
+        # alto ya alcanzado, d no es su distancia y no se expande
+        frenado = False
+        for e in range(ip_o[v], ip_o[v + 1]):
+            if dist[lado, ix_o[e]] + w_o[e] < d:
+                frenado = True
+                break
+        if frenado:
+            continue
+        for e in range(ip[v], ip[v + 1]):
+            x = ix[e]
+            nd = d + w[e]
+            if nd < dist[lado, x]:
+                if dist[lado, x] == np.inf:
+                    tocados[lado, n_toc[lado]] = x
+                    n_toc[lado] += 1
+                dist[lado, x] = nd
+                pred[lado, x] = v
+                n_cola[lado] = _push(claves[lado], nodos[lado], n_cola[lado], nd, x)
+    return mejor, encuentro, n_toc
+
+
+@njit(cache=True)
+def _medio(a, b, rango, s_ip, s_ix, s_m, b_ip, b_ix, b_m):
+    """Nodo medio de la arista a → b de la jerarquía (-1 si es original)."""
+    if rango[b] > rango[a]:
+        ini, fin = s_ip[a], s_ip[a + 1]
+        return s_m[ini + np.searchsorted(s_ix[ini:fin], b)]
+    ini, fin = b_ip[b], b_ip[b + 1]
+    return b_m[ini + np.searchsorted(b_ix[ini:fin], a)]
+
+
+@njit(cache=True)
+def _agregar(buf, n, valor):
+    if n == len(buf):
+        nuevo = np.empty(2 * len(buf), dtype=buf.dtype)
+        nuevo[:n] = buf
+        buf = nuevo
+    buf[n] = valor
+    return buf, n + 1
+
+
+@njit(cache=True)
+def _consultas(origenes, destinos, con_caminos, medir, rango, s_ip, s_ix, s_w, s_m, b_ip, b_ix, b_w, b_m,
+               dist, pred, tocados, claves, nodos):
+    """
+    Todas las consultas de un lote en una llamada: (distancias, caminos planos,
+    largos, latencias). Los caminos se desempaquetan a aristas originales; largo
+    0 = sin camino. Con `medir`, latencias trae los segundos de cada consulta
+    (reloj leído en modo objeto, ~1 µs por consulta); si no, está vacío.
+    """
+    m = len(origenes)
+    latencias = np.zeros(m if medir else 0)
+    t0 = 0.0
+    distancias = np.full(m, np.inf)
+    largos = np.zeros(m, dtype=np.int64)
+    plano = np.empty(1024 if con_caminos else 0, dtype=np.int64)
+    n_plano = 0
+    cadena = np.empty(len(rango), dtype=np.int64)
+    pila = np.empty((2 * len(rango) + 2, 2), dtype=np.int64)
+    for k in range(m):
+        if medir:
+            with objmode(t0="float64"):
+                t0 = time.perf_counter()
+        s, t = origenes[k], destinos[k]
+        mejor, encuentro, n_toc = _buscar(s, t, s_ip, s_ix, s_w, b_ip, b_ix, b_w, dist, pred, tocados, claves, nodos)
+        distancias[k] = mejor
+        if con_caminos and encuentro >= 0:
+            # nodos de la jerarquía: s … encuentro … t
+            n_cad = 0
+            v = encuentro
+            while v >= 0:
+                cadena[n_cad] = v
+                n_cad += 1
+                v = pred[0, v]
+            cadena[:n_cad] = cadena[:n_cad][::-1].copy()
+            v = pred[1, encuentro]
+            while v >= 0:
+                cadena[n_cad] = v
+                n_cad += 1
+                v = pred[1, v]
+            inicio = n_plano
+            plano, n_plano = _agregar(plano, n_plano, cadena[0])
+            for j in range(n_cad - 1):
+                pila[0, 0], pila[0, 1] = cadena[j], cadena[j + 1]
+                n_pila = 1
+                while n_pila:
+                    n_pila -= 1
+                    a, b = pila[n_pila, 0], pila[n_pila, 1]
+                    medio = _medio(a, b, rango, s_ip, s_ix, s_m, b_ip, b_ix, b_m)
+                    if medio < 0:
+                        plano, n_plano = _agregar(plano, n_plano, b)
+                    else:
+                        pila[n_pila, 0], pila[n_pila, 1] = medio, b
+                        pila[n_pila + 1, 0], pila[n_pila + 1, 1] = a, medio
+                        n_pila += 2
+            largos[k] = n_plano - inicio
+        for lado in range(2):
+            for j in range(n_toc[lado]):
+                dist[lado, tocados[lado, j]] = np.inf
+        if medir:
+            with objmode(t1="float64"):
+                t1 = time.perf_counter()
+            latencias[k] = t1 - t0
+    return distancias, plano[:n_plano], largos, latencias
+
+
+class ContractionHierarchy:
+    """
+    Jerarquía lista para consultar. Los nodos son posiciones del CSRGraph.
+
+    `subida` (fila u): aristas u → v con rango[v] > rango[u];
+    `bajada` (fila v): aristas u → v con rango[u] > rango[v], guardadas por v.
+    `medio` es el nodo contraído de cada atajo (-1 en las aristas originales).
+    """
+
+    def __init__(self, rango, sub_indptr, sub_indices, sub_pesos, sub_medio,
+                 baj_indptr, baj_indices, baj_pesos, baj_medio):
+        self.rango = np.asarray(rango)
+        self.subida = tuple(np.asarray(a) for a in (sub_indptr, sub_indices, sub_pesos, sub_medio))
+        self.bajada = tuple(np.asarray(a) for a in (baj_indptr, baj_indices, baj_pesos, baj_medio))
+        self._trabajo = None
+
+    def __len__(self):
+        return len(self.rango)
+
+    @property
+    def n_atajos(self) -> int:
+        return int((self.subida[3] >= 0).sum() + (self.bajada[3] >= 0).sum())
+
+    # ---------- Consultas ----------
+    def _espacio(self):
+        """Etiquetas y colas de trabajo (arrays de tamaño n, reutilizados entre lotes)."""
+        if self._trabajo is None:
+            n = len(self)
+            cap = len(self.subida[1]) + len(self.bajada[1]) + 2
+            self._trabajo = (np.full((2, n), np.inf), np.full((2, n), -1, dtype=np.int32),
+                             np.empty((2, n), dtype=np.int32), np.empty((2, cap)), np.empty((2, cap), dtype=np.int32))
+        return self._trabajo
+
+    def _lote(self, origenes, destinos, caminos):
+        origenes = np.ascontiguousarray(origenes, dtype=np.int64)
+        destinos = np.ascontiguousarray(destinos, dtype=np.int64)
+        medir = metrics.activo()
+        distancias, plano, largos, latencias = _consultas(origenes, destinos, caminos, medir, self.rango,
+                                                          *self.subida, *self.bajada, *self._espacio())
+        if medir:
+            metrics.observe("latencia_ruta_s", latencias)
+        return distancias, plano, largos
+
+    def route_many(self, origenes, destinos):
+        """Como route_od: (caminos, distancias) alineados con la entrada, en un solo lote compilado."""
+        distancias, plano, largos = self._lote(origenes, destinos, True)
+        partes = np.split(plano, np.cumsum(largos)[:-1]) if len(largos) else []
+        caminos = [c if len(c) else None for c in partes]
+        metrics.count("rutas", len(caminos))
+        return caminos, distancias
+
+    def distance_many(self, origenes, destinos) -> np.ndarray:
+        return self._lote(origenes, destinos, False)[0]
+
+    def route(self, s, t):
+        """Camino mínimo (posiciones, desempaquetado a aristas originales) y longitud; (None, inf) si no hay."""
+        (camino,), (largo,) = self.route_many([s], [t])
+        return camino, largo
+
+    def distance(self, s, t) -> float:
+        return float(self.distance_many([s], [t])[0])
+
+    # ---------- Persistencia ----------
+    def save(self, path, meta=None):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for nombre, arr in zip(ARRAYS, (self.rango, *self.subida, *self.bajada)):
+            np.save(path / f"{nombre}.npy", arr)
+        meta = dict(meta or {}, n_nodos=len(self), n_atajos=self.n_atajos)
+        (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, mmap=True) -> "ContractionHierarchy":
+        path = Path(path)
+        return cls(*(np.load(path / f"{n}.npy", mmap_mode="r" if mmap else None) for n in ARRAYS))
+
+
+def load_or_build_ch(graph, limite_testigos=LIMITE_TESTIGOS) -> ContractionHierarchy:
+    """
+    CH del grafo desde <cache_dir>/ch/ si está (y es de este grafo), si no la
+    construye y la guarda ahí. Sin cache_dir se construye en memoria.
+    """
+    if graph.cache_dir is None:
+        with metrics.timer("ch_construir"):
+            return build_ch(graph, limite_testigos)
+    path = Path(graph.cache_dir) / "ch"
+    fp = graph.meta.get("fingerprint")
+    meta_path = path / "meta.json"
+    if meta_path.exists() and json.loads(meta_path.read_text(encoding="utf-8")).get("fingerprint") == fp:
+        with metrics.timer("ch_cargar"):
+            return ContractionHierarchy.load(path)
+    with metrics.timer("ch_construir"):
+        ch = build_ch(graph, limite_testigos)
+    ch.save(path, {"fingerprint": fp, "limite_testigos": limite_testigos})
+    return ch
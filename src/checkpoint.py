@@ -0,0 +1,109 @@
+"""
+Checkpoints de ruteo: cada bloque terminado se escribe como un archivo Parquet
+nuevo (part-NNNNN.parquet) y se anota en manifest.jsonl con los od_id que
+cubre (incluidos los que fallaron), así nada se reescribe y una corrida cortada
+se retoma salteando esos pares. Al final `compact` une las partes en la salida.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from src import metrics
+from src.io_utils import load_routes, save_routes
+
+DEFAULT_CHECKPOINT_DIR = Path("data/interim/checkpoints")
+
+
+def content_key(df, columnas=("od_id", "nodo_origen", "nodo_destino")) -> str:
+    """Hash de `columnas` fila por fila (en orden): identifica la entrada de un checkpoint."""
+    filas = pd.util.hash_pandas_object(df[list(columnas)], index=False).to_numpy()
+    return hashlib.sha1(filas.tobytes()).hexdigest()[:16]
+
+
+class CheckpointWriter:
+
+    def __init__(self, directorio, entrada=None, resume=False):
+        """
+        `entrada` identifica el insumo (p. ej. ruta + content_key de los pares); al
+        retomar debe coincidir con la del manifest, si no los od_id no son los mismos.
+        """
+        self.dir = Path(directorio)
+        self.manifest = self.dir / "manifest.jsonl"
+        self.entrada = entrada
+        if not resume and self.dir.exists():
+            shutil.rmtree(self.dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self.partes, self._hechos = [], set()
+        con_entrada = False
+        if self.manifest.exists():
+            datos = self.manifest.read_bytes()
+            fin = datos.rfind(b"\n") + 1
+            for linea in datos[:fin].decode("utf-8").splitlines():
+                reg = json.loads(linea)
+                if "entrada" in reg:
+                    if entrada is not None and reg["entrada"] != entrada:
+                        raise ValueError(f"El checkpoint en {self.dir} es de otra entrada: {reg['entrada']}")
+                    con_entrada = True
+                    continue
+                self.partes.append(reg["parte"])
+                self._hechos.update(reg["od_ids"])
+            if fin < len(datos):
+                self._descartar_incompleta(fin)
+        if not con_entrada:
+            self._anotar({"entrada": entrada})
+
+    def _descartar_incompleta(self, fin):
+        """
+        Última línea del manifest a medias (corte mientras se anotaba): se trunca y
+        se borra la parte que iba a registrar (ya escrita, ver write); sus od_id
+        no cuentan como hechos y se vuelven a rutear.
+        """
+        with open(self.manifest, "r+b") as f:
+            f.truncate(fin)
+            f.flush()
+            os.fsync(f.fileno())
+        (self.dir / self._nombre_parte()).unlink(missing_ok=True)
+
+    def _nombre_parte(self):
+        return f"part-{len(self.partes):05d}.parquet"
+
+    def _anotar(self, registro):
+        with open(self.manifest, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def completados(self) -> set:
+        """od_id ya procesados en corridas anteriores."""
+        return set(self._hechos)
+
+    def write(self, df, od_ids):
+        """Escribe un bloque (sus rutas y todos los od_id intentados) como parte nueva."""
+        parte = self._nombre_parte()
+        if len(df):
+            tmp = self.dir / f".{parte}.tmp"
+            with metrics.timer("checkpoint"):
+                save_routes(df, tmp)
+            tmp.replace(self.dir / parte)  # la parte existe completa antes de anotarla
+        od_ids = [int(i) for i in od_ids]
+        self._anotar({"parte": parte if len(df) else None, "od_ids": od_ids})
+        self.partes.append(parte if len(df) else None)
+        self._hechos.update(od_ids)
+
+    def compact(self, out_path, limpiar=True) -> pd.DataFrame:
+        """Une las partes en `out_path` (en orden de escritura) y borra el checkpoint."""
+        with metrics.timer("compactar"):
+            partes = [load_routes(self.dir / p) for p in self.partes if p is not None]
+            df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+            if "od_id" in df.columns:
+                df = df.sort_values("od_id", kind="stable").reset_index(drop=True)
+            save_routes(df, out_path)
+        if limpiar:
+            shutil.rmtree(self.dir)
+        return df
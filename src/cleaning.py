@@ -1,5 +1,112 @@
+"""
+Limpieza de transacciones SUBE.
+
+`clean_transactions` aplica casteos y filtros sobre un bloque crudo (13 columnas,
+todo texto) y `stream_clean` recorre el archivo crudo por bloques acotados,
+descartando filas mal formadas y escribiendo el resultado a Parquet sin archivo
+temporal intermedio.
+"""
+
+from pathlib import Path
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from src import metrics
+
+COLUMNS = [
+    "id", "id_tarjeta", "modo", "lat", "lon", "sexo",
+    "interno_bus", "tipo_trx_tren", "etapa_red_sube",
+    "id_linea", "id_ramal", "id_tarifa", "hora"
+]
+ORDERED_COLUMNS = COLUMNS + ["hora_dt"]
+
+# Rango razonable de lat/lon (CABA/AMBA aprox.)
+LAT_RANGE = (-35.5, -34.0)
+LON_RANGE = (-59.5, -57.0)
+
+# Esquema fijo de salida: los identificadores quedan como texto para que todos
+# los bloques compartan tipos (la inferencia por bloque no es estable).
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("id_tarjeta", pa.string()),
+    ("modo", pa.string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("sexo", pa.string()),
+    ("interno_bus", pa.string()),
+    ("tipo_trx_tren", pa.string()),
+    ("etapa_red_sube", pa.int64()),
+    ("id_linea", pa.string()),
+    ("id_ramal", pa.string()),
+    ("id_tarifa", pa.int64()),
+    ("hora", pa.int64()),
+    ("hora_dt", pa.timestamp("ns")),
+])
+
 
 def filter_primary_students(df: pd.DataFrame) -> pd.DataFrame:
     # id_tarifa == 11 → estudiantes de primario (según tus criterios)
     return df[df.get('id_tarifa') == 11].copy()
+
+
+def clean_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """Castea tipos y filtra id_tarifa == 11, NaN en claves y coordenadas fuera de rango."""
+    df = df.copy()
+    for c in ["lat", "lon", "hora"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df["id_tarifa"] = pd.to_numeric(df["id_tarifa"], errors="coerce").astype("Int64")
+    df["etapa_red_sube"] = pd.to_numeric(df["etapa_red_sube"], errors="coerce").astype("Int64")
+
+    df = filter_primary_students(df)
+    df = df.dropna(subset=["id_tarjeta", "lat", "lon"])
+    df = df[df["lat"].between(*LAT_RANGE) & df["lon"].between(*LON_RANGE)].copy()
+
+    # Hora a datetime (HH → 00:00 del día ficticio); 'hora' queda como int
+    df["hora"] = df["hora"].astype("Int64")
+    df["hora_dt"] = pd.to_datetime(df["hora"].astype("float"), unit="h",
+                                   origin=pd.Timestamp("1970-01-01"), errors="coerce")
+
+    return df[[c for c in ORDERED_COLUMNS if c in df.columns]]
+
+
+def stream_clean(raw_path, out_parquet, out_csv=None, block_size=64 << 20) -> dict:
+    """
+    Limpia `raw_path` en una sola pasada, por bloques de ~`block_size` bytes.
+    Las filas que no tienen 13 campos se cuentan y se descartan.
+    Retorna un dict con filas válidas (13 campos), malformadas y finales.
+    """
+    stats = {"filas_validas": 0, "filas_malformadas": 0, "filas_finales": 0}
+
+    def _rechazar(_row):
+        stats["filas_malformadas"] += 1
+        return "skip"
+
+    reader = pv.open_csv(
+        raw_path,
+        read_options=pv.ReadOptions(column_names=COLUMNS, block_size=block_size),
+        parse_options=pv.ParseOptions(invalid_row_handler=_rechazar),
+        # campos vacíos → null (como pandas): dropna descarta tarjetas sin id
+        convert_options=pv.ConvertOptions(column_types={c: pa.string() for c in COLUMNS},
+                                          null_values=[""], strings_can_be_null=True),
+    )
+
+    Path(out_parquet).parent.mkdir(parents=True, exist_ok=True)
+    fcsv = open(out_csv, "w", encoding="utf-8", newline="") if out_csv else None
+    try:
+        with pq.ParquetWriter(out_parquet, SCHEMA) as writer:
+            for batch in reader:
+                stats["filas_validas"] += batch.num_rows
+                with metrics.timer("limpiar_bloque"):
+                    chunk = clean_transactions(batch.to_pandas())
+                stats["filas_finales"] += len(chunk)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=SCHEMA, preserve_index=False))
+                if fcsv is not None:
+                    chunk.to_csv(fcsv, header=fcsv.tell() == 0, index=False)
+    finally:
+        if fcsv is not None:
+            fcsv.close()
+
+    return stats
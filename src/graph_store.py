@@ -0,0 +1,158 @@
+"""
+Caché del grafo vial en disco como arrays NumPy (un directorio por grafo).
+
+El grafo se construye una vez (desde OSM o desde un archivo local .graphml,
+.osm/.xml u .osm.pbf), se convierte a CSR y se guardan node_ids, x, y, indptr,
+indices y weights como .npy junto a un meta.json. Las corridas siguientes lo
+cargan con np.load(mmap_mode='r'): no hay descarga ni parseo y las páginas se
+comparten entre procesos.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import osmnx as ox
+
+from src import metrics
+from src.routing import CSRGraph, R_TIERRA_M, od_center
+
+DEFAULT_CACHE_DIR = Path("data/interim/graphs")
+ARRAYS = ["node_ids", "x", "y", "indptr", "indices", "weights"]
+
+# Tipos de red OSMnx → perfiles de pyrosm (sólo para .osm.pbf)
+_PYROSM_NETWORK = {"drive": "driving", "walk": "walking", "bike": "cycling", "all": "all"}
+
+
+def fingerprint(graph: CSRGraph) -> str:
+    """Hash estable del contenido del grafo (topología, pesos y coordenadas)."""
+    h = hashlib.sha1()
+    for nombre in ARRAYS:
+        h.update(np.ascontiguousarray(getattr(graph, nombre)).tobytes())
+    return h.hexdigest()[:16]
+
+
+def save_graph(graph: CSRGraph, path, meta=None):
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for nombre in ARRAYS:
+        np.save(path / f"{nombre}.npy", getattr(graph, nombre))
+    meta = dict(meta or {})
+    meta.update(n_nodos=len(graph), n_aristas=int(len(graph.indices)), fingerprint=fingerprint(graph))
+    (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def load_graph(path, mmap=True) -> CSRGraph:
+    path = Path(path)
+    arrays = {n: np.load(path / f"{n}.npy", mmap_mode="r" if mmap else None) for n in ARRAYS}
+    graph = CSRGraph(**arrays)
+    graph.meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    graph.cache_dir = path
+    return graph
+
+
+def _hash_archivo(path, bloque=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(bloque), b""):
+            h.update(b)
+    return h.hexdigest()[:10]
+
+
+def _graph_from_file(source, network_type):
+    source = Path(source)
+    nombre = source.name.lower()
+    if nombre.endswith(".graphml"):
+        return ox.load_graphml(source)
+    if nombre.endswith((".osm", ".xml")):
+        return ox.graph_from_xml(source, simplify=True)
+    if nombre.endswith(".pbf"):
+        try:
+            from pyrosm import OSM
+        except ImportError as e:
+            raise ImportError("Leer .osm.pbf requiere pyrosm (pip install pyrosm)") from e
+        osm = OSM(str(source))
+        nodes, edges = osm.get_network(network_type=_PYROSM_NETWORK.get(network_type, network_type), nodes=True)
+        return osm.to_graph(nodes, edges, graph_type="networkx")
+    raise ValueError(f"Formato de grafo no soportado: {source}")
+
+
+def _distancia_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R_TIERRA_M * np.arcsin(np.sqrt(a))
+
+
+def _buscar_en_cache(cache_dir, network_type, dist_m, center, weight, tol_m):
+    """Grafo ya guardado con misma red, radio y peso, y centro a menos de tol_m metros."""
+    for meta_path in sorted(Path(cache_dir).glob("*/meta.json")):
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("source") or (meta.get("network_type"), meta.get("dist_m"), meta.get("weight")) != \
+                (network_type, dist_m, weight):
+            continue
+        if _distancia_m(*meta["center"], *center) <= tol_m:
+            return meta_path.parent
+    return None
+
+
+def load_or_build(center=None, dist_m=12000, network_type="drive", source=None,
+                  cache_dir=DEFAULT_CACHE_DIR, weight="length", tol_m=250.0) -> CSRGraph:
+    """
+    Carga el grafo desde la caché o lo construye y lo guarda.
+
+    Con `source` (archivo local) la clave es nombre + hash del archivo; si no,
+    red + radio + peso + centro (se reutiliza un grafo cuyo centro esté a menos de
+    `tol_m` metros, así observado y nulos comparten el mismo).
+    """
+    cache_dir = Path(cache_dir)
+    if source is not None:
+        clave = f"{Path(source).name.split('.')[0]}_{network_type}_{weight}_{_hash_archivo(source)}"
+        destino = cache_dir / clave
+        existente = destino if (destino / "meta.json").exists() else None
+    else:
+        lat, lon = float(center[0]), float(center[1])
+        destino = cache_dir / f"{network_type}_{int(dist_m)}m_{weight}_{lat:.4f}_{lon:.4f}"
+        existente = _buscar_en_cache(cache_dir, network_type, dist_m, (lat, lon), weight, tol_m)
+
+    if existente is not None:
+        with metrics.timer("grafo_cargar_cache"):
+            return load_graph(existente)
+
+    with metrics.timer("grafo_construir"):
+        if source is not None:
+            G = _graph_from_file(source, network_type)
+            meta = {"source": str(source), "network_type": network_type}
+        else:
+            G = ox.graph_from_point((lat, lon), dist=dist_m, network_type=network_type, simplify=True)
+            meta = {"center": [lat, lon], "dist_m": dist_m, "network_type": network_type}
+        meta["weight"] = weight
+
+        save_graph(CSRGraph.from_networkx(G, weight=weight), destino, meta)
+    return load_graph(destino)
+
+
+
+def add_graph_args(parser):
+    """Opciones de grafo compartidas por los scripts de snap y ruteo."""
+    parser.add_argument("--dist-m", type=int, default=12000,
+                        help="Radio para grafo OSMnx desde el centro (m) (default: 12000)")
+    parser.add_argument("--network", type=str, default="drive",
+                        help="Tipo de red OSMnx (drive, walk, all, all_private) (default: drive)")
+    parser.add_argument("--grafo-archivo", default=None,
+                        help="Grafo local (.graphml, .osm/.xml u .osm.pbf) en lugar de descargar de OSM")
+    parser.add_argument("--cache-grafos", default=str(DEFAULT_CACHE_DIR),
+                        help=f"Directorio de la caché de grafos (default: {DEFAULT_CACHE_DIR})")
+    return parser
+
+
+def graph_for_od(df_od, args) -> CSRGraph:
+    """Grafo de la caché para los pares OD, según las opciones de add_graph_args."""
+    return load_or_build(
+        center=od_center(df_od),
+        dist_m=args.dist_m,
+        network_type=args.network,
+        source=args.grafo_archivo,
+        cache_dir=args.cache_grafos,
+    )
@@ -11,3 +11,68 @@ def to_parquet(df, path, **kwargs):
 
 def read_geojson(path):
     return gpd.read_file(path)
+
+# ---------- Rutas (GeoParquet) ----------
+ROUTE_GEOMETRY = "ruta"
+
+def save_routes(df, path):
+    """
+    Rutas a GeoParquet: geometría `ruta` en WKB (EPSG:4326) y columnas tipadas.
+    Sin geometría (ruteo --solo-cruces) se escribe Parquet plano.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if ROUTE_GEOMETRY in df.columns:
+        gpd.GeoDataFrame(df, geometry=ROUTE_GEOMETRY, crs="EPSG:4326").to_parquet(path, index=False)
+    else:
+        pd.DataFrame(df).to_parquet(path, index=False)
+    return path
+
+def route_columns(path):
+    """Columnas disponibles sin leer datos (schema Parquet; pickle legado se carga)."""
+    if Path(path).suffix == ".pkl":
+        return list(pd.read_pickle(path).columns)
+    import pyarrow.parquet as pq
+    return pq.read_schema(path).names
+
+def load_routes(path, columns=None):
+    """
+    Lee rutas guardadas con save_routes proyectando `columns`: si no incluye la
+    geometría, no se decodifica ningún WKB. Acepta también los .pkl anteriores.
+    """
+    if Path(path).suffix == ".pkl":
+        df = pd.read_pickle(path)
+        return df if columns is None else df[list(columns)]
+    if columns is not None and ROUTE_GEOMETRY not in columns:
+        return pd.read_parquet(path, columns=list(columns))
+    if ROUTE_GEOMETRY not in route_columns(path):
+        return pd.read_parquet(path, columns=columns)
+    return gpd.read_parquet(path, columns=columns)
+
+def route_fingerprint(path) -> bytes:
+    """
+    Huella barata de un archivo de rutas, para claves de caché: tamaño y mtime
+    y, en Parquet, el footer (esquema, filas, offsets y estadísticas de cada
+    column chunk), sin leer los datos. Reescribir el archivo cambia la huella
+    aunque el contenido sea el mismo (la caché se recalcula, nunca queda vieja).
+    """
+    path = Path(path)
+    info = path.stat()
+    huella = f"{info.st_size}:{info.st_mtime_ns}:".encode()
+    with open(path, "rb") as f:
+        if info.st_size >= 12:
+            f.seek(-8, 2)
+            cola = f.read(8)
+            if cola[4:] == b"PAR1":
+                largo = int.from_bytes(cola[:4], "little")
+                f.seek(-8 - largo, 2)
+                huella += f.read(largo)
+    return huella
+
+def export_geojson(path, out_path):
+    """Exportación a GeoJSON bajo demanda (para QGIS / mapas web)."""
+    gdf = load_routes(path)
+    if "nodos" in gdf.columns:
+        gdf = gdf.drop(columns="nodos")  # listas: GeoJSON no las tipa
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    gdf.to_file(out_path, driver="GeoJSON")
+    return out_path
@@ -0,0 +1,258 @@
+"""
+Instrumentación liviana de las etapas del pipeline.
+
+Un script corre dentro de `RunMetrics(etapa)`; mientras está activo, las
+funciones de módulo `timer`, `count` y `observe` (que usan también los módulos
+de src en sus secciones calientes) acumulan en esa corrida. Sin corrida activa
+no hacen nada, así que importarlas no cuesta.
+
+  timer(nombre)        context manager: segundos, llamadas y pico de RSS de la sección
+  record(nombre, seg)  lo mismo para tiempos ya medidos (dentro de bucles calientes)
+  count(nombre, n)     contadores
+  observe(nombre, v)   histograma logarítmico (p. ej. latencia por ruta en segundos)
+
+Un hilo muestrea la RSS cada `intervalo` segundos (pico global y por sección).
+Al salir se escribe data/processed/run_report_<etapa>.json, también si la
+etapa falla (estado "error"); no si sale limpia sin haber registrado nada (--help). Con PIPELINE_PROFILE=cprofile (o pyinstrument)
+se perfila toda la etapa y se guarda profile_<etapa>.prof (o .html) al lado.
+
+Los procesos hijos (workers) no reportan: sus tiempos entran en la sección del padre.
+"""
+
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_REPORT_DIR = Path("data/processed")
+PROFILE_ENV = "PIPELINE_PROFILE"
+
+# Histograma: 10 bins por década entre 1e-7 y 1e4
+_BORDES = np.logspace(-7, 4, 111)
+
+_ACTIVO = None
+
+
+def _rss_mb():
+    """RSS actual (Linux: /proc/self/statm); en otros sistemas, el pico de ru_maxrss."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1 << 20) if sys.platform == "darwin" else pico / 1024
+
+
+class _Histograma:
+
+    def __init__(self):
+        self.conteos = np.zeros(len(_BORDES) + 1, dtype=np.int64)  # + bajo el mínimo / sobre el máximo
+        self.n = 0
+        self.suma = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def agregar(self, valores):
+        v = np.atleast_1d(np.asarray(valores, dtype=float))
+        if not len(v):
+            return
+        self.conteos += np.bincount(np.searchsorted(_BORDES, v, side="right"), minlength=len(self.conteos))
+        self.n += len(v)
+        self.suma += float(v.sum())
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+
+    def percentil(self, q):
+        """Cota superior del bin que contiene el percentil q (precisión ~26 %)."""
+        k = int(np.searchsorted(np.cumsum(self.conteos), q / 100 * self.n, side="left"))
+        return float(min(_BORDES[min(k, len(_BORDES) - 1)], self.max))
+
+    def resumen(self):
+        if not self.n:
+            return {"n": 0}
+        nz = np.flatnonzero(self.conteos)
+        return {
+            "n": self.n, "suma": self.suma, "media": self.suma / self.n, "min": self.min, "max": self.max,
+            "p50": self.percentil(50), "p90": self.percentil(90), "p99": self.percentil(99),
+            "bins": {f"{_BORDES[k - 1] if k else 0:.1e}": int(self.conteos[k]) for k in nz},
+        }
+
+
+class RunMetrics:
+
+    def __init__(self, etapa, out_dir=DEFAULT_REPORT_DIR, intervalo=0.2, profile=None):
+        self.etapa = etapa
+        self.out_dir = Path(out_dir)
+        self.intervalo = intervalo
+        self.profile = os.environ.get(PROFILE_ENV, "") if profile is None else profile
+        self.timers = {}
+        self.contadores = {}
+        self.histogramas = {}
+        self.extra = {}
+        self.rss_pico_mb = 0.0
+        self._abiertas = {}  # sección → pico de RSS desde que se abrió
+        self._fin = threading.Event()
+
+    # ---------- API ----------
+    @contextmanager
+    def timer(self, nombre):
+        clave = object()
+        self._abiertas[clave] = _rss_mb()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seg = time.perf_counter() - t0
+            pico = max(self._abiertas.pop(clave), _rss_mb())
+            self.record(nombre, seg)
+            t = self.timers[nombre]
+            t["rss_pico_mb"] = max(t["rss_pico_mb"], round(pico, 1))
+
+    def record(self, nombre, seg, llamadas=1):
+        t = self.timers.setdefault(nombre, {"seg": 0.0, "llamadas": 0, "rss_pico_mb": 0.0})
+        t["seg"] += seg
+        t["llamadas"] += llamadas
+
+    def count(self, nombre, n=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + int(n)
+
+    def observe(self, nombre, valores):
+        self.histogramas.setdefault(nombre, _Histograma()).agregar(valores)
+
+    def info(self, **kwargs):
+        """Datos sueltos para el reporte (parámetros, tamaños de entrada, …)."""
+        self.extra.update(kwargs)
+
+    # ---------- Muestreo de memoria ----------
+    def _muestrear(self):
+        while not self._fin.wait(self.intervalo):
+            rss = _rss_mb()
+            self.rss_pico_mb = max(self.rss_pico_mb, rss)
+            for clave, pico in list(self._abiertas.items()):
+                if rss > pico:
+                    self._abiertas[clave] = rss
+
+    # ---------- Perfilado ----------
+    def _iniciar_profile(self):
+        if self.profile == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise ImportError(f"{PROFILE_ENV}=pyinstrument requiere pyinstrument (pip install pyinstrument)") from e
+            self._profiler = Profiler()
+            self._profiler.start()
+        elif self.profile:
+            raise ValueError(f"{PROFILE_ENV} debe ser 'cprofile' o 'pyinstrument', no {self.profile!r}")
+
+    def _guardar_profile(self):
+        if self.profile == "cprofile":
+            self._profiler.disable()
+            path = self.out_dir / f"profile_{self.etapa}.prof"
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.stop()
+            path = self.out_dir / f"profile_{self.etapa}.html"
+            path.write_text(self._profiler.output_html(), encoding="utf-8")
+        return str(path)
+
+    # ---------- Corrida ----------
+    def __enter__(self):
+        global _ACTIVO
+        self._iniciar_profile()
+        self._anterior = _ACTIVO
+        _ACTIVO = self
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+        self.rss_pico_mb = _rss_mb()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        global _ACTIVO
+        duracion = time.perf_counter() - self._t0
+        self._fin.set()
+        self._hilo.join()
+        _ACTIVO = self._anterior
+        salida_limpia = tipo is not None and issubclass(tipo, SystemExit) and valor.code in (0, None)
+        if salida_limpia and not (self.timers or self.contadores or self.histogramas or self.extra):
+            # --help (o sys.exit(0) antes de hacer nada): no hay corrida que reportar
+            if self.profile == "cprofile":
+                self._profiler.disable()
+            elif self.profile:
+                self._profiler.stop()
+            return False
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = self._guardar_profile() if self.profile else None
+        fallo = tipo is not None and not salida_limpia
+        reporte = self.report(duracion, "error" if fallo else "ok", error=repr(valor) if fallo else None)
+        reporte["profile"] = profile_path
+        self.write(reporte)
+        return False
+
+    def report(self, duracion_s=None, estado="ok", error=None) -> dict:
+        return {
+            "etapa": self.etapa,
+            "estado": estado,
+            "error": error,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "duracion_s": round(duracion_s, 3) if duracion_s is not None else None,
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "rss_pico_mb": round(max(self.rss_pico_mb, _rss_mb()), 1),
+            "timers": {k: {**v, "seg": round(v["seg"], 4)} for k, v in self.timers.items()},
+            "contadores": self.contadores,
+            "histogramas": {k: h.resumen() for k, h in self.histogramas.items()},
+            **({"extra": self.extra} if self.extra else {}),
+        }
+
+    def write(self, reporte):
+        path = self.out_dir / f"run_report_{self.etapa}.json"
+        path.write_text(json.dumps(reporte, indent=2, default=str), encoding="utf-8")
+        return path
+
+
+# ---------- Atajos sobre la corrida activa (no-op sin corrida) ----------
+@contextmanager
+def _nada():
+    yield
+
+def timer(nombre):
+    return _nada() if _ACTIVO is None else _ACTIVO.timer(nombre)
+
+def record(nombre, seg, llamadas=1):
+    if _ACTIVO is not None:
+        _ACTIVO.record(nombre, seg, llamadas)
+
+def count(nombre, n=1):
+    if _ACTIVO is not None:
+        _ACTIVO.count(nombre, n)
+
+def observe(nombre, valores):
+    if _ACTIVO is not None:
+        _ACTIVO.observe(nombre, valores)
+
+def info(**kwargs):
+    if _ACTIVO is not None:
+        _ACTIVO.info(**kwargs)
+
+def rename_stage(etapa):
+    """Cambia el nombre del reporte (p. ej. una réplica: run_report_41_route_paths_null_r3.json)."""
+    if _ACTIVO is not None:
+        _ACTIVO.etapa = etapa
+
+def activo() -> bool:
+    return _ACTIVO is not None
@@ -0,0 +1,617 @@
+"""
+Modelo nulo: recableo de destinos entre pares OD preservando aproximadamente
+la distribución de distancias (por bins con tolerancia).
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from src import metrics
+
+R_TIERRA_KM = 6371.0088
+
+
+# ---------- Utilidades de distancia ----------
+def haversine_km_vec(lat1, lon1, lat2, lon2):
+    """
+    Distancia Haversine vectorizada en km (lat/lon en grados).
+    Acepta escalares o arrays; usa broadcasting NumPy.
+    """
+    R = R_TIERRA_KM
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2.0)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2.0)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+def indice_bin(dist_km, bins):
+    """Ubica la distancia en un bin 0-based; intervalos (a, b]."""
+    return np.searchsorted(bins, dist_km, side="right") - 1
+
+def haversine_bloques(latO, lonO, latD, lonD, max_mem_mb=256, dtype=np.float64, usar_numexpr=True):
+    """
+    Distancias haversine (km) de cada origen a todos los destinos, por tiles de
+    B orígenes × n destinos. B sale de `max_mem_mb` (dos buffers B × n de `dtype`
+    que se reutilizan entre tiles con ufuncs out=, sin temporales por llamada).
+    Con numexpr instalado (y usar_numexpr) el tile se evalúa en una pasada multihilo.
+
+    Genera (ini, fin, D): D es una vista del buffer, válida hasta el siguiente tile.
+    """
+    dtype = np.dtype(dtype)
+    phi1, lam1 = (np.radians(np.asarray(a, dtype=float)).astype(dtype) for a in (latO, lonO))
+    phi2, lam2 = (np.radians(np.asarray(a, dtype=float)).astype(dtype) for a in (latD, lonD))
+    cos1, cos2 = np.cos(phi1), np.cos(phi2)
+    n_o, n_d = len(phi1), len(phi2)
+    B = int(max(1, min(n_o, max_mem_mb * 2**20 // max(2 * n_d * dtype.itemsize, 1))))
+    buf1 = np.empty((B, n_d), dtype=dtype)
+    buf2 = np.empty((B, n_d), dtype=dtype)
+    dos_r = dtype.type(2 * R_TIERRA_KM)
+
+    ne = None
+    if usar_numexpr:
+        try:
+            import numexpr as ne
+        except ImportError:
+            ne = None
+
+    for ini in range(0, n_o, B):
+        fin = min(ini + B, n_o)
+        d1, d2 = buf1[:fin - ini], buf2[:fin - ini]
+        p1, l1, c1 = phi1[ini:fin, None], lam1[ini:fin, None], cos1[ini:fin, None]
+        if ne is not None:
+            ne.evaluate("dos_r * arcsin(sqrt(sin((phi2 - p1) / 2) ** 2 + c1 * cos2 * sin((lam2 - l1) / 2) ** 2))",
+                        local_dict=dict(dos_r=dos_r, phi2=phi2, p1=p1, c1=c1, cos2=cos2, lam2=lam2, l1=l1),
+                        out=d1, casting="same_kind")
+            yield ini, fin, d1
+            continue
+        np.subtract(phi2, p1, out=d1)
+        np.multiply(d1, 0.5, out=d1)
+        np.sin(d1, out=d1)
+        np.square(d1, out=d1)
+        np.subtract(lam2, l1, out=d2)
+        np.multiply(d2, 0.5, out=d2)
+        np.sin(d2, out=d2)
+        np.square(d2, out=d2)
+        np.multiply(d2, cos2, out=d2)
+        np.multiply(d2, c1, out=d2)
+        np.add(d1, d2, out=d1)
+        np.sqrt(d1, out=d1)
+        np.arcsin(d1, out=d1)
+        np.multiply(d1, dos_r, out=d1)
+        yield ini, fin, d1
+
+
+# ---------- Candidatos ----------
+def posibles_destinos_csr(df, bins, bin_real, tol_bins=1, allow_keep=True, bloque=10_000,
+                          metodo="balltree", max_mem_mb=256, dtype=np.float64):
+    """
+    Para cada origen i, índices j de destinos compatibles por bin ± tol_bins,
+    en formato CSR: los candidatos de i son indices[indptr[i]:indptr[i+1]] (ordenados).
+
+    Los destinos se indexan con un BallTree (métrica haversine). Como los bins son
+    intervalos de distancia, cada origen consulta sólo la bola del borde superior
+    de su bin + tol_bins y el anillo se recorta con la distancia exacta.
+    Con metodo="bloques" se calcula la matriz completa por tiles acotados en
+    memoria (haversine_bloques): conviene cuando los anillos cubren casi todo.
+    """
+    n = len(df)
+    latO = df["lat_origen"].to_numpy(dtype=float)
+    lonO = df["lon_origen"].to_numpy(dtype=float)
+    latD = df["lat_destino"].to_numpy(dtype=float)
+    lonD = df["lon_destino"].to_numpy(dtype=float)
+    bin_real = np.asarray(bin_real)
+    if metodo == "bloques":
+        return _posibles_destinos_bloques(latO, lonO, latD, lonD, bins, bin_real, tol_bins, allow_keep,
+                                          max_mem_mb, dtype)
+    if metodo != "balltree":
+        raise ValueError(f"metodo desconocido: {metodo!r} (balltree | bloques)")
+
+    tree = BallTree(np.radians(np.c_[latD, lonD]), metric="haversine")
+
+    # Radio de consulta: borde superior del último bin admitido (o todo el globo)
+    k_sup = bin_real + tol_bins + 1
+    radio_km = np.full(n, np.pi * R_TIERRA_KM)
+    acotado = k_sup < len(bins)
+    radio_km[acotado] = bins[k_sup[acotado]]
+    radio = radio_km * (1 + 1e-9) / R_TIERRA_KM + 1e-12
+
+    filas, columnas = [], []
+    for ini in range(0, n, bloque):
+        fin = min(ini + bloque, n)
+        vecinos = tree.query_radius(np.radians(np.c_[latO[ini:fin], lonO[ini:fin]]), r=radio[ini:fin])
+        largos = np.fromiter((len(v) for v in vecinos), dtype=np.int64, count=fin - ini)
+        i = np.repeat(np.arange(ini, fin), largos)
+        j = np.concatenate(vecinos).astype(np.int64)
+
+        # Anillo exacto: mismo criterio de bin que la distancia real
+        bins_ij = indice_bin(haversine_km_vec(latO[i], lonO[i], latD[j], lonD[j]), bins)
+        mask = np.abs(bins_ij - bin_real[i]) <= tol_bins
+        if not allow_keep:
+            mask &= (i != j)  # evita quedarse con su mismo destino
+        filas.append(i[mask])
+        columnas.append(j[mask])
+
+    filas = np.concatenate(filas) if filas else np.array([], np.int64)
+    columnas = np.concatenate(columnas) if columnas else np.array([], np.int64)
+    orden = np.lexsort((columnas, filas))
+    indices = columnas[orden]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=n), out=indptr[1:])
+
+    return indptr, indices
+
+
+
+def _rangos(inicios, largos):
+    """Concatenación de arange(inicios[k], inicios[k] + largos[k]) sin bucle."""
+    total = int(largos.sum())
+    if total == 0:
+        return np.array([], np.int64)
+    desplaz = np.repeat(inicios - np.cumsum(np.r_[0, largos[:-1]]), largos)
+    return desplaz + np.arange(total)
+
+def posibles_destinos_red(M, fila_o, col_d, bins, bin_real, tol_bins=1, allow_keep=True, bloque=10_000):
+    """
+    Candidatos CSR como posibles_destinos_csr, pero con distancia de red: M es la
+    matriz (orígenes únicos × destinos únicos) de network_distance_matrix en km,
+    fila_o / col_d ubican el origen y el destino de cada par en M (-1: fuera de red).
+    Retorna (indptr, indices, distancias): distancias[k] es la de red del candidato k.
+    """
+    n = len(fila_o)
+    fila_o = np.asarray(fila_o)
+    col_d = np.asarray(col_d)
+    bin_real = np.asarray(bin_real)
+
+    # Pares agrupados por columna de destino: col c → filas orden_d[ptr_d[c]:ptr_d[c+1]]
+    validos = np.flatnonzero(col_d >= 0)
+    orden_d = validos[np.argsort(col_d[validos], kind="stable")]
+    ptr_d = np.zeros(M.shape[1] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(col_d[validos], minlength=M.shape[1]), out=ptr_d[1:])
+
+    filas, columnas, distancias = [], [], []
+    for ini in range(0, n, bloque):
+        i = np.arange(ini, min(ini + bloque, n))
+        i = i[(fila_o[i] >= 0) & (bin_real[i] >= 0)]
+        r = fila_o[i]
+        largos = M.indptr[r + 1] - M.indptr[r]
+        i = np.repeat(i, largos)
+        e = _rangos(M.indptr[r], largos)
+        d_km = M.data[e]
+        c = M.indices[e]
+
+        mask = np.abs(indice_bin(d_km, bins) - bin_real[i]) <= tol_bins
+        i, c, d_km = i[mask], c[mask], d_km[mask]
+
+        # Cada columna de destino → todos los pares con ese destino
+        cuantos = ptr_d[c + 1] - ptr_d[c]
+        j = orden_d[_rangos(ptr_d[c], cuantos)]
+        i = np.repeat(i, cuantos)
+        d_km = np.repeat(d_km, cuantos)
+        if not allow_keep:
+            keep = i != j
+            i, j, d_km = i[keep], j[keep], d_km[keep]
+        filas.append(i)
+        columnas.append(j)
+        distancias.append(d_km)
+
+    filas = np.concatenate(filas) if filas else np.array([], np.int64)
+    columnas = np.concatenate(columnas) if columnas else np.array([], np.int64)
+    distancias = np.concatenate(distancias) if distancias else np.array([], float)
+    orden = np.lexsort((columnas, filas))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=n), out=indptr[1:])
+    return indptr, columnas[orden], distancias[orden]
+
+def _posibles_destinos_bloques(latO, lonO, latD, lonD, bins, bin_real, tol_bins, allow_keep, max_mem_mb, dtype):
+    n = len(latO)
+    bins_t = np.asarray(bins, dtype=dtype)
+    filas, columnas = [], []
+    # la memoria se reparte entre los buffers de distancia y el de bins (int64)
+    item = np.dtype(dtype).itemsize
+    mem_mb = max_mem_mb * 2 * item / (2 * item + 8)
+    for ini, fin, D in haversine_bloques(latO, lonO, latD, lonD, max_mem_mb=mem_mb, dtype=dtype):
+        b = np.searchsorted(bins_t, D.ravel(), side="right").reshape(D.shape) - 1
+        mask = np.abs(b - bin_real[ini:fin, None]) <= tol_bins
+        if not allow_keep:
+            k = np.arange(ini, fin)
+            mask[k - ini, k] = False
+        i, j = np.nonzero(mask)  # ya en orden (fila, columna)
+        filas.append(i + ini)
+        columnas.append(j)
+
+    filas = np.concatenate(filas) if filas else np.array([], np.int64)
+    indices = np.concatenate(columnas) if columnas else np.array([], np.int64)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=n), out=indptr[1:])
+    return indptr, indices.astype(np.int64)
+
+# ---------- Matching 1–a–1 ----------
+def emparejar_csr(indptr, indices, rng, n_dest=None):
+    """
+    Matching 1–a–1 aleatorio sobre candidatos CSR.
+
+    Recorre los orígenes en orden aleatorio; cada uno sortea uniformemente entre
+    los destinos aún disponibles de su pool (una copia de su tramo CSR). Un
+    candidato ya tomado se saca del pool con swap-remove y se vuelve a sortear,
+    así cada paso cuesta O(1) amortizado en lugar de reconstruir la lista.
+
+    Retorna `asignado` (destino j de cada origen, -1 si no hubo) y la lista
+    `sin_posibles` en orden de procesamiento.
+    """
+    n = len(indptr) - 1
+    n_dest = n if n_dest is None else n_dest
+    pool = np.array(indices, dtype=np.int64)  # se reordena in-place
+    disponible = np.ones(n_dest, dtype=bool)
+    asignado = np.full(n, -1, dtype=np.int64)
+    sin_posibles = []
+
+    orden = rng.permutation(n)
+    sorteos = rng.random(n)
+    ini_l = indptr[:-1].tolist()
+    largo_l = np.diff(indptr).tolist()
+    for k, i in enumerate(orden.tolist()):
+        ini, m = ini_l[i], largo_l[i]
+        x = sorteos[k]
+        while m:
+            p = ini + int(x * m)
+            j = pool[p]
+            if disponible[j]:
+                disponible[j] = False
+                asignado[i] = j
+                break
+            m -= 1
+            pool[p] = pool[ini + m]
+            x = rng.random()
+        else:
+            sin_posibles.append(i)
+
+    return asignado, sin_posibles
+
+
+# ---------- Core del modelo nulo ----------
+def preparar_candidatos(df, ancho_bin_km=1, tol_bins=1, allow_keep=True, graph=None, radio_red_km=None,
+                        metodo="balltree", max_mem_mb=256, dtype=np.float64):
+    """
+    Distancia real, bins y candidatos CSR: la parte cara del modelo nulo, que no
+    depende de la semilla y se comparte entre réplicas.
+    Retorna (df con distancia_km, bins, indptr, indices, distancias): `distancias`
+    es None salvo con `graph` (ver _preparar_red), donde los bins son de red.
+    """
+    # Asegurar columna distancia_km (real)
+    if "distancia_km" not in df.columns:
+        df = df.copy()
+        df["distancia_km"] = haversine_km_vec(
+            df["lat_origen"].to_numpy(), df["lon_origen"].to_numpy(),
+            df["lat_destino"].to_numpy(), df["lon_destino"].to_numpy()
+        )
+
+    # Con grafo los bins son de distancia de red: los haversine no se usan
+    if graph is not None:
+        return _preparar_red(df, graph, ancho_bin_km, tol_bins, allow_keep, radio_red_km)
+
+    # Construcción de bins
+    max_d = float(np.nanmax(df["distancia_km"].to_numpy()))
+    if max_d == 0:
+        max_d = 0.5
+    bins = np.arange(0, max_d + ancho_bin_km, ancho_bin_km)
+
+    # Bin real de cada trayecto (un solo searchsorted)
+    bin_real = indice_bin(df["distancia_km"].to_numpy(dtype=float), bins)
+
+    # Pre-cálculo de candidatos por origen (CSR)
+    indptr, indices = posibles_destinos_csr(
+        df, bins=bins, bin_real=bin_real, tol_bins=tol_bins, allow_keep=allow_keep,
+        metodo=metodo, max_mem_mb=max_mem_mb, dtype=dtype
+    )
+    return df, bins, indptr, indices, None
+
+def _preparar_red(df, graph, ancho_bin_km, tol_bins, allow_keep, radio_red_km=None):
+    """
+    Variante con distancia de red (requiere nodo_origen/nodo_destino de snap).
+    Una sola matriz dispersa orígenes únicos × destinos únicos, cortada en
+    `radio_red_km` (default: 2 × la mayor distancia haversine + tolerancia), en
+    lugar de rutear cada par candidato. Los pares fuera de red (o con nodos que
+    no están en `graph`) o sin camino dentro del radio no tienen candidatos y
+    conservan su destino.
+    """
+    from src.routing import csr_lookup, network_distance_matrix
+
+    df = df.copy()
+    ok = ~df["fuera_de_red"].to_numpy(dtype=bool) if "fuera_de_red" in df.columns else np.ones(len(df), bool)
+    ok &= graph.contains(df["nodo_origen"].to_numpy()) & graph.contains(df["nodo_destino"].to_numpy())
+    fila_o = np.full(len(df), -1, dtype=np.int64)
+    col_d = np.full(len(df), -1, dtype=np.int64)
+    nodos_o, fila_o[ok] = np.unique(graph.index_of(df["nodo_origen"].to_numpy()[ok]), return_inverse=True)
+    nodos_d, col_d[ok] = np.unique(graph.index_of(df["nodo_destino"].to_numpy()[ok]), return_inverse=True)
+
+    if radio_red_km is None:
+        radio_red_km = 2 * float(np.nanmax(df["distancia_km"].to_numpy()[ok], initial=0)) + (tol_bins + 1) * ancho_bin_km
+    M = network_distance_matrix(graph, nodos_o, nodos_d, limit=radio_red_km * 1000)
+    M.data /= 1000  # metros → km
+
+    red = np.full(len(df), np.nan)
+    red[ok] = csr_lookup(M, fila_o[ok], col_d[ok], faltante=np.nan)
+    df["distancia_red_km"] = red
+
+    max_d = float(np.nanmax(red, initial=0)) or 0.5
+    bins = np.arange(0, max_d + ancho_bin_km, ancho_bin_km)
+    bin_real = np.where(np.isfinite(red), indice_bin(np.nan_to_num(red), bins), -1)
+
+    indptr, indices, distancias = posibles_destinos_red(M, fila_o, col_d, bins, bin_real,
+                                                        tol_bins=tol_bins, allow_keep=allow_keep)
+    return df, bins, indptr, indices, distancias
+
+def aplicar_recableo(df, bins, asignado, candidatos=None):
+    """
+    Arma el DataFrame recableado a partir de `asignado` y el resumen de distribuciones.
+    Con `candidatos` = (indptr, indices, distancias) de red, el resumen compara
+    distancia_red_km (la de cada par nuevo sale del candidato elegido).
+    """
+    # Asignación en bloque de las coordenadas (y del nodo, si ya hubo snap) del nuevo destino
+    ok = asignado >= 0
+    df_rec = df.drop(columns="fuera_de_red", errors="ignore")
+    columnas = ["lat_destino", "lon_destino"] + [c for c in ("nodo_destino", "snap_m_destino") if c in df.columns]
+    for c in columnas:
+        previo = df[c].to_numpy()
+        nuevo = previo.copy()
+        nuevo[ok] = previo[asignado[ok]]
+        df_rec[c] = nuevo
+
+    # Recalcular distancias para el nulo
+    df_rec["distancia_km"] = haversine_km_vec(
+        df_rec["lat_origen"].to_numpy(), df_rec["lon_origen"].to_numpy(),
+        df_rec["lat_destino"].to_numpy(), df_rec["lon_destino"].to_numpy()
+    )
+
+    columna = "distancia_km"
+    if candidatos is not None:
+        from scipy.sparse import csr_matrix
+        from src.routing import csr_lookup
+        indptr, indices, distancias = candidatos
+        C = csr_matrix((distancias, indices, indptr), shape=(len(df), len(df)))
+        red = df["distancia_red_km"].to_numpy(copy=True)
+        red[ok] = csr_lookup(C, np.flatnonzero(ok), asignado[ok])
+        df_rec["distancia_red_km"] = red
+        columna = "distancia_red_km"
+
+    return df_rec, resumen_distribuciones(df[columna], df_rec[columna], bins)
+
+def resumen_distribuciones(dist_real, dist_nulo, bins):
+    """Comparación de distribuciones: frecuencia relativa por bin, real vs nulo."""
+    real_bins = pd.cut(pd.Series(dist_real), bins=bins, include_lowest=True)
+    nulo_bins = pd.cut(pd.Series(dist_nulo), bins=bins, include_lowest=True)
+    freq_real = real_bins.value_counts().sort_index()
+    freq_nulo = nulo_bins.value_counts().sort_index()
+
+    prob_real = (freq_real / max(freq_real.sum(), 1)).rename("prob_real")
+    prob_nulo = (freq_nulo / max(freq_nulo.sum(), 1)).rename("prob_nulo")
+    summary = pd.concat([prob_real, prob_nulo], axis=1)
+    summary.index.name = "bin"
+    return summary
+
+def recableo_matching(df, ancho_bin_km=1, tol_bins=1, allow_keep=True, seed=None, graph=None, radio_red_km=None,
+                      **opciones_candidatos):
+    """
+    Con `graph` los bins son de distancia de red (ver _preparar_red); `opciones_candidatos`
+    (metodo, max_mem_mb, dtype) pasan a posibles_destinos_csr.
+
+    Retorna:
+      df_rec       : DataFrame con nuevos destinos y distancia_km recalculada
+      emparejados  : cantidad de orígenes con destino asignado
+      sin_posibles : lista de índices i sin destino compatible disponible
+      summary      : DataFrame con comparación de distribución de distancias (real vs nulo)
+    """
+    rng = np.random.default_rng(seed)
+    with metrics.timer("candidatos"):
+        df, bins, indptr, indices, distancias = preparar_candidatos(df, ancho_bin_km, tol_bins, allow_keep,
+                                                                    graph, radio_red_km, **opciones_candidatos)
+    metrics.count("candidatos", len(indices))
+    with metrics.timer("emparejar"):
+        asignado, sin_posibles = emparejar_csr(indptr, indices, rng, n_dest=len(df))
+    candidatos = None if distancias is None else (indptr, indices, distancias)
+    df_rec, summary = aplicar_recableo(df, bins, asignado, candidatos)
+    emparejados = len(df) - len(sin_posibles)
+    return df_rec, emparejados, sin_posibles, summary
+
+
+# ---------- Ensamble de réplicas ----------
+_CANDIDATOS = None
+
+def _init_worker(indptr, indices, n_dest):
+    global _CANDIDATOS
+    _CANDIDATOS = (indptr, indices, n_dest)
+
+def _emparejar_replica(tarea):
+    replica, semilla = tarea
+    indptr, indices, n_dest = _CANDIDATOS
+    asignado, sin_posibles = emparejar_csr(indptr, indices, np.random.default_rng(semilla), n_dest=n_dest)
+    return replica, asignado, sin_posibles
+
+def recableo_replicas(df, replicas, ancho_bin_km=1, tol_bins=1, allow_keep=True, seed=None, workers=1,
+                      graph=None, radio_red_km=None, **opciones_candidatos):
+    """
+    Genera `replicas` modelos nulos independientes reutilizando un único cálculo
+    de candidatos. Cada réplica usa un hijo de SeedSequence(seed), así el
+    resultado no depende de la cantidad de workers ni del orden de llegada.
+
+    Itera tuplas (replica, df_rec, emparejados, sin_posibles, summary) a medida
+    que terminan los matchings (no necesariamente en orden de réplica).
+    """
+    with metrics.timer("candidatos"):
+        df, bins, indptr, indices, distancias = preparar_candidatos(df, ancho_bin_km, tol_bins, allow_keep,
+                                                                    graph, radio_red_km, **opciones_candidatos)
+    metrics.count("candidatos", len(indices))
+    candidatos = None if distancias is None else (indptr, indices, distancias)
+    semillas = np.random.SeedSequence(seed).spawn(replicas)
+    tareas = list(enumerate(semillas))
+
+    if workers <= 1:
+        _init_worker(indptr, indices, len(df))
+        resultados = map(_emparejar_replica, tareas)
+        for replica, asignado, sin_posibles in resultados:
+            df_rec, summary = aplicar_recableo(df, bins, asignado, candidatos)
+            yield replica, df_rec, len(df) - len(sin_posibles), sin_posibles, summary
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(indptr, indices, len(df))) as ex:
+        futuros = [ex.submit(_emparejar_replica, t) for t in tareas]
+        for fut in as_completed(futuros):
+            replica, asignado, sin_posibles = fut.result()
+            df_rec, summary = aplicar_recableo(df, bins, asignado, candidatos)
+            yield replica, df_rec, len(df) - len(sin_posibles), sin_posibles, summary
+
+
+# ---------- Barrido de parámetros ----------
+def _bins(max_d, ancho_bin_km):
+    return np.arange(0, (max_d or 0.5) + ancho_bin_km, ancho_bin_km)
+
+def _limites(d_real, bins, tol_bins):
+    """Intervalo [lo, hi) de distancias compatibles con el bin real ± tol_bins (mismo criterio que indice_bin)."""
+    b = indice_bin(d_real, bins)
+    k_lo, k_hi = b - tol_bins, b + tol_bins + 1
+    lo = np.where(k_lo > 0, bins[np.clip(k_lo, 0, len(bins) - 1)], -np.inf)
+    hi = np.where(k_hi < len(bins), bins[np.clip(k_hi, 0, len(bins) - 1)], np.inf)
+    return lo, hi
+
+def indice_distancias(df, configs, bloque=10_000):
+    """
+    Índice compartido para el barrido: para cada origen i, los destinos j hasta
+    el mayor radio que pida alguna config (ancho_bin_km, tol_bins), con la distancia
+    exacta d_ij, en CSR ordenado por (i, d_ij). Cada config se obtiene después con
+    dos searchsorted por fila (candidatos_desde_indice), sin volver a consultar el árbol.
+    Retorna (indptr, indices, dist, d_real, max_d).
+    Memoria O(total de candidatos): ~16 bytes por candidato y ~40 en el pico del
+    lexsort (ver scripts/45_sweep_null_model.py).
+    """
+    n = len(df)
+    latO = df["lat_origen"].to_numpy(dtype=float)
+    lonO = df["lon_origen"].to_numpy(dtype=float)
+    latD = df["lat_destino"].to_numpy(dtype=float)
+    lonD = df["lon_destino"].to_numpy(dtype=float)
+    d_real = haversine_km_vec(latO, lonO, latD, lonD)
+    max_d = float(np.nanmax(d_real)) if n else 0.0
+
+    radio_km = np.zeros(n)
+    for ancho, tol in configs:
+        _, hi = _limites(d_real, _bins(max_d, ancho), tol)
+        radio_km = np.maximum(radio_km, np.minimum(hi, np.pi * R_TIERRA_KM))
+    radio = radio_km * (1 + 1e-9) / R_TIERRA_KM + 1e-12
+
+    tree = BallTree(np.radians(np.c_[latD, lonD]), metric="haversine")
+    filas, columnas, dist = [], [], []
+    for ini in range(0, n, bloque):
+        fin = min(ini + bloque, n)
+        vecinos = tree.query_radius(np.radians(np.c_[latO[ini:fin], lonO[ini:fin]]), r=radio[ini:fin])
+        largos = np.fromiter((len(v) for v in vecinos), dtype=np.int64, count=fin - ini)
+        i = np.repeat(np.arange(ini, fin), largos)
+        j = np.concatenate(vecinos).astype(np.int64)
+        filas.append(i)
+        columnas.append(j)
+        dist.append(haversine_km_vec(latO[i], lonO[i], latD[j], lonD[j]))
+
+    filas = np.concatenate(filas) if filas else np.array([], np.int64)
+    columnas = np.concatenate(columnas) if columnas else np.array([], np.int64)
+    dist = np.concatenate(dist) if dist else np.array([], float)
+    orden = np.lexsort((columnas, dist, filas))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=n), out=indptr[1:])
+    return indptr, columnas[orden], dist[orden], d_real, max_d
+
+def candidatos_desde_indice(indice, ancho_bin_km, tol_bins, allow_keep=True):
+    """
+    Candidatos CSR de una config a partir de indice_distancias: por fila, el tramo
+    con d en [lo, hi), reordenado por j. Como cada fila está ordenada por d, el
+    tramo empieza en indptr[i] + #{d < lo} y termina en indptr[i] + #{d < hi}
+    (conteos exactos por fila, sin mezclar fila y distancia en una clave float).
+    Igual a posibles_destinos_csr con los mismos parámetros.
+    Retorna (bins, indptr, indices).
+    """
+    indptr_i, indices_i, dist, d_real, max_d = indice
+    n = len(d_real)
+    bins = _bins(max_d, ancho_bin_km)
+    lo, hi = _limites(d_real, bins, tol_bins)
+
+    fila = np.repeat(np.arange(n), np.diff(indptr_i))
+    ini = indptr_i[:-1] + np.bincount(fila[dist < lo[fila]], minlength=n)
+    fin = indptr_i[:-1] + np.bincount(fila[dist < hi[fila]], minlength=n)
+
+    largos = fin - ini
+    pos = np.repeat(ini - np.cumsum(np.r_[0, largos[:-1]]), largos) + np.arange(int(largos.sum()))
+    i, j = np.repeat(np.arange(n), largos), indices_i[pos]
+    if not allow_keep:
+        keep = i != j
+        i, j = i[keep], j[keep]
+    orden = np.lexsort((j, i))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(i, minlength=n), out=indptr[1:])
+    return bins, indptr, j[orden]
+
+def divergencia_js(p, q):
+    """Divergencia de Jensen–Shannon (base 2, en [0, 1]) entre dos distribuciones discretas."""
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    m = (p + q) / 2
+
+    def kl(a, b):
+        nz = a > 0
+        return float(np.sum(a[nz] * np.log2(a[nz] / b[nz])))
+
+    return (kl(p, m) + kl(q, m)) / 2
+
+def ks_distancias(a, b):
+    """Estadístico de Kolmogorov–Smirnov entre dos muestras (máx. diferencia de las CDF)."""
+    a, b = np.sort(a), np.sort(b)
+    x = np.r_[a, b]
+    return float(np.max(np.abs(np.searchsorted(a, x, side="right") / len(a)
+                               - np.searchsorted(b, x, side="right") / len(b)))) if len(a) and len(b) else np.nan
+
+_INDICE = None
+
+def _init_barrido(indice, coords):
+    global _INDICE
+    _INDICE = (indice, coords)
+
+def _correr_config(tarea):
+    """Una config (ancho, tol) con todas sus semillas: candidatos una vez, un matching por semilla."""
+    ancho, tol, seeds, allow_keep = tarea
+    indice, (latO, lonO, latD, lonD) = _INDICE
+    d_real = indice[3]
+    bins, indptr, indices = candidatos_desde_indice(indice, ancho, tol, allow_keep)
+    filas = []
+    for seed in seeds:
+        asignado, sin_posibles = emparejar_csr(indptr, indices, np.random.default_rng(seed), n_dest=len(d_real))
+        destino = np.where(asignado >= 0, asignado, np.arange(len(d_real)))
+        d_nulo = haversine_km_vec(latO, lonO, latD[destino], lonD[destino])
+        resumen = resumen_distribuciones(d_real, d_nulo, bins)
+        filas.append({
+            "bin_km": ancho, "tol_bins": tol, "seed": seed,
+            "emparejados": len(d_real) - len(sin_posibles), "sin_posibles": len(sin_posibles),
+            "candidatos_medios": len(indices) / max(len(d_real), 1),
+            "js_div": divergencia_js(resumen["prob_real"], resumen["prob_nulo"]),
+            "ks": ks_distancias(d_real, d_nulo),
+        })
+    return filas
+
+def barrido_parametros(df, anchos_km, tols, seeds, allow_keep=True, workers=1):
+    """
+    Sensibilidad del modelo nulo a (bin_km × tol_bins × seed): distancias e índice
+    ordenado se calculan una vez; cada (bin_km, tol_bins) es una tarea (en paralelo
+    con workers > 1) que deriva sus candidatos del índice y corre todas las semillas.
+    Retorna un DataFrame ordenado con una fila por combinación.
+    """
+    configs = [(float(a), int(t)) for a in anchos_km for t in tols]
+    indice = indice_distancias(df, configs)
+    coords = tuple(df[c].to_numpy(dtype=float) for c in ("lat_origen", "lon_origen", "lat_destino", "lon_destino"))
+    tareas = [(a, t, list(seeds), allow_keep) for a, t in configs]
+
+    if workers <= 1:
+        _init_barrido(indice, coords)
+        filas = [f for tarea in tareas for f in _correr_config(tarea)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_barrido, initargs=(indice, coords)) as ex:
+            filas = [f for res in ex.map(_correr_config, tareas) for f in res]
+    return pd.DataFrame(filas).sort_values(["bin_km", "tol_bins", "seed"]).reset_index(drop=True)
@@ -1,7 +1,87 @@
+import numpy as np
 import pandas as pd
 
+OD_COLUMNS = [
+    "id_tarjeta",
+    "lat_origen", "lon_origen", "hora_origen", "modo_origen", "interno_origen", "ramal_origen",
+    "lat_destino", "lon_destino", "hora_destino", "modo_destino", "interno_destino", "ramal_destino",
+]
+
+
 def infer_home_school_pairs(df: pd.DataFrame) -> pd.DataFrame:
     # Placeholder: reemplazar por tu lógica de ventana horaria
     # Debe retornar DataFrame con columnas: id_tarjeta, home_lat, home_lon, school_lat, school_lon
     cols = ['id_tarjeta','home_lat','home_lon','school_lat','school_lon']
     return pd.DataFrame(columns=cols)
+
+
+def build_pairs(df: pd.DataFrame, min_gap_hours=3) -> pd.DataFrame:
+    """
+    Para cada id_tarjeta toma la PRIMERA transacción como origen y, como destino,
+    la primera transacción posterior con hora >= hora_origen + min_gap_hours
+    en una coordenada distinta del origen. Filtra etapa_red_sube == 0.
+
+    Vectorizado: un único orden por (id_tarjeta, hora), el origen de cada tarjeta
+    se propaga a todas sus filas y el destino es la primera fila que cumple la máscara.
+    Si `min_gap_hours` es una secuencia, calcula todos los gaps sobre el mismo orden
+    y agrega la columna `min_gap_horas`.
+    """
+    needed = {
+        "id_tarjeta", "lat", "lon", "hora", "modo", "interno_bus",
+        "id_ramal", "etapa_red_sube"
+    }
+    missing = needed - set(df.columns)
+    if missing:
+        raise ValueError(f"Faltan columnas en cleaned.parquet: {missing}")
+
+    df = df[df["etapa_red_sube"] == 0].copy()
+    df["hora"] = pd.to_numeric(df["hora"], errors="coerce").astype("Int64")
+    df = df.dropna(subset=["id_tarjeta", "lat", "lon", "hora"])
+    df = df.sort_values(["id_tarjeta", "hora"]).reset_index(drop=True)
+
+    gaps = np.atleast_1d(min_gap_hours)
+    codigos, _ = pd.factorize(df["id_tarjeta"], sort=False)  # crecientes: df está ordenado
+    inicio = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]]) if len(df) else np.array([], int)
+
+    hora = df["hora"].to_numpy(dtype="int64")
+    lat = df["lat"].to_numpy(dtype=float)
+    lon = df["lon"].to_numpy(dtype=float)
+
+    # Origen de cada tarjeta difundido a todas sus filas
+    fila_origen = inicio[codigos]
+    otra_coord = ~((lat == lat[fila_origen]) & (lon == lon[fila_origen]))
+
+    partes = []
+    for gap in gaps:
+        pos = np.flatnonzero(otra_coord & (hora >= hora[fila_origen] + gap))
+        # primera coincidencia por tarjeta (pos está ordenado)
+        _, primeras = np.unique(codigos[pos], return_index=True)
+        destino = pos[primeras]
+        par = _pares_desde_filas(df, fila_origen[destino], destino)
+        if np.ndim(min_gap_hours) > 0:
+            par["min_gap_horas"] = gap
+        partes.append(par)
+
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def _pares_desde_filas(df: pd.DataFrame, filas_o: np.ndarray, filas_d: np.ndarray) -> pd.DataFrame:
+    o = df.iloc[filas_o]
+    d = df.iloc[filas_d]
+    return pd.DataFrame({
+        "id_tarjeta": o["id_tarjeta"].to_numpy(),
+
+        "lat_origen": o["lat"].to_numpy(dtype=float),
+        "lon_origen": o["lon"].to_numpy(dtype=float),
+        "hora_origen": o["hora"].to_numpy(dtype="int64"),
+        "modo_origen": o["modo"].to_numpy(),
+        "interno_origen": o["interno_bus"].to_numpy(),
+        "ramal_origen": o["id_ramal"].to_numpy(),
+
+        "lat_destino": d["lat"].to_numpy(dtype=float),
+        "lon_destino": d["lon"].to_numpy(dtype=float),
+        "hora_destino": d["hora"].to_numpy(dtype="int64"),
+        "modo_destino": d["modo"].to_numpy(),
+        "interno_destino": d["interno_bus"].to_numpy(),
+        "ramal_destino": d["id_ramal"].to_numpy(),
+    }, columns=OD_COLUMNS)
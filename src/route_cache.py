@@ -0,0 +1,132 @@
+"""
+Caché persistente de caminos mínimos, compartida entre la corrida observada y
+las réplicas del modelo nulo (que reparten los mismos nodos de destino).
+
+La clave es (fingerprint del grafo, peso, nodo origen, nodo destino); el valor
+es la secuencia de nodos (posiciones int32 en el CSRGraph de ese fingerprint)
+y la longitud. En disco es una tabla SQLite; adelante hay un LRU en memoria
+acotado en bytes: cada entrada cuesta sus nodos más COSTO_ENTRADA, así los
+pares sin camino (None) también cuentan.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = Path("data/interim/route_cache.sqlite")
+# bytes fijos por entrada del LRU: clave (tupla + 2 int), valor (tupla + float),
+# nodo del OrderedDict y cabecera del array de nodos
+COSTO_ENTRADA = 400
+
+
+class RouteCache:
+
+    def __init__(self, path, fingerprint, weight="length", max_bytes=256 << 20):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fingerprint = fingerprint
+        self.weight = weight
+        self.max_bytes = max_bytes
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rutas ("
+            " fp TEXT, weight TEXT, u INTEGER, v INTEGER, nodos BLOB, largo REAL,"
+            " PRIMARY KEY (fp, weight, u, v)) WITHOUT ROWID"
+        )
+
+    @classmethod
+    def for_graph(cls, path, graph, weight="length", **kwargs):
+        fp = graph.meta.get("fingerprint")
+        if fp is None:
+            from src.graph_store import fingerprint
+            fp = fingerprint(graph)
+        return cls(path, fp, weight=weight, **kwargs)
+
+    # ---------- LRU en memoria ----------
+    def _recordar(self, clave, valor):
+        if clave in self._lru:
+            return
+        camino, _ = valor
+        self._lru[clave] = valor
+        self._bytes += COSTO_ENTRADA + (0 if camino is None else camino.nbytes)
+        while self._bytes > self.max_bytes and self._lru:
+            _, (viejo, _) = self._lru.popitem(last=False)
+            self._bytes -= COSTO_ENTRADA + (0 if viejo is None else viejo.nbytes)
+
+    # ---------- API ----------
+    def get_many(self, origenes, destinos):
+        """
+        Busca los pares (u, v) en memoria y luego en disco.
+        Retorna (caminos, distancias, encontrados) alineados con la entrada;
+        en los no encontrados el camino es None y la distancia NaN.
+        """
+        n = len(origenes)
+        caminos = [None] * n
+        distancias = np.full(n, np.nan)
+        encontrados = np.zeros(n, dtype=bool)
+
+        faltan = {}
+        for k, clave in enumerate(zip(np.asarray(origenes).tolist(), np.asarray(destinos).tolist())):
+            valor = self._lru.get(clave)
+            if valor is not None:
+                self._lru.move_to_end(clave)
+                caminos[k], distancias[k] = valor
+                encontrados[k] = True
+                self.hits_memoria += 1
+            else:
+                faltan.setdefault(clave, []).append(k)
+
+        if faltan:
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS buscar (u INTEGER, v INTEGER)")
+            self._db.execute("DELETE FROM buscar")
+            self._db.executemany("INSERT INTO buscar VALUES (?, ?)", list(faltan))
+            filas = self._db.execute(
+                "SELECT r.u, r.v, r.nodos, r.largo FROM buscar b JOIN rutas r"
+                " ON r.fp = ? AND r.weight = ? AND r.u = b.u AND r.v = b.v",
+                (self.fingerprint, self.weight),
+            )
+            for u, v, blob, largo in filas:
+                camino = None if blob is None else np.frombuffer(blob, dtype=np.int32)
+                self._recordar((u, v), (camino, largo))
+                for k in faltan[(u, v)]:
+                    caminos[k], distancias[k] = camino, largo
+                    encontrados[k] = True
+                    self.hits_disco += 1
+
+        self.misses += int((~encontrados).sum())
+        return caminos, distancias, encontrados
+
+    def put_many(self, origenes, destinos, caminos, distancias):
+        filas = []
+        for u, v, camino, largo in zip(np.asarray(origenes).tolist(), np.asarray(destinos).tolist(),
+                                       caminos, np.asarray(distancias, dtype=float).tolist()):
+            camino = None if camino is None else np.asarray(camino, dtype=np.int32)
+            self._recordar((u, v), (camino, largo))
+            filas.append((self.fingerprint, self.weight, u, v,
+                          None if camino is None else camino.tobytes(), largo))
+        self._db.executemany("INSERT OR REPLACE INTO rutas VALUES (?, ?, ?, ?, ?, ?)", filas)
+        self._db.commit()
+
+    def stats(self) -> dict:
+        consultas = self.hits_memoria + self.hits_disco + self.misses
+        return {
+            "consultas": consultas,
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memoria + self.hits_disco) / consultas if consultas else 0.0,
+            "lru_items": len(self._lru),
+            "lru_bytes": self._bytes,
+        }
+
+    def close(self):
+        self._db.close()
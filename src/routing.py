@@ -1,11 +1,840 @@
+import heapq
+import math
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
 import networkx as nx
 import osmnx as ox
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
 from shapely.geometry import LineString, Point
+from tqdm import tqdm
+
+from src import metrics
+from src.barriers import annotate_crossings, load_barriers, load_line
+from src.checkpoint import DEFAULT_CHECKPOINT_DIR, CheckpointWriter, content_key
+from src.route_cache import DEFAULT_CACHE_PATH, RouteCache
+
+R_TIERRA_M = 6371008.8
+
+
+def shortest_path_line(a_lat, a_lon, b_lat, b_lon, network='drive', graph=None):
+    # Sin `graph`, usa (o arma una vez) el grafo de 5 km cacheado en disco
+    if graph is None:
+        from src.graph_store import load_or_build
+        graph = load_or_build(center=(a_lat, a_lon), dist_m=5000, network_type=network, tol_m=1000.0)
+    router = Router(graph)
+    nodos, _ = router.snap([a_lat, b_lat], [a_lon, b_lon])
+    route, _ = router.route(nodos[0], nodos[1])
+    if route is None:
+        raise nx.NetworkXNoPath(f"Sin camino entre {nodos[0]} y {nodos[1]}")
+    return router.geometry(route)  # (x,y) = (lng,lat)
+
+
+def od_center(df_od):
+    """Centroide simple de los pares OD (WGS84)."""
+    centro_lat = df_od[["lat_origen", "lat_destino"]].stack().mean()
+    centro_lon = df_od[["lon_origen", "lon_destino"]].stack().mean()
+    return float(centro_lat), float(centro_lon)
+
+
+def build_graph(df_od, dist_m=12000, network_type="drive"):
+    """Grafo OSMnx centrado en el centroide simple de los pares OD."""
+    return ox.graph_from_point(
+        od_center(df_od),
+        dist=dist_m,
+        network_type=network_type,
+        simplify=True
+    )
+
+
+class NodeSnapper:
+    """
+    Nodo más cercano del grafo para muchos puntos a la vez.
+
+    Proyecta los nodos una sola vez a metros (equirectangular local, suficiente
+    a escala de ciudad) y arma un KD-tree; `snap` resuelve todos los puntos en
+    una consulta vectorizada y devuelve ids de nodo y distancia en metros.
+    """
+
+    def __init__(self, node_ids, lat, lon):
+        self.node_ids = np.asarray(node_ids)
+        self.lat0 = float(np.mean(lat)) if len(lat) else 0.0
+        self.tree = cKDTree(self._proyectar(lat, lon))
+
+    @classmethod
+    def from_graph(cls, G):
+        ids, ys, xs = zip(*((n, d["y"], d["x"]) for n, d in G.nodes(data=True)))
+        return cls(np.array(ids), np.array(ys, dtype=float), np.array(xs, dtype=float))
+
+    def _proyectar(self, lat, lon):
+        lat = np.radians(np.asarray(lat, dtype=float))
+        lon = np.radians(np.asarray(lon, dtype=float))
+        return np.c_[R_TIERRA_M * lon * np.cos(np.radians(self.lat0)), R_TIERRA_M * lat]
+
+    def snap(self, lat, lon):
+        with metrics.timer("snap"):
+            dist, idx = self.tree.query(self._proyectar(lat, lon))
+        metrics.count("puntos_snap", len(idx))
+        return self.node_ids[idx], dist
+
+
+SNAP_COLUMNS = ["nodo_origen", "nodo_destino", "snap_m_origen", "snap_m_destino"]
+# columnas del OD que se copian a cada registro de route_records
+ROUTE_COLUMNS = ["od_id", "id_tarjeta", "hora_origen", "hora_destino", "lat_origen", "lon_origen",
+                 "lat_destino", "lon_destino", "nodo_origen", "nodo_destino", "snap_m_origen", "snap_m_destino"]
+
+
+def snap_od(df, snapper, max_snap_m=None):
+    """
+    Agrega a `df` las columnas de SNAP_COLUMNS (una sola consulta por extremo) y
+    `fuera_de_red`, que marca los pares con algún extremo a más de `max_snap_m`
+    metros del nodo más cercano.
+    """
+    df = df.copy()
+    for extremo in ("origen", "destino"):
+        nodos, dist = snapper.snap(df[f"lat_{extremo}"].to_numpy(), df[f"lon_{extremo}"].to_numpy())
+        df[f"nodo_{extremo}"] = nodos
+        df[f"snap_m_{extremo}"] = dist
+    return marcar_fuera_de_red(df, max_snap_m)
+
+
+def marcar_fuera_de_red(df, max_snap_m=None, graph=None):
+    """
+    Recalcula `fuera_de_red` a partir de las distancias de snap ya persistidas.
+    Con `graph` marca también los pares con algún nodo que no está en ese grafo
+    (p. ej. un snap hecho contra otro recorte): no se rutean en lugar de
+    abortar la corrida con el KeyError de index_of.
+    """
+    if max_snap_m is None:
+        df["fuera_de_red"] = False
+    else:
+        df["fuera_de_red"] = (df["snap_m_origen"] > max_snap_m) | (df["snap_m_destino"] > max_snap_m)
+    if graph is not None:
+        df["fuera_de_red"] |= ~graph.contains(df["nodo_origen"]) | ~graph.contains(df["nodo_destino"])
+    return df
+
+
+class CSRGraph:
+    """
+    Grafo vial como matriz CSR de scipy, con nodos ordenados por id.
+
+    Entre aristas paralelas se conserva la de menor peso y se descartan los
+    lazos. `x`/`y` son lon/lat de cada nodo, alineados con `node_ids`.
+    """
+
+    def __init__(self, node_ids, x, y, indptr, indices, weights):
+        self.node_ids = np.asarray(node_ids)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.indptr = np.asarray(indptr)
+        self.indices = np.asarray(indices)
+        self.weights = np.asarray(weights, dtype=float)
+        n = len(self.node_ids)
+        self.matrix = csr_matrix((self.weights, self.indices, self.indptr), shape=(n, n))
+        self.meta = {}
+        self.cache_dir = None
+        self._snapper = None
+
+    @classmethod
+    def from_networkx(cls, G, weight="length"):
+        ids = np.array(sorted(G.nodes))
+        x = np.array([G.nodes[n]["x"] for n in ids], dtype=float)
+        y = np.array([G.nodes[n]["y"] for n in ids], dtype=float)
+
+        aristas = list(G.edges(data=weight, default=np.nan))
+        u = np.searchsorted(ids, np.array([a[0] for a in aristas], dtype=ids.dtype))
+        v = np.searchsorted(ids, np.array([a[1] for a in aristas], dtype=ids.dtype))
+        w = np.array([a[2] for a in aristas], dtype=float)
+
+        # Sin lazos ni pesos faltantes; entre paralelas, la más corta
+        ok = (u != v) & np.isfinite(w)
+        u, v, w = u[ok], v[ok], w[ok]
+        orden = np.lexsort((w, v, u))
+        u, v, w = u[orden], v[orden], w[orden]
+        primera = np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+        u, v, w = u[primera], v[primera], w[primera]
+
+        # índices int32 (como los usa scipy): la matriz se arma sin copiar los arrays
+        indptr = np.zeros(len(ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(u, minlength=len(ids)), out=indptr[1:])
+        return cls(ids, x, y, indptr, v.astype(np.int32), w)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def snapper(self):
+        """NodeSnapper sobre los nodos del grafo (se construye una vez)."""
+        if self._snapper is None:
+            self._snapper = NodeSnapper(self.node_ids, self.y, self.x)
+        return self._snapper
+
+    def contains(self, node_ids) -> np.ndarray:
+        """Máscara de los ids de nodo que están en el grafo."""
+        node_ids = np.asarray(node_ids)
+        if not len(self.node_ids):
+            return np.zeros(len(node_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.node_ids, node_ids), len(self.node_ids) - 1)
+        return self.node_ids[pos] == node_ids
+
+    def index_of(self, node_ids):
+        """Posición interna de cada id de nodo (KeyError si alguno no está en el grafo, ver contains)."""
+        node_ids = np.asarray(node_ids).astype(self.node_ids.dtype)
+        pos = np.searchsorted(self.node_ids, node_ids)
+        pos = np.minimum(pos, len(self.node_ids) - 1)
+        faltan = self.node_ids[pos] != node_ids
+        if faltan.any():
+            raise KeyError(f"Nodos fuera del grafo: {node_ids[faltan][:5].tolist()}")
+        return pos
+
+
+def _camino_desde_predecesores(pred, origen, destino):
+    if origen == destino:
+        return np.array([origen])
+    if pred[destino] < 0:
+        return None
+    camino = [destino]
+    v = destino
+    while v != origen:
+        v = pred[v]
+        camino.append(v)
+    return np.array(camino[::-1])
+
+
+def unique_pairs(origenes, destinos):
+    """
+    Colapsa pares (origen, destino) repetidos (muchas tarjetas comparten parada).
+    Retorna (origenes_u, destinos_u, inversa): la fila i es el par único inversa[i].
+    """
+    pares = np.stack([np.asarray(origenes), np.asarray(destinos)], axis=1)
+    if len(pares) == 0:
+        vacio = np.array([], dtype=pares.dtype)
+        return vacio, vacio, np.array([], dtype=np.int64)
+    unicos, inversa = np.unique(pares, axis=0, return_inverse=True)
+    return unicos[:, 0], unicos[:, 1], inversa.ravel()
+
+
+def route_od(graph, origenes, destinos, batch=32, workers=1, cache=None, ch=None, pool=None):
+    """
+    Caminos mínimos para pares (origen, destino) dados como posiciones en `graph`.
+
+    Agrupa los pares por origen: corre un Dijkstra de scipy por cada origen
+    único (en lotes de `batch` orígenes, así la matriz de predecesores ocupa
+    batch × n) y reconstruye sólo los caminos de los destinos pedidos.
+    Con `workers` > 1 reparte los orígenes entre procesos (ver route_od_parallel),
+    los de `pool` (worker_pool) si se pasa uno.
+    Con `cache` (RouteCache) sólo se rutean los pares que no estén memorizados.
+    Con `ch` (src.ch.ContractionHierarchy) los pares van en un solo lote de
+    consultas compiladas a la jerarquía, en este proceso (sin workers).
+
+    Retorna (caminos, distancias): lista de arrays de posiciones de nodo (None si
+    no hay camino) y array de longitudes (inf si no hay camino), en el orden de entrada.
+    """
+    if cache is not None:
+        origenes = np.asarray(origenes)
+        destinos = np.asarray(destinos)
+        caminos, distancias, encontrados = cache.get_many(origenes, destinos)
+        faltan = np.flatnonzero(~encontrados)
+        if len(faltan):
+            nuevos, dist = route_od(graph, origenes[faltan], destinos[faltan], batch=batch, workers=workers, ch=ch,
+                                    pool=pool)
+            cache.put_many(origenes[faltan], destinos[faltan], nuevos, dist)
+            for k, camino in zip(faltan, nuevos):
+                caminos[k] = camino
+            distancias[faltan] = dist
+        return caminos, distancias
+    if ch is not None:
+        with metrics.timer("ch_consultas"):
+            return ch.route_many(origenes, destinos)
+    if workers > 1:
+        return route_od_parallel(graph, origenes, destinos, workers=workers, batch=batch, pool=pool)
+    origenes = np.asarray(origenes)
+    destinos = np.asarray(destinos)
+    caminos = [None] * len(origenes)
+    distancias = np.full(len(origenes), np.inf)
+
+    unicos, grupo = np.unique(origenes, return_inverse=True)
+    orden = np.argsort(grupo, kind="stable")
+    cortes = np.searchsorted(grupo[orden], np.arange(len(unicos) + 1))
+
+    medir = metrics.activo()
+    # con métricas, un Dijkstra por origen para medir la latencia de cada uno (scipy
+    # no comparte trabajo entre los orígenes de un lote: el costo total es el mismo)
+    paso = 1 if medir else batch
+    for ini in range(0, len(unicos), paso):
+        lote = unicos[ini:ini + paso]
+        t0 = time.perf_counter()
+        dist, pred = dijkstra(graph.matrix, directed=True, indices=lote, return_predecessors=True)
+        t1 = time.perf_counter()
+        for k, o in enumerate(lote):
+            filas = orden[cortes[ini + k]:cortes[ini + k + 1]]
+            for f in filas:
+                d = destinos[f]
+                distancias[f] = dist[k, d]
+                caminos[f] = _camino_desde_predecesores(pred[k], o, d)
+        if medir:
+            # latencia del origen: su Dijkstra + los caminos a todos sus destinos
+            t2 = time.perf_counter()
+            metrics.record("dijkstra", t1 - t0)
+            metrics.record("reconstruir_caminos", t2 - t1)
+            metrics.observe("latencia_origen_s", t2 - t0)
+    metrics.count("rutas", len(origenes))
+
+    return caminos, distancias
+
+
+
+def network_distance_matrix(graph, origenes, destinos, limit=np.inf, batch=32) -> csr_matrix:
+    """
+    Distancias de red muchos-a-muchos: matriz dispersa (len(origenes) × len(destinos))
+    con la longitud del camino mínimo de cada origen a cada destino (posiciones en
+    `graph`), sólo para los pares a menos de `limit` (en unidades del peso).
+
+    Un Dijkstra multi-origen de scipy por lote de `batch` orígenes, cortado en
+    `limit`: no se reconstruyen caminos. Los ceros (origen == destino) se guardan
+    explícitos: un par ausente es "más lejos que limit / sin camino", no distancia 0.
+    """
+    origenes = np.asarray(origenes)
+    destinos = np.asarray(destinos)
+    filas, columnas, datos = [], [], []
+    for ini in range(0, len(origenes), batch):
+        dist = dijkstra(graph.matrix, directed=True, indices=origenes[ini:ini + batch], limit=limit)[:, destinos]
+        f, c = np.nonzero(np.isfinite(dist))
+        filas.append(f + ini)
+        columnas.append(c)
+        datos.append(dist[f, c])
+
+    filas = np.concatenate(filas) if filas else np.array([], np.int64)
+    indptr = np.zeros(len(origenes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(filas, minlength=len(origenes)), out=indptr[1:])
+    indices = np.concatenate(columnas) if columnas else np.array([], np.int64)
+    datos = np.concatenate(datos) if datos else np.array([], float)
+    return csr_matrix((datos, indices, indptr), shape=(len(origenes), len(destinos)))
+
+
+def csr_lookup(matrix, filas, columnas, faltante=np.inf):
+    """Valores matrix[filas[k], columnas[k]] de una CSR con columnas ordenadas; `faltante` si no está."""
+    filas = np.asarray(filas, dtype=np.int64)
+    columnas = np.asarray(columnas, dtype=np.int64)
+    n_col = matrix.shape[1]
+    claves = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr)) * n_col + matrix.indices
+    buscadas = filas * n_col + columnas
+    pos = np.minimum(np.searchsorted(claves, buscadas), max(len(claves) - 1, 0))
+    out = np.full(len(filas), faltante, dtype=float)
+    if len(claves):
+        ok = claves[pos] == buscadas
+        out[ok] = matrix.data[pos[ok]]
+    return out
+
+# ---------- Ruteo en paralelo ----------
+_GRAFO_WORKER = None
+
+@contextmanager
+def _grafo_compartido(graph):
+    """
+    Describe cómo abre el grafo cada worker sin recibir una copia serializada:
+    si viene de la caché en disco, cada proceso lo mapea con mmap; si no, los
+    arrays se copian una vez a bloques de multiprocessing.shared_memory.
+    """
+    if graph.cache_dir is not None:
+        yield ("mmap", str(graph.cache_dir))
+        return
+    bloques, descriptor = [], {}
+    try:
+        for nombre in ["node_ids", "x", "y", "indptr", "indices", "weights"]:
+            arr = np.ascontiguousarray(getattr(graph, nombre))
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            bloques.append(shm)
+            descriptor[nombre] = (shm.name, arr.shape, arr.dtype.str)
+        yield ("shm", descriptor)
+    finally:
+        for shm in bloques:
+            shm.close()
+            shm.unlink()
+
+def _adjuntar_shm(nombre):
+    """
+    Bloque de memoria compartida existente, sin registrarlo en el resource tracker:
+    en Python < 3.13 adjuntarse lo registra (bpo-39959) y un worker con tracker
+    propio lo liberaría al salir o avisaría "leaked shared_memory". Tampoco se
+    puede desregistrar después: con fork el tracker es el del padre, y su unlink
+    fallaría. Sólo el padre (_grafo_compartido) es dueño del bloque y lo libera.
+    """
+    try:
+        return shared_memory.SharedMemory(name=nombre, track=False)  # Python >= 3.13
+    except TypeError:
+        pass
+    registrar = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=nombre)
+    finally:
+        resource_tracker.register = registrar
+
+def _init_worker_grafo(fuente):
+    global _GRAFO_WORKER
+    tipo, datos = fuente
+    if tipo == "mmap":
+        from src.graph_store import load_graph
+        _GRAFO_WORKER = load_graph(datos)
+        return
+    bloques, arrays = [], {}
+    for nombre, (shm_name, shape, dtype) in datos.items():
+        shm = _adjuntar_shm(shm_name)
+        bloques.append(shm)
+        arrays[nombre] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _GRAFO_WORKER = CSRGraph(**arrays)
+    _GRAFO_WORKER._shm = bloques
+
+def _route_chunk(tarea):
+    filas, origenes, destinos, batch = tarea
+    caminos, dist = route_od(_GRAFO_WORKER, origenes, destinos, batch=batch)
+    # caminos planos + largos: un solo array por lote en vez de miles de objetos
+    largos = np.array([0 if c is None else len(c) for c in caminos], dtype=np.int64)
+    plano = np.concatenate([c for c in caminos if c is not None] or [np.array([], np.int64)])
+    return filas, plano, largos, dist
+
+def origin_blocks(origenes, tamano) -> list[slice]:
+    """
+    Bloques consecutivos de ~`tamano` filas de `origenes` (ordenados) que no parten
+    un mismo origen: cada nodo de origen cae en un solo bloque. Un bloque se
+    alarga hasta el final de su último origen.
+    """
+    origenes = np.asarray(origenes)
+    inicios = np.flatnonzero(np.r_[True, origenes[1:] != origenes[:-1]])
+    bloques, ini = [], 0
+    while ini < len(origenes):
+        k = np.searchsorted(inicios, ini + tamano)
+        fin = int(inicios[k]) if k < len(inicios) else len(origenes)
+        bloques.append(slice(ini, fin))
+        ini = fin
+    return bloques
+
+def _chunks_por_origen(origenes, n_chunks):
+    """Particiona las filas en ~n_chunks lotes sin partir grupos de un mismo origen."""
+    orden = np.argsort(origenes, kind="stable")
+    o = origenes[orden]
+    cortes_grupo = np.flatnonzero(np.r_[True, o[1:] != o[:-1]])
+    objetivo = np.linspace(0, len(o), n_chunks + 1)[1:-1]
+    cortes = np.unique(cortes_grupo[np.minimum(np.searchsorted(cortes_grupo, objetivo), len(cortes_grupo) - 1)])
+    return [c for c in np.split(orden, cortes) if len(c)]
+
+@contextmanager
+def worker_pool(graph, workers):
+    """
+    Pool de `workers` procesos con el grafo ya cargado (mmap de la caché o memoria
+    compartida), para reusar en todas las llamadas de una corrida en lugar de
+    levantar procesos por lote. None con workers <= 1.
+    """
+    if workers <= 1:
+        yield None
+        return
+    with _grafo_compartido(graph) as fuente, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker_grafo, initargs=(fuente,)
+    ) as ex:
+        yield ex
+
+def route_od_parallel(graph, origenes, destinos, workers=2, batch=32, chunks_por_worker=4, pool=None):
+    """
+    Igual que route_od pero repartiendo lotes de orígenes entre `workers` procesos
+    (los de `pool`, de worker_pool sobre el mismo grafo; sin él se crea uno para esta llamada).
+
+    Los pares se agrupan por nodo de origen (un grupo nunca se parte entre lotes),
+    los resultados vuelven en el orden en que terminan y se ubican por fila, así
+    la salida es idéntica a la secuencial.
+    """
+    origenes = np.asarray(origenes)
+    destinos = np.asarray(destinos)
+    caminos = [None] * len(origenes)
+    distancias = np.full(len(origenes), np.inf)
+    if len(origenes) == 0:
+        return caminos, distancias
+
+    if pool is None:
+        with worker_pool(graph, max(workers, 2)) as pool:
+            return route_od_parallel(graph, origenes, destinos, workers, batch, chunks_por_worker, pool=pool)
+
+    lotes = _chunks_por_origen(origenes, workers * chunks_por_worker)
+    futuros = [pool.submit(_route_chunk, (f, origenes[f], destinos[f], batch)) for f in lotes]
+    for fut in as_completed(futuros):
+        filas, plano, largos, dist = fut.result()
+        distancias[filas] = dist
+        partes = np.split(plano, np.cumsum(largos)[:-1])
+        for f, largo, camino in zip(filas, largos, partes):
+            if largo:
+                caminos[f] = camino
+
+    return caminos, distancias
+
+
+# ---------- Router ----------
+def _haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R_TIERRA_M * np.arcsin(np.sqrt(a))
+
+
+class LazyGeometries(Sequence):
+    """
+    Geometrías de un lote de rutas, construidas recién cuando se piden.
+
+    `caminos` son los de los pares únicos y `pares[i]` ubica el par de la fila i:
+    las filas que repiten un par comparten la misma LineString. Los pares sin
+    camino (o con origen = destino, un solo nodo) dan None.
+    """
+
+    def __init__(self, graph, caminos, pares):
+        self.graph = graph
+        self.caminos = caminos
+        self.pares = np.asarray(pares)
+        self._geoms = None
+
+    def __len__(self):
+        return len(self.pares)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            sub = LazyGeometries(self.graph, self.caminos, self.pares[i])
+            sub._geoms = self._geoms
+            return sub
+        k = self.pares[i]
+        if self._geoms is not None:
+            return self._geoms[k]
+        camino = self.caminos[k]
+        return None if camino is None or len(camino) < 2 else LineString(np.c_[self.graph.x[camino], self.graph.y[camino]])
+
+    def camino(self, i):
+        return self.caminos[self.pares[i]]
+
+    def unicas(self) -> np.ndarray:
+        """Geometría de cada par único (array de objetos), en una sola llamada vectorizada a shapely."""
+        if self._geoms is None:
+            validos = [k for k, c in enumerate(self.caminos) if c is not None and len(c) > 1]
+            self._geoms = np.full(len(self.caminos), None, dtype=object)
+            if validos:
+                nodos = np.concatenate([self.caminos[k] for k in validos])
+                largos = [len(self.caminos[k]) for k in validos]
+                self._geoms[validos] = shapely.linestrings(np.c_[self.graph.x[nodos], self.graph.y[nodos]],
+                                                           indices=np.repeat(np.arange(len(validos)), largos))
+        return self._geoms
+
+
+def route_records(df, rutas, traza, columnas=ROUTE_COLUMNS, columna_cruce="cruza_sarmiento", guardar_nodos=False):
+    """
+    Un registro por fila de `df` con ruta, a partir de las LazyGeometries de
+    Router.route_many (alineadas con df): las `columnas` del OD (vacías si df no
+    las trae), la geometría `ruta` y si cruza `traza` en `columna_cruce`; con
+    `guardar_nodos`, también los ids de nodo del camino. Geometría y cruce se
+    calculan una vez por par único. Las filas sin ruta (sin camino u origen =
+    destino) se descartan.
+    """
+    geoms = rutas.unicas()
+    hay = geoms != None  # noqa: E711 (comparación elemento a elemento)
+    cruza = np.zeros(len(geoms), dtype=bool)
+    cruza[hay] = shapely.crosses(geoms[hay], traza)
+    ok = hay[rutas.pares]
+
+    out = df.loc[ok].reindex(columns=columnas).reset_index(drop=True)
+    out["ruta"] = geoms[rutas.pares[ok]]
+    out[columna_cruce] = cruza[rutas.pares[ok]]
+    if guardar_nodos:
+        out["nodos"] = [rutas.graph.node_ids[rutas.camino(i)] for i in np.flatnonzero(ok)]
+    return out
+
+
+class Router:
+    """
+    Ruteo sobre un grafo cargado una vez: índice de nodos, pesos y caché de caminos.
+
+      route(a, b)                     A* bidireccional para una consulta suelta
+      route_many(origenes, destinos)  lotes: pares únicos + Dijkstra agrupado por origen (route_od)
+      distance_many(origenes, destinos)  sólo longitudes, sin reconstruir caminos
+
+    Con `ch` (True o una ContractionHierarchy de src.ch) las tres consultan la
+    jerarquía, que con True se carga de la caché del grafo o se arma una vez.
+    Con `workers` > 1, `pool` (worker_pool) es el pool de procesos de toda la corrida.
+
+    Los nodos se piden por id y los caminos salen como posiciones en `graph`
+    (como route_od); con geometria=True, route_many devuelve LazyGeometries.
+
+    La heurística del A* es la distancia de gran círculo al destino escalada por
+    el menor cociente peso / haversine de las aristas (y 0.999, por redondeo):
+    así ninguna arista pesa menos que lo que la heurística descuenta y la cota
+    es admisible y consistente aunque los pesos no sean metros.
+    """
+
+    def __init__(self, graph, cache=None, workers=1, batch=32, ch=None, pool=None):
+        self.graph = graph
+        self.cache = cache
+        self.workers = workers
+        self.pool = pool
+        self.batch = batch
+        self._ch = ch or None
+        self._adyacencias = None
+        self._escala = None
+
+    @classmethod
+    def from_networkx(cls, G, weight="length", **kwargs):
+        return cls(CSRGraph.from_networkx(G, weight=weight), **kwargs)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def snap(self, lat, lon):
+        return self.graph.snapper.snap(lat, lon)
+
+    def index_of(self, node_ids):
+        return self.graph.index_of(node_ids)
+
+    @property
+    def ch(self):
+        """ContractionHierarchy en uso (None sin `ch`)."""
+        if self._ch is True:
+            from src.ch import load_or_build_ch
+            self._ch = load_or_build_ch(self.graph)
+        return self._ch
+
+    def geometry(self, camino) -> LineString:
+        return LineString(np.c_[self.graph.x[camino], self.graph.y[camino]])
+
+    # ---------- Consultas ----------
+    def route(self, a, b):
+        """Camino mínimo entre los nodos `a` y `b` (ids): (posiciones, longitud); (None, inf) si no hay."""
+        s, t = (int(p) for p in self.index_of([a, b]))
+        if self.cache is not None:
+            (camino,), (largo,), (encontrado,) = self.cache.get_many([s], [t])
+            if encontrado:
+                return camino, largo
+        if self.ch is not None:
+            camino, largo = self.ch.route(s, t)     # cuenta y mide la consulta
+        else:
+            t0 = time.perf_counter()
+            with metrics.timer("astar"):
+                camino, largo = self._astar(s, t)
+            metrics.observe("latencia_ruta_s", time.perf_counter() - t0)
+            metrics.count("rutas")
+        if self.cache is not None:
+            self.cache.put_many([s], [t], [camino], [largo])
+        return camino, largo
+
+    def route_many(self, origenes, destinos, geometria=False):
+        """
+        Caminos mínimos por fila para nodos (ids) de origen y destino. Cada par
+        distinto se rutea una vez (con caché y workers del Router). Retorna
+        (caminos, distancias) en el orden de entrada, o (LazyGeometries, distancias)
+        con geometria=True.
+        """
+        uo, ud, pares = unique_pairs(self.index_of(origenes), self.index_of(destinos))
+        caminos, distancias = route_od(self.graph, uo, ud, batch=self.batch, workers=self.workers, cache=self.cache,
+                                       ch=self.ch, pool=self.pool)
+        if geometria:
+            return LazyGeometries(self.graph, caminos, pares), distancias[pares]
+        return [caminos[k] for k in pares], distancias[pares]
+
+    def distance_many(self, origenes, destinos) -> np.ndarray:
+        """Longitud del camino mínimo por fila (inf si no hay): Dijkstra por origen único (o CH), sin predecesores."""
+        uo, ud, pares = unique_pairs(self.index_of(origenes), self.index_of(destinos))
+        distancias = np.full(len(uo), np.inf)
+        faltan = np.arange(len(uo))
+        if self.cache is not None and len(uo):
+            _, dist, encontrados = self.cache.get_many(uo, ud)
+            distancias[encontrados] = dist[encontrados]
+            faltan = np.flatnonzero(~encontrados)
+        if self.ch is not None:
+            distancias[faltan] = self.ch.distance_many(uo[faltan], ud[faltan])
+            return distancias[pares]
+        unicos, grupo = np.unique(uo[faltan], return_inverse=True)
+        for ini in range(0, len(unicos), self.batch):
+            dist = dijkstra(self.graph.matrix, directed=True, indices=unicos[ini:ini + self.batch])
+            en_lote = (grupo >= ini) & (grupo < ini + self.batch)
+            distancias[faltan[en_lote]] = dist[grupo[en_lote] - ini, ud[faltan[en_lote]]]
+        return distancias[pares]
+
+    # ---------- A* bidireccional ----------
+    def _adyacencia(self):
+        """Listas de Python (CSR directo y traspuesto): indexarlas es mucho más rápido que a numpy."""
+        if self._adyacencias is None:
+            inversa = self.graph.matrix.T.tocsr()
+            self._adyacencias = [
+                (m.indptr.tolist(), m.indices.tolist(), m.data.tolist()) for m in (self.graph.matrix, inversa)
+            ]
+        return self._adyacencias
+
+    @property
+    def escala(self) -> float:
+        """Factor de la heurística: min(1, peso / haversine) sobre las aristas, × 0.999."""
+        if self._escala is None:
+            g = self.graph
+            u = np.repeat(np.arange(len(g)), np.diff(g.indptr))
+            hav = _haversine_m(g.y[u], g.x[u], g.y[g.indices], g.x[g.indices])
+            ok = hav > 0
+            self._escala = 0.999 * float(min(1.0, np.min(g.weights[ok] / hav[ok], initial=np.inf)))
+        return self._escala
+
+    def _astar(self, s, t):
+        if s == t:
+            return np.array([s]), 0.0
+        (ip_f, ix_f, w_f), (ip_r, ix_r, w_r) = self._adyacencia()
+        lat = np.radians(self.graph.y)
+        lon = np.radians(self.graph.x)
+        k = self.escala * R_TIERRA_M
+        cos_s, cos_t = math.cos(lat[s]), math.cos(lat[t])
+        lat_s, lon_s, lat_t, lon_t = float(lat[s]), float(lon[s]), float(lat[t]), float(lon[t])
+        potenciales = {}
+
+        def potencial(v):
+            # balanceado: (h_t - h_s) / 2, con h_x = escala × gran círculo a x
+            p = potenciales.get(v)
+            if p is None:
+                la, lo = float(lat[v]), float(lon[v])
+                c = math.cos(la)
+                a_t = math.sin((lat_t - la) / 2) ** 2 + c * cos_t * math.sin((lon_t - lo) / 2) ** 2
+                a_s = math.sin((lat_s - la) / 2) ** 2 + c * cos_s * math.sin((lon_s - lo) / 2) ** 2
+                p = k * (math.asin(math.sqrt(min(a_t, 1.0))) - math.asin(math.sqrt(min(a_s, 1.0))))
+                potenciales[v] = p
+            return p
+
+        # lado 0: desde s sobre el grafo; lado 1: desde t sobre el traspuesto (potencial con signo opuesto)
+        dist = ({s: 0.0}, {t: 0.0})
+        pred = ({s: -1}, {t: -1})
+        cerrados = (set(), set())
+        colas = ([(potencial(s), s)], [(-potencial(t), t)])
+        adyacencia = ((ip_f, ix_f, w_f), (ip_r, ix_r, w_r))
+        signo = (1.0, -1.0)
+        mejor, encuentro = math.inf, -1
+
+        while colas[0] and colas[1]:
+            if colas[0][0][0] + colas[1][0][0] >= mejor:
+                break
+            lado = 0 if colas[0][0][0] <= colas[1][0][0] else 1
+            _, v = heapq.heappop(colas[lado])
+            if v in cerrados[lado]:
+                continue
+            cerrados[lado].add(v)
+            d_v, otro = dist[lado][v], dist[1 - lado]
+            indptr, indices, pesos = adyacencia[lado]
+            for e in range(indptr[v], indptr[v + 1]):
+                x = indices[e]
+                nd = d_v + pesos[e]
+                if nd < dist[lado].get(x, math.inf):
+                    dist[lado][x] = nd
+                    pred[lado][x] = v
+                    heapq.heappush(colas[lado], (nd + signo[lado] * potencial(x), x))
+                    if x in otro and nd + otro[x] < mejor:
+                        mejor, encuentro = nd + otro[x], x
+
+        if encuentro < 0:
+            return None, math.inf
+        ida, v = [], encuentro
+        while v >= 0:
+            ida.append(v)
+            v = pred[0][v]
+        vuelta, v = [], pred[1][encuentro]
+        while v >= 0:
+            vuelta.append(v)
+            v = pred[1][v]
+        return np.array(ida[::-1] + vuelta), mejor
+
+
+def add_route_args(parser):
+    """Opciones de ruteo compartidas por 30_route_paths.py y 41_route_paths_null.py (ver route_frame)."""
+    parser.add_argument("--max-snap-m", type=float, default=500.0,
+                        help="Distancia máxima al nodo más cercano; más lejos el par no se rutea (default: 500)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de ruteo; el grafo se comparte vía mmap de la caché (default: 1)")
+    parser.add_argument("--cache-rutas", default=str(DEFAULT_CACHE_PATH),
+                        help=f"Caché persistente de caminos (u, v), compartida con los nulos (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--sin-cache-rutas", action="store_true",
+                        help="Rutea todo sin consultar ni actualizar la caché de caminos")
+    parser.add_argument("--ch", action="store_true",
+                        help="Consultas punto a punto con contraction hierarchy (requiere numba; se arma una vez "
+                             "y se guarda junto al grafo en la caché). Conviene con pocos pares por origen; con "
+                             "muchos, el Dijkstra agrupado es más rápido: medir con "
+                             "`benchmarks/bench_pipeline.py --etapas ruteo ch`. No admite --workers")
+    parser.add_argument("--solo-cruces", action="store_true",
+                        help="Sin geometrías: cruces por línea desde flags por arista (alcanza para el Barrier Score)")
+    parser.add_argument("--guardar-nodos", action="store_true",
+                        help="Agrega la columna `nodos` (ids de nodo del camino) a la salida")
+    parser.add_argument("--checkpoint-cada", type=int, default=5000,
+                        help="Pares por bloque de checkpoint, aprox.: un bloque no parte un nodo de origen (default: 5000)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Retoma desde el checkpoint de una corrida cortada, salteando los pares ya ruteados")
+    return parser
+
+
+def route_frame(df, graph, args, out_path, entrada, lineas_path, columnas=ROUTE_COLUMNS):
+    """
+    Rutea los pares OD de `df` sobre `graph` con las opciones de add_route_args y
+    compacta el resultado en `out_path` (GeoParquet). Retorna el DataFrame de rutas.
+
+    Snap a nodos (o reutiliza el de 25_snap_od.py), orden por (origen, destino) y
+    bloques de checkpoint cortados entre orígenes (origin_blocks): cada nodo de
+    origen cae en un solo bloque (un solo Dijkstra) y los pares repetidos quedan
+    juntos. `entrada` identifica el OD en el checkpoint (se le agrega content_key);
+    `lineas_path` es el GeoJSON de ferrocarriles (Sarmiento, o todas las líneas
+    con --solo-cruces) y `columnas` las del OD que se copian a cada registro.
+    """
+    # Snap a nodos: una sola consulta al KD-tree (o columnas heredadas del OD)
+    if set(SNAP_COLUMNS) <= set(df.columns):
+        df = marcar_fuera_de_red(df, args.max_snap_m, graph)
+    else:
+        df = snap_od(df, graph.snapper, max_snap_m=args.max_snap_m)
+    print(f"→ Pares fuera de red (> {args.max_snap_m:g} m o nodo fuera del grafo, no se rutean): "
+          f"{int(df['fuera_de_red'].sum()):,}")
+
+    df["od_id"] = np.arange(len(df)) if "od_id" not in df.columns else df["od_id"]
+    df = df[~df["fuera_de_red"]].sort_values(["nodo_origen", "nodo_destino"], kind="stable")
+    # unique_pairs deduplica dentro de cada bloque del checkpoint (Router.route_many);
+    # entre bloques solo la caché de rutas evita re-rutear un par repetido. Como el
+    # orden es por (origen, destino), esta cifra global es la cota que se alcanza.
+    n_unicos = len(unique_pairs(df["nodo_origen"], df["nodo_destino"])[0])
+    print(f"→ Pares (nodo_origen, nodo_destino) únicos: {n_unicos:,} de {len(df):,} filas "
+          f"(reducción {1 - n_unicos / max(len(df), 1):.1%})")
+    metrics.info(pares_en_red=len(df), pares_unicos=n_unicos)
+
+    # Checkpoints: un Parquet por bloque + manifest de od_id, retomable con --resume
+    ckpt = CheckpointWriter(DEFAULT_CHECKPOINT_DIR / Path(out_path).stem, entrada=f"{entrada}:{content_key(df)}",
+                            resume=args.resume)
+    hechos = ckpt.completados()
+    if hechos:
+        print(f"→ Retomando: {len(hechos):,} pares ya ruteados en el checkpoint")
+        df = df[~df["od_id"].isin(hechos)]
+
+    print(f"→ Ruteando ({'contraction hierarchy' if args.ch else 'Dijkstra agrupado por nodo de origen'})…")
+    cache = None if args.sin_cache_rutas else RouteCache.for_graph(args.cache_rutas, graph)
+    barreras = load_barriers(lineas_path) if args.solo_cruces else None
+    traza = None if args.solo_cruces else load_line(lineas_path)
+    # un solo pool de procesos para toda la corrida (no uno por bloque)
+    with worker_pool(graph, args.workers) as pool, tqdm(total=len(df)) as barra:
+        router = Router(graph, cache=cache, workers=args.workers, ch=args.ch, pool=pool)
+        for filas in origin_blocks(df["nodo_origen"], args.checkpoint_cada):
+            bloque = df.iloc[filas]
+            rutas, _ = router.route_many(bloque["nodo_origen"], bloque["nodo_destino"], geometria=not args.solo_cruces)
+            if args.solo_cruces:
+                df_bloque = annotate_crossings(bloque, graph, rutas, barreras)
+                if args.guardar_nodos:
+                    df_bloque["nodos"] = [graph.node_ids[c] for c in rutas if c is not None and len(c) > 1]
+            else:
+                with metrics.timer("geometrias"):
+                    df_bloque = route_records(bloque, rutas, traza, columnas=columnas, guardar_nodos=args.guardar_nodos)
+                if len(df_bloque) < len(bloque):
+                    print(f"[Aviso] {len(bloque) - len(df_bloque):,} pares sin ruta (sin camino u origen = destino)")
+            ckpt.write(df_bloque, bloque["od_id"])
+            barra.update(len(bloque))
+    if cache is not None:
+        st = cache.stats()
+        metrics.info(cache_rutas=st)
+        print(f"   Caché de caminos: {st['hit_rate']:.1%} hits ({st['misses']:,} ruteados)")
+        cache.close()
 
-def shortest_path_line(a_lat, a_lon, b_lat, b_lon, network='drive'):
-    G = ox.graph_from_point((a_lat, a_lon), dist=5000, network_type=network)
-    on = ox.nearest_nodes(G, a_lon, a_lat)
-    dn = ox.nearest_nodes(G, b_lon, b_lat)
-    route = nx.shortest_path(G, on, dn, weight='length')
-    coords = [(G.nodes[n]['y'], G.nodes[n]['x']) for n in route]
-    return LineString([(lng, lat) for lat, lng in coords])  # (x,y) = (lng,lat)
+    # Compactación: une las partes del checkpoint en la salida final
+    return ckpt.compact(out_path)
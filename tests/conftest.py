@@ -0,0 +1,26 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+
+def make_grid_graph(n=12, lat0=-34.66, lon0=-58.48, step=0.004, seed=0):
+    """Grilla n × n bidireccional con longitudes (m) >= distancia entre nodos y ruido continuo."""
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    for i in range(n):
+        for j in range(n):
+            G.add_node(1000 + i * n + j, y=lat0 + i * step, x=lon0 + j * step)
+    for i in range(n):
+        for j in range(n):
+            u = 1000 + i * n + j
+            vecinos = ([u + 1] if j < n - 1 else []) + ([u + n] if i < n - 1 else [])
+            for v in vecinos:
+                largo = 450.0 * (1 + rng.random())
+                G.add_edge(u, v, length=largo)
+                G.add_edge(v, u, length=largo * (1 + 0.1 * rng.random()))
+    return G
+
+
+@pytest.fixture
+def grid_graph():
+    return make_grid_graph()
@@ -1,4 +1,86 @@
-from src.barriers import barrier_score
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import LineString, MultiLineString, Polygon
+from src.barriers import (
+    barrier_score, crossing_direction, crossing_matrix, direction_labels, edge_crossings, load_line,
+    route_crossings, side_of_line,
+)
+from src.routing import CSRGraph, route_od
 
 def test_barrier_score_simple():
     assert abs(barrier_score(8, 10) - 0.2) < 1e-9
+
+def test_crossing_matrix_matches_crosses():
+    rng = np.random.default_rng(0)
+    rutas = [LineString(rng.uniform(0, 10, (4, 2))) for _ in range(300)]
+    barreras = [
+        LineString([(0, 5), (10, 5)]),
+        MultiLineString([[(5, 0), (5, 4)], [(5, 6), (5, 10)]]),
+    ]
+    M = crossing_matrix(rutas, barreras).toarray()
+    esperado = np.array([[r.crosses(b) for b in barreras] for r in rutas])
+    assert M.shape == (300, 2)
+    assert np.array_equal(M, esperado)
+
+def test_route_crossings_match_route_geometry(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    barreras = [
+        LineString([(-58.49, -34.641), (-58.42, -34.628)]),
+        LineString([(-58.4613, -34.67), (-58.4577, -34.60)]),
+    ]
+    rng = np.random.default_rng(2)
+    o = rng.integers(0, len(g), 200)
+    d = rng.integers(0, len(g), 200)
+    caminos, _ = route_od(g, o, d)
+    caminos = [c for c in caminos if c is not None and len(c) > 1]
+
+    cuenta = route_crossings(g, caminos, edge_crossings(g, barreras))
+    for c, fila in zip(caminos, cuenta):
+        ruta = LineString(np.c_[g.x[c], g.y[c]])
+        assert [fila[k] > 0 for k in range(2)] == [ruta.crosses(b) for b in barreras]
+
+def test_side_of_line_matches_side_polygon():
+    # Trazado en zigzag de x=0 a x=10, en dos tramos con orientación opuesta
+    xy = np.c_[np.linspace(0, 10, 11), 5 + np.r_[0, 1, -1, 2, 0, 1, -2, 0, 1, 0, 0] * 0.8]
+    barrera = MultiLineString([xy[:6][::-1], xy[5:]])
+    norte = Polygon(np.r_[xy, [[10, 20], [0, 20]]])
+
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 10, 2000), rng.uniform(0, 10, 2000)
+    lado = side_of_line(barrera, x, y)
+    assert np.array_equal(lado == 1, shapely.contains_xy(norte, x, y))
+    assert set(np.unique(lado)) <= {-1, 1}
+
+    d = crossing_direction(barrera, [1.0, 1.0, 1.0], [0.5, 9.5, 0.5], [9.0, 9.0, 9.0], [9.5, 0.5, 0.2])
+    assert d.tolist() == ["sur_norte", "norte_sur", "mismo_lado"]
+
+def test_side_of_line_tramos_disjuntos_y_meridional():
+    # Dos tramos separados (line_merge no los une) de una misma recta, dibujados en sentidos opuestos
+    barrera = MultiLineString([[(4, 5.2), (0, 5)], [(6, 5.3), (10, 5.5)]])
+    assert len(shapely.get_parts(shapely.line_merge(barrera))) == 2
+    norte = Polygon([(0, 5), (10, 5.5), (10, 20), (0, 20)])
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(0, 10, 1000), rng.uniform(0, 10, 1000)
+    assert np.array_equal(side_of_line(barrera, x, y) == 1, shapely.contains_xy(norte, x, y))
+
+    # Casi vertical: +1 es el este, para cualquier sentido de dibujo
+    for xy in ([(5, 0), (5.01, 10)], [(5.01, 10), (5, 0)], [(5, 10), (5.01, 0)]):
+        via = LineString(xy)
+        assert direction_labels(via) == ("oeste_este", "este_oeste")
+        assert side_of_line(via, [2.0, 8.0], [5.0, 5.0]).tolist() == [-1, 1]
+        assert crossing_direction(via, [2.0], [5.0], [8.0], [5.0]).tolist() == ["oeste_este"]
+
+    # Puntos no finitos: lado 0, sin romper al resto
+    assert side_of_line(barrera, [np.nan, 2.0], [5.0, 9.0]).tolist() == [0, 1]
+
+def test_load_line(tmp_path):
+    path = tmp_path / "trenes.geojson"
+    gpd.GeoDataFrame({"Linea": ["Sarmiento", "Mitre"]},
+                     geometry=[LineString([(0, 0), (1, 0)]), LineString([(0, 1), (0, 2)])], crs="EPSG:4326").to_file(path)
+    assert load_line(path).equals(LineString([(0, 0), (1, 0)]))
+    with pytest.warns(UserWarning):
+        assert load_line(path, "roca").length == 2
+    with pytest.raises(FileNotFoundError):
+        load_line(tmp_path / "no.geojson")
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from src.barriers import barrier_score
+from src.bs_stats import bootstrap_bs, conteos_nulos, estadisticas_bs, observados, patrones_observados
+
+NOMBRES = ["Mitre", "Sarmiento", "Roca"]
+
+def _tabla(modelo, n, rng):
+    ruta_id = rng.integers(0, n, n // 2)
+    return pd.DataFrame({
+        "modelo": modelo,
+        "ruta_id": ruta_id,
+        "barrera": rng.choice(NOMBRES[:2], len(ruta_id)),  # Roca sin cruces
+        "direccion": rng.choice(["sur_norte", "norte_sur", "horizontal"], len(ruta_id)),
+    })
+
+def test_patrones_y_conteos_igual_a_groupby():
+    rng = np.random.default_rng(0)
+    n = 500
+    real = _tabla("real", n, rng)
+    tabla = pd.concat([real] + [_tabla(f"nulo_{k}", n, rng) for k in range(4)], ignore_index=True)
+
+    patrones = patrones_observados(real, NOMBRES, n)
+    assert all(f.sum() == n for _, f in patrones)
+    obs = observados(patrones)
+    nulos = conteos_nulos(tabla, [f"nulo_{k}" for k in range(4)], NOMBRES)
+    for b, nombre in enumerate(NOMBRES):
+        sub = real[real["barrera"] == nombre]
+        assert obs[b, 0] == len(sub)
+        assert obs[b, 1] == (sub["direccion"] == "sur_norte").sum()
+        assert obs[b, 2] == (sub["direccion"] == "norte_sur").sum()
+        for k in range(4):
+            assert nulos[k, b, 0] == ((tabla["modelo"] == f"nulo_{k}") & (tabla["barrera"] == nombre)).sum()
+
+    # agrupado por tarjeta: mismos totales, menos unidades
+    grupos = np.arange(n) // 2
+    patrones_g = patrones_observados(real, NOMBRES, n, grupos=grupos)
+    assert all(f.sum() == n // 2 for _, f in patrones_g)
+    assert np.array_equal(observados(patrones_g), obs)
+
+def test_estadisticas_bs():
+    rng = np.random.default_rng(1)
+    n = 2000
+    real = _tabla("real", n, rng)
+    modelos = [f"nulo_{k}" for k in range(9)]
+    tabla = pd.concat([real] + [_tabla(m, n, rng) for m in modelos], ignore_index=True)
+    patrones = patrones_observados(real, NOMBRES, n)
+    nulos = conteos_nulos(tabla, modelos, NOMBRES)
+
+    res = estadisticas_bs(patrones, nulos, NOMBRES, n_boot=2000, seed=3)
+    fila = res[(res["barrera"] == "Mitre") & (res["direccion"] == "total")].iloc[0]
+    esperado = nulos[:, 0, 0].mean()
+    assert np.isclose(fila["barrier_score"], barrier_score(fila["cruces_reales"], esperado))
+    assert fila["ci_inf"] <= fila["barrier_score"] <= fila["ci_sup"]
+    assert np.isclose(fila["p_valor"], (1 + (nulos[:, 0, 0] <= fila["cruces_reales"]).sum()) / 10)
+    assert np.isclose(fila["z"], (fila["cruces_reales"] - esperado) / nulos[:, 0, 0].std(ddof=1))
+    assert res.loc[res["barrera"] == "Roca", "barrier_score"].isna().all()
+
+    # reproducible
+    a = bootstrap_bs(patrones, nulos, n_boot=300, seed=5)
+    b = bootstrap_bs(patrones, nulos, n_boot=300, seed=5)
+    assert np.array_equal(a, b, equal_nan=True)
+    assert a.shape == (300, len(NOMBRES), 3)
+
+def test_sentidos_meridionales():
+    rng = np.random.default_rng(2)
+    n = 300
+    real = _tabla("real", n, rng)
+    real["direccion"] = real["direccion"].map({"sur_norte": "oeste_este", "norte_sur": "este_oeste"}).fillna("mismo_lado")
+    nulos = conteos_nulos(real.assign(modelo="nulo_0"), ["nulo_0"], NOMBRES)
+    obs = observados(patrones_observados(real, NOMBRES, n))
+    assert np.array_equal(nulos[0], obs)
+    sub = real[real["barrera"] == "Mitre"]
+    assert obs[0, 1] == (sub["direccion"] == "oeste_este").sum() and obs[0, 2] == (sub["direccion"] == "este_oeste").sum()
+
+    sentidos = [("oeste_este", "este_oeste"), ("sur_norte", "norte_sur"), ("sur_norte", "norte_sur")]
+    res = estadisticas_bs(patrones_observados(real, NOMBRES, n), nulos, NOMBRES, n_boot=0, sentidos=sentidos)
+    assert res.loc[res["barrera"] == "Mitre", "direccion"].tolist() == ["total", "oeste_este", "este_oeste"]
+    assert res.loc[res["barrera"] == "Roca", "direccion"].tolist() == ["total", "sur_norte", "norte_sur"]
@@ -0,0 +1,76 @@
+import json
+
+import networkx as nx
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from src.ch import ContractionHierarchy, build_ch, load_or_build_ch  # noqa: E402
+from src.graph_store import load_graph, save_graph  # noqa: E402
+from src.metrics import RunMetrics  # noqa: E402
+from src.routing import CSRGraph, Router, route_od  # noqa: E402
+
+def _dirigido(grid_graph, seed=0):
+    """Grilla con calles de una mano y pesos alterados: hay pares sin camino de ida y vuelta iguales."""
+    rng = np.random.default_rng(seed)
+    G = grid_graph.copy()
+    aristas = list(G.edges(keys=True))
+    for k in rng.choice(len(aristas), len(aristas) // 5, replace=False):
+        G.remove_edge(*aristas[k])
+    for _, _, datos in G.edges(data=True):
+        datos["length"] *= rng.uniform(0.5, 2.0)
+    return G
+
+def test_ch_igual_a_dijkstra(grid_graph):
+    for G in (grid_graph, _dirigido(grid_graph)):
+        g = CSRGraph.from_networkx(G)
+        ch = build_ch(g, limite_testigos=10)   # testigos cortos: más atajos, mismas distancias
+        assert sorted(ch.rango.tolist()) == list(range(len(g)))
+        rng = np.random.default_rng(1)
+        o = rng.integers(0, len(g), 300)
+        d = rng.integers(0, len(g), 300)
+        d[:5] = o[:5]
+
+        esperado, dist = route_od(g, o, d)
+        caminos, dist_ch = ch.route_many(o, d)
+        assert np.array_equal(np.isinf(dist_ch), np.isinf(dist))
+        assert np.allclose(dist_ch[np.isfinite(dist)], dist[np.isfinite(dist)])
+        assert np.allclose(ch.distance_many(o, d), dist_ch)
+        for camino, e in zip(caminos, esperado):
+            assert (camino is None) == (e is None)
+            if camino is not None:
+                # desempaquetado a aristas originales, mismo camino que Dijkstra
+                assert np.array_equal(camino, e)
+
+def test_ch_persistida_junto_al_grafo(tmp_path, grid_graph):
+    ref = CSRGraph.from_networkx(grid_graph)
+    save_graph(ref, tmp_path / "grafo")
+    g = load_graph(tmp_path / "grafo")
+
+    ch = load_or_build_ch(g)
+    assert (tmp_path / "grafo" / "ch" / "rango.npy").exists()
+    cargada = load_or_build_ch(load_graph(tmp_path / "grafo"))
+    assert not cargada.rango.flags.writeable   # desde la caché (mmap)
+    for a, b in zip((ch.rango, *ch.subida, *ch.bajada), (cargada.rango, *cargada.subida, *cargada.bajada)):
+        assert np.array_equal(a, b)
+    assert isinstance(cargada, ContractionHierarchy) and cargada.n_atajos == ch.n_atajos
+
+def test_router_con_ch(grid_graph):
+    router = Router.from_networkx(grid_graph, ch=True)
+    ids = np.array(sorted(grid_graph.nodes))
+    rng = np.random.default_rng(2)
+    o, d = rng.choice(ids, 40), rng.choice(ids, 40)
+    caminos, dist = router.route_many(o, d)
+    assert np.allclose(router.distance_many(o, d), dist)
+    for a, b, camino, largo in zip(o, d, caminos, dist):
+        assert router.graph.node_ids[camino].tolist() == nx.shortest_path(grid_graph, a, b, weight="length")
+        assert np.isclose(router.route(a, b)[1], largo)
+
+def test_latencia_por_consulta(tmp_path, grid_graph):
+    ch = build_ch(CSRGraph.from_networkx(grid_graph))
+    with RunMetrics("ch", out_dir=tmp_path, profile=""):
+        ch.route_many(np.arange(30), np.arange(30)[::-1])
+        ch.distance_many(np.arange(10), np.arange(10) + 1)
+    h = json.loads((tmp_path / "run_report_ch.json").read_text())["histogramas"]["latencia_ruta_s"]
+    assert h["n"] == 40 and h["max"] > 0
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+from src.checkpoint import CheckpointWriter, content_key
+
+def _bloque(ids):
+    return pd.DataFrame({"od_id": ids, "valor": [i * 10 for i in ids]})
+
+def test_checkpoint_resume_and_compact(tmp_path):
+    d = tmp_path / "ckpt"
+    w = CheckpointWriter(d, entrada="od:6")
+    w.write(_bloque([3, 4]), [3, 4, 5])      # el 5 falló: cuenta como hecho, sin fila
+    w.write(_bloque([]), [0])                # bloque sin rutas: no genera parte
+    del w                                    # "corte" de la corrida
+
+    w = CheckpointWriter(d, entrada="od:6", resume=True)
+    assert w.completados() == {0, 3, 4, 5}
+    w.write(_bloque([1, 2]), [1, 2])
+
+    out = w.compact(tmp_path / "rutas.parquet")
+    assert out["od_id"].tolist() == [1, 2, 3, 4]
+    assert pd.read_parquet(tmp_path / "rutas.parquet")["valor"].tolist() == [10, 20, 30, 40]
+    assert not d.exists()
+
+def test_checkpoint_resume_con_linea_cortada(tmp_path):
+    d = tmp_path / "ckpt"
+    w = CheckpointWriter(d, entrada="od:6")
+    w.write(_bloque([0, 1]), [0, 1])
+    w.write(_bloque([2, 3]), [2, 3])
+    # corte mientras se anotaba la segunda parte: la parte existe, su línea quedó a medias
+    contenido = (d / "manifest.jsonl").read_bytes()
+    (d / "manifest.jsonl").write_bytes(contenido[:-7])
+
+    w = CheckpointWriter(d, entrada="od:6", resume=True)
+    assert w.completados() == {0, 1}
+    assert not (d / "part-00001.parquet").exists()
+    assert (d / "manifest.jsonl").read_bytes().endswith(b"\n")
+    w.write(_bloque([2, 3]), [2, 3])
+    assert CheckpointWriter(d, entrada="od:6", resume=True).completados() == {0, 1, 2, 3}
+    assert w.compact(tmp_path / "rutas.parquet")["od_id"].tolist() == [0, 1, 2, 3]
+
+def test_checkpoint_rejects_other_input(tmp_path):
+    CheckpointWriter(tmp_path / "ckpt", entrada="od:6").write(_bloque([0]), [0])
+    with pytest.raises(ValueError):
+        CheckpointWriter(tmp_path / "ckpt", entrada="od:7", resume=True)
+    # sin --resume se empieza de cero
+    assert CheckpointWriter(tmp_path / "ckpt", entrada="od:7").completados() == set()
+
+def test_content_key_cambia_con_los_pares():
+    df = pd.DataFrame({"od_id": [0, 1, 2], "nodo_origen": [10, 11, 12], "nodo_destino": [20, 21, 22]})
+    otro = df.assign(nodo_destino=[20, 21, 23])    # mismas filas, otro par
+    assert content_key(df) == content_key(df.copy())
+    assert content_key(df) != content_key(otro)
+    assert content_key(df) != content_key(df.iloc[::-1])
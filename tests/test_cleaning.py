@@ -0,0 +1,36 @@
+import pandas as pd
+from src.cleaning import COLUMNS, stream_clean
+
+def test_stream_clean_filters_and_counts(tmp_path):
+    raw = tmp_path / "transacciones.txt"
+    raw.write_text(
+        "1,A,BUS,-34.6,-58.4,F,10,,0,5,7,11,8\n"
+        "2,A,BUS,-34.6,-58.4,F,10,,0,5,7,11\n"          # 12 campos
+        "3,B,BUS,-34.6,-58.4,F,10,,0,5,7,1,8\n"         # otra tarifa
+        "4,C,BUS,-10.0,-58.4,F,10,,0,5,7,11,9\n"        # fuera de rango
+        "5,D,TREN,,-58.4,M,,,0,5,7,11,9,extra\n"        # 14 campos
+        "6,E,TREN,-34.7,-58.5,M,,,1,5,7,11,14\n",
+        encoding="utf-8",
+    )
+    out = tmp_path / "cleaned.parquet"
+    stats = stream_clean(raw, out, block_size=64)
+
+    df = pd.read_parquet(out)
+    assert stats["filas_malformadas"] == 2
+    assert stats["filas_finales"] == 2
+    assert list(df["id_tarjeta"]) == ["A", "E"]
+    assert list(df.columns) == COLUMNS + ["hora_dt"]
+
+def test_stream_clean_descarta_id_tarjeta_vacio(tmp_path):
+    raw = tmp_path / "transacciones.txt"
+    raw.write_text(
+        "1,,BUS,-34.6,-58.4,F,10,,0,5,7,11,8\n"          # sin id_tarjeta
+        "2,A,BUS,-34.6,-58.4,F,10,,0,5,7,11,8\n",
+        encoding="utf-8",
+    )
+    out = tmp_path / "cleaned.parquet"
+    stats = stream_clean(raw, out)
+
+    df = pd.read_parquet(out)
+    assert stats["filas_finales"] == 1
+    assert list(df["id_tarjeta"]) == ["A"]
@@ -0,0 +1,20 @@
+import numpy as np
+import osmnx as ox
+from src.graph_store import load_or_build
+from src.routing import CSRGraph, route_od
+
+def test_graph_cache_from_local_graphml(tmp_path, grid_graph):
+    archivo = tmp_path / "grilla.graphml"
+    ox.save_graphml(grid_graph, archivo)
+    cache = tmp_path / "graphs"
+
+    g1 = load_or_build(source=archivo, cache_dir=cache)
+    g2 = load_or_build(source=archivo, cache_dir=cache)   # desde la caché, sin parsear el graphml
+    assert not g2.indices.flags.writeable            # mmap de sólo lectura
+    assert g1.meta["fingerprint"] == g2.meta["fingerprint"]
+    assert len(list(cache.iterdir())) == 1
+
+    ref = CSRGraph.from_networkx(grid_graph)
+    assert np.array_equal(g2.node_ids, ref.node_ids)
+    o, d = g2.index_of(ref.node_ids[:5]), g2.index_of(ref.node_ids[-5:])
+    assert np.allclose(route_od(g2, o, d)[1], route_od(ref, o, d)[1])
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+from src.io_utils import load_routes, route_columns, route_fingerprint, save_routes
+
+def test_routes_geoparquet_roundtrip(tmp_path):
+    df = pd.DataFrame({
+        "id_tarjeta": ["a", "b"],
+        "lat_origen": [-34.60, -34.62],
+        "lat_destino": [-34.65, -34.58],
+        "ruta": [LineString([(-58.4, -34.60), (-58.5, -34.65)]), LineString([(-58.3, -34.62), (-58.4, -34.58)])],
+        "cruza_sarmiento": [True, False],
+        "nodos": [np.array([1, 2, 3]), np.array([4, 5])],
+    })
+    path = save_routes(df, tmp_path / "rutas.parquet")
+    assert route_columns(path) == list(df.columns)
+
+    # Proyección sin geometría: DataFrame plano, sin decodificar WKB
+    parcial = load_routes(path, columns=["cruza_sarmiento", "lat_origen"])
+    assert list(parcial.columns) == ["cruza_sarmiento", "lat_origen"]
+    assert not hasattr(parcial, "geometry")
+
+    completo = load_routes(path)
+    assert completo.crs.to_epsg() == 4326
+    assert completo["ruta"].iloc[0].equals(df["ruta"].iloc[0])
+    assert completo["nodos"].iloc[1].tolist() == [4, 5]
+
+def test_route_fingerprint_lee_el_footer(tmp_path):
+    df = pd.DataFrame({"lat_origen": [-34.60, -34.62], "cruza_sarmiento": [True, False],
+                       "ruta": [LineString([(0, 0), (1, 1)]), LineString([(1, 1), (2, 0)])]})
+    path = save_routes(df, tmp_path / "a.parquet")
+    a = route_fingerprint(path)
+    datos = path.read_bytes()
+    footer = datos[-8 - int.from_bytes(datos[-8:-4], "little"):-8]
+    assert route_fingerprint(path) == a and a.endswith(footer)
+    df.loc[1, "cruza_sarmiento"] = True
+    save_routes(df, path)
+    assert route_fingerprint(path) != a
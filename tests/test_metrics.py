@@ -0,0 +1,79 @@
+import json
+import pstats
+
+import numpy as np
+import pytest
+from src import metrics
+from src.metrics import RunMetrics
+
+def _leer(tmp_path, etapa):
+    return json.loads((tmp_path / f"run_report_{etapa}.json").read_text(encoding="utf-8"))
+
+def test_reporte_con_timers_contadores_e_histograma(tmp_path):
+    with RunMetrics("etapa", out_dir=tmp_path, intervalo=0.01, profile=""):
+        assert metrics.activo()
+        for _ in range(3):
+            with metrics.timer("seccion"):
+                np.ones(10 ** 5).sum()
+        metrics.record("caliente", 0.5, llamadas=10)
+        metrics.count("rutas", 7)
+        metrics.count("rutas")
+        metrics.observe("latencia_s", np.r_[np.full(90, 1e-3), np.full(10, 1.0)])
+        metrics.info(pares=100)
+    assert not metrics.activo()
+
+    r = _leer(tmp_path, "etapa")
+    assert r["estado"] == "ok" and r["error"] is None and r["profile"] is None
+    assert r["timers"]["seccion"]["llamadas"] == 3 and r["timers"]["seccion"]["rss_pico_mb"] > 0
+    assert r["timers"]["caliente"] == {"seg": 0.5, "llamadas": 10, "rss_pico_mb": 0.0}
+    assert r["contadores"] == {"rutas": 8}
+    assert r["extra"] == {"pares": 100}
+    assert r["rss_pico_mb"] > 0
+    h = r["histogramas"]["latencia_s"]
+    assert h["n"] == 100 and h["max"] == 1.0
+    # percentiles con la precisión de un bin (10 por década)
+    assert 1e-3 <= h["p50"] < 1.3e-3
+    assert 1e-3 <= h["p90"] < 1.3e-3
+    assert h["p99"] == 1.0
+    assert sum(h["bins"].values()) == 100
+
+def test_sin_corrida_activa_no_hace_nada(tmp_path):
+    with metrics.timer("x"):
+        pass
+    metrics.count("x")
+    metrics.observe("x", 1.0)
+    metrics.rename_stage("otra")
+    assert not metrics.activo()
+    assert not list(tmp_path.iterdir())
+
+def test_error_y_renombre(tmp_path):
+    with pytest.raises(RuntimeError):
+        with RunMetrics("41_route_paths_null", out_dir=tmp_path, profile=""):
+            metrics.rename_stage("41_route_paths_null_r3")
+            raise RuntimeError("falla")
+    r = _leer(tmp_path, "41_route_paths_null_r3")
+    assert r["estado"] == "error" and "falla" in r["error"]
+
+    with pytest.raises(SystemExit):
+        with RunMetrics("ayuda", out_dir=tmp_path, profile=""):
+            raise SystemExit(0)  # p. ej. --help: sin reporte
+    assert not (tmp_path / "run_report_ayuda.json").exists()
+
+    with pytest.raises(SystemExit):
+        with RunMetrics("temprano", out_dir=tmp_path, profile=""):
+            metrics.info(pares=0)
+            raise SystemExit(0)
+    assert _leer(tmp_path, "temprano")["estado"] == "ok"
+
+def test_profile_cprofile(tmp_path):
+    with RunMetrics("perfil", out_dir=tmp_path, profile="cprofile"):
+        sorted(range(1000), key=lambda v: -v)
+    r = _leer(tmp_path, "perfil")
+    assert r["profile"] == str(tmp_path / "profile_perfil.prof")
+    assert pstats.Stats(r["profile"]).total_calls > 0
+
+def test_profile_desconocido(tmp_path):
+    with pytest.raises(ValueError):
+        with RunMetrics("x", out_dir=tmp_path, profile="perf"):
+            pass
+    assert not metrics.activo()
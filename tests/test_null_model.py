@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import dijkstra
+from src.null_model import (
+    barrido_parametros, candidatos_desde_indice, divergencia_js, emparejar_csr, haversine_bloques, haversine_km_vec,
+    indice_bin, ks_distancias, posibles_destinos_csr, preparar_candidatos, recableo_matching, recableo_replicas,
+)
+from src.routing import CSRGraph
+
+def _od(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "lat_origen": rng.uniform(-34.70, -34.55, n), "lon_origen": rng.uniform(-58.52, -58.35, n),
+        "lat_destino": rng.uniform(-34.70, -34.55, n), "lon_destino": rng.uniform(-58.52, -58.35, n),
+    })
+
+def _candidatos_fuerza_bruta(df, bins, bin_real, tol_bins, allow_keep):
+    # Versión original O(n²): distancia de cada origen a todos los destinos
+    n = len(df)
+    out = []
+    for i in range(n):
+        d = haversine_km_vec(df["lat_origen"].iat[i], df["lon_origen"].iat[i],
+                             df["lat_destino"].to_numpy(), df["lon_destino"].to_numpy())
+        mask = np.abs(indice_bin(d, bins) - bin_real[i]) <= tol_bins
+        if not allow_keep:
+            mask &= np.arange(n) != i
+        out.append(np.where(mask)[0].tolist())
+    return out
+
+def test_candidatos_csr_igual_a_fuerza_bruta():
+    df = _od()
+    d = haversine_km_vec(df["lat_origen"], df["lon_origen"], df["lat_destino"], df["lon_destino"]).to_numpy()
+    bins = np.arange(0, d.max() + 1.0, 1.0)
+    bin_real = indice_bin(d, bins)
+    for tol, keep in [(0, True), (1, False), (2, True)]:
+        esperado = _candidatos_fuerza_bruta(df, bins, bin_real, tol, keep)
+        indptr, indices = posibles_destinos_csr(df, bins, bin_real, tol_bins=tol, allow_keep=keep, bloque=97)
+        assert [indices[indptr[i]:indptr[i + 1]].tolist() for i in range(len(df))] == esperado
+        # tiles de pocas filas (max_mem_mb chico): mismo resultado
+        indptr, indices = posibles_destinos_csr(df, bins, bin_real, tol_bins=tol, allow_keep=keep,
+                                                metodo="bloques", max_mem_mb=0.05)
+        assert [indices[indptr[i]:indptr[i + 1]].tolist() for i in range(len(df))] == esperado
+
+def test_haversine_bloques_float32():
+    df = _od(n=300, seed=1)
+    args = [df[c].to_numpy() for c in ("lat_origen", "lon_origen", "lat_destino", "lon_destino")]
+    ref = haversine_km_vec(args[0][:, None], args[1][:, None], args[2][None, :], args[3][None, :])
+    tiles = 0
+    for ini, fin, D in haversine_bloques(*args, max_mem_mb=0.1, dtype=np.float32):
+        assert D.dtype == np.float32
+        assert np.allclose(D, ref[ini:fin], atol=1e-3)
+        tiles += 1
+    assert tiles > 1
+
+def test_emparejar_csr_uno_a_uno_y_reproducible():
+    rng = np.random.default_rng(0)
+    n, grado = 2000, 5
+    indptr = np.arange(0, n * grado + 1, grado)
+    indices = rng.integers(0, n, n * grado)
+
+    asignado, sin_posibles = emparejar_csr(indptr, indices, np.random.default_rng(42))
+    ok = asignado >= 0
+    assert len(np.unique(asignado[ok])) == ok.sum()
+    assert sorted(sin_posibles) == np.flatnonzero(~ok).tolist()
+    for i in np.flatnonzero(ok):
+        assert asignado[i] in indices[indptr[i]:indptr[i + 1]]
+
+    otra, _ = emparejar_csr(indptr, indices, np.random.default_rng(42))
+    assert np.array_equal(asignado, otra)
+
+def test_replicas_no_dependen_de_workers():
+    df = _od(n=300, seed=2)
+    serie = {r: d for r, d, *_ in recableo_replicas(df, 3, ancho_bin_km=0.5, seed=9, workers=1)}
+    paralelo = {r: d for r, d, *_ in recableo_replicas(df, 3, ancho_bin_km=0.5, seed=9, workers=2)}
+    assert sorted(paralelo) == [0, 1, 2]
+    for r in serie:
+        pd.testing.assert_frame_equal(serie[r], paralelo[r])
+    assert not serie[0]["lat_destino"].equals(serie[1]["lat_destino"])
+
+def test_candidatos_red_igual_a_fuerza_bruta(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    rng = np.random.default_rng(4)
+    n = 150
+    o, d = rng.integers(0, len(g), n), rng.integers(0, len(g), n)
+    d[:10] = d[10:20]  # destinos compartidos
+    df = pd.DataFrame({
+        "lat_origen": g.y[o], "lon_origen": g.x[o], "lat_destino": g.y[d], "lon_destino": g.x[d],
+        "nodo_origen": g.node_ids[o], "nodo_destino": g.node_ids[d],
+        "fuera_de_red": np.arange(n) == 5,
+    })
+    df_c, bins, indptr, indices, dist = preparar_candidatos(df, ancho_bin_km=0.5, tol_bins=1, allow_keep=False,
+                                                            graph=g, radio_red_km=50)
+
+    red = dijkstra(g.matrix, indices=o)[:, d] / 1000  # red[i, j]: origen i → destino j
+    assert np.allclose(df_c["distancia_red_km"].to_numpy()[np.arange(n) != 5], np.diag(red)[np.arange(n) != 5])
+    bin_real = indice_bin(np.diag(red), bins)
+    for i in range(n):
+        cand = indices[indptr[i]:indptr[i + 1]]
+        if i == 5:
+            assert len(cand) == 0
+            continue
+        ok = (np.abs(indice_bin(red[i], bins) - bin_real[i]) <= 1) & (np.arange(n) != i) & (np.arange(n) != 5)
+        assert cand.tolist() == np.flatnonzero(ok).tolist()
+        assert np.allclose(dist[indptr[i]:indptr[i + 1]], red[i, cand])
+
+def test_barrido_igual_a_recableo_matching():
+    df = _od(n=300, seed=3)
+    d_real = haversine_km_vec(df["lat_origen"].to_numpy(), df["lon_origen"].to_numpy(),
+                              df["lat_destino"].to_numpy(), df["lon_destino"].to_numpy())
+    res = barrido_parametros(df, [0.5, 1.0], [0, 1], [7, 8], allow_keep=False, workers=2)
+    assert len(res) == 8
+    for fila in res.itertuples():
+        df_rec, emp, sin_pos, summary = recableo_matching(df, fila.bin_km, fila.tol_bins, False, seed=fila.seed)
+        assert (fila.emparejados, fila.sin_posibles) == (emp, len(sin_pos))
+        assert np.isclose(fila.js_div, divergencia_js(summary["prob_real"], summary["prob_nulo"]))
+        assert np.isclose(fila.ks, ks_distancias(d_real, df_rec["distancia_km"].to_numpy()))
+
+def test_candidatos_desde_indice_borde_de_bin_con_muchas_filas():
+    # Con n grande, una clave float fila·K + d pierde los cm: 1 km - 1e-6 caía fuera del bin
+    n = 2_000_000
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[-1] = 3
+    dist = np.array([0.3, 1.0 - 1e-6, 1.0 + 1e-6])
+    indice = (indptr, np.array([5, 6, 7]), dist, np.full(n, 0.5), 3.0)
+    _, ip, j = candidatos_desde_indice(indice, 1.0, 0)
+    assert ip[-2] == 0 and j.tolist() == [5, 6]
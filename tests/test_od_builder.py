@@ -1,7 +1,64 @@
-from src.od_builder import infer_home_school_pairs
+from src.od_builder import infer_home_school_pairs, build_pairs
+import numpy as np
 import pandas as pd
 
 def test_infer_pairs_empty():
     df = pd.DataFrame()
     out = infer_home_school_pairs(df)
     assert set(out.columns) == {'id_tarjeta','home_lat','home_lon','school_lat','school_lon'}
+
+def _build_pairs_loop(df, min_gap_hours):
+    # Implementación original (una iteración por tarjeta), como referencia
+    df = df[df["etapa_red_sube"] == 0].copy()
+    df["hora"] = pd.to_numeric(df["hora"], errors="coerce").astype("Int64")
+    df = df.dropna(subset=["id_tarjeta", "lat", "lon", "hora"]).copy()
+    df = df.sort_values(["id_tarjeta", "hora"]).reset_index(drop=True)
+    resultados = []
+    for tarjeta, g in df.groupby("id_tarjeta", sort=False):
+        g = g.reset_index(drop=True)
+        if len(g) < 2:
+            continue
+        origen = g.iloc[0]
+        candidatos = g.loc[(g["hora"] >= origen["hora"] + min_gap_hours) &
+                           ~((g["lat"] == origen["lat"]) & (g["lon"] == origen["lon"]))]
+        if candidatos.empty:
+            continue
+        destino = candidatos.iloc[0]
+        resultados.append({
+            "id_tarjeta": tarjeta,
+            "lat_origen": float(origen["lat"]), "lon_origen": float(origen["lon"]),
+            "hora_origen": int(origen["hora"]), "modo_origen": origen.get("modo"),
+            "interno_origen": origen.get("interno_bus"), "ramal_origen": origen.get("id_ramal"),
+            "lat_destino": float(destino["lat"]), "lon_destino": float(destino["lon"]),
+            "hora_destino": int(destino["hora"]), "modo_destino": destino.get("modo"),
+            "interno_destino": destino.get("interno_bus"), "ramal_destino": destino.get("id_ramal"),
+        })
+    return pd.DataFrame(resultados)
+
+def _transacciones(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    puntos = rng.uniform([-34.7, -58.5], [-34.5, -58.3], size=(40, 2))
+    k = rng.integers(0, len(puntos), n)
+    return pd.DataFrame({
+        "id_tarjeta": rng.integers(0, 400, n).astype(str),
+        "lat": puntos[k, 0], "lon": puntos[k, 1],
+        "hora": rng.integers(5, 22, n),
+        "modo": rng.choice(["BUS", "TREN", "SUBTE"], n),
+        "interno_bus": rng.integers(1, 50, n).astype(str),
+        "id_ramal": rng.integers(1, 9, n).astype(str),
+        "etapa_red_sube": rng.choice([0, 0, 0, 1], n),
+    })
+
+def test_build_pairs_matches_loop():
+    df = _transacciones()
+    for gap in (0, 3, 6):
+        esperado = _build_pairs_loop(df, gap)
+        obtenido = build_pairs(df, min_gap_hours=gap)
+        pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False)
+
+def test_build_pairs_gap_vector():
+    df = _transacciones(seed=1)
+    multi = build_pairs(df, min_gap_hours=[2, 4])
+    for gap in (2, 4):
+        sub = multi[multi["min_gap_horas"] == gap].drop(columns="min_gap_horas").reset_index(drop=True)
+        pd.testing.assert_frame_equal(sub, build_pairs(df, min_gap_hours=gap))
@@ -0,0 +1,33 @@
+import numpy as np
+from src.route_cache import COSTO_ENTRADA, RouteCache
+from src.routing import CSRGraph, route_od
+
+def test_route_cache_hits_and_lru(tmp_path, grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    o = np.array([0, 0, 5, 7, 7])
+    d = np.array([100, 143, 3, 7, 60])
+
+    cache = RouteCache.for_graph(tmp_path / "rutas.sqlite", g, max_bytes=200)
+    esperado, dist = route_od(g, o, d)
+    caminos, dist1 = route_od(g, o, d, cache=cache)
+    assert cache.stats()["misses"] == len(o)
+    assert cache.stats()["lru_bytes"] <= 200           # el LRU desaloja para respetar el tope
+    cache.close()
+
+    cache = RouteCache.for_graph(tmp_path / "rutas.sqlite", g)   # nueva sesión: todo desde disco
+    caminos2, dist2 = route_od(g, o, d, cache=cache)
+    caminos3, _ = route_od(g, o, d, cache=cache)
+    st = cache.stats()
+    assert (st["hits_disco"], st["hits_memoria"], st["misses"]) == (len(o), len(o), 0)
+    assert np.array_equal(dist, dist2)
+    assert all(np.array_equal(a, b) for a, b in zip(esperado, caminos3))
+
+def test_lru_cuenta_entradas_sin_camino(tmp_path):
+    cache = RouteCache(tmp_path / "rutas.sqlite", "fp", max_bytes=10 * COSTO_ENTRADA)
+    n = 1000
+    cache.put_many(np.arange(n), np.arange(n) + 1, [None] * n, np.full(n, np.inf))   # pares sin camino
+    st = cache.stats()
+    assert st["lru_items"] == 10 and st["lru_bytes"] == 10 * COSTO_ENTRADA
+    _, dist, encontrados = cache.get_many(np.arange(n), np.arange(n) + 1)             # el resto, desde disco
+    assert encontrados.all() and np.isinf(dist).all()
+    cache.close()
@@ -1,6 +1,222 @@
+import argparse
+import json
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pandas as pd
 from shapely.geometry import LineString
-from src.routing import shortest_path_line
+from src.metrics import RunMetrics
+from src.route_cache import RouteCache
+from src.routing import (
+    CSRGraph, NodeSnapper, Router, add_route_args, csr_lookup, marcar_fuera_de_red, network_distance_matrix,
+    origin_blocks, route_frame, route_od, route_records, shortest_path_line, unique_pairs, worker_pool,
+)
 
 def test_route_returns_linestring(monkeypatch):
     # No ejecuta red real en tests; solo valida tipo si se mockea en el futuro
     assert isinstance(LineString([(0,0),(1,1)]), LineString)
+
+def test_node_snapper_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-34.70, -34.55, 500)
+    lon = rng.uniform(-58.52, -58.35, 500)
+    snapper = NodeSnapper(np.arange(500) + 1000, lat, lon)
+
+    qlat = rng.uniform(-34.70, -34.55, 200)
+    qlon = rng.uniform(-58.52, -58.35, 200)
+    nodos, dist = snapper.snap(qlat, qlon)
+
+    dy = (lat[None, :] - qlat[:, None]) * 111_195
+    dx = (lon[None, :] - qlon[:, None]) * 111_195 * np.cos(np.radians(snapper.lat0))
+    esperado = np.argmin(dx**2 + dy**2, axis=1) + 1000
+    assert np.array_equal(nodos, esperado)
+    assert np.all(dist < 5_000)
+
+def test_route_od_matches_networkx(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    rng = np.random.default_rng(1)
+    ids = np.array(sorted(grid_graph.nodes))
+    o = rng.choice(ids[:20], 60)      # orígenes repetidos → agrupados
+    d = rng.choice(ids, 60)
+
+    caminos, dist = route_od(g, g.index_of(o), g.index_of(d), batch=4)
+    for k in range(len(o)):
+        esperado = nx.shortest_path(grid_graph, o[k], d[k], weight="length")
+        assert g.node_ids[caminos[k]].tolist() == esperado
+        assert np.isclose(dist[k], nx.shortest_path_length(grid_graph, o[k], d[k], weight="length"))
+
+def test_route_od_parallel_matches_sequential(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)   # sin caché → memoria compartida
+    rng = np.random.default_rng(2)
+    o = rng.integers(0, len(g), 200)
+    d = rng.integers(0, len(g), 200)
+
+    seq, dist_seq = route_od(g, o, d)
+    par, dist_par = route_od(g, o, d, workers=3)
+    assert np.array_equal(dist_seq, dist_par)
+    assert all(np.array_equal(a, b) for a, b in zip(seq, par))
+
+    # un pool para varias llamadas (como los bloques de checkpoint de una corrida)
+    with worker_pool(g, 2) as pool:
+        router = Router(g, workers=2, pool=pool)
+        for ini in (0, 100):
+            caminos, dist = router.route_many(g.node_ids[o[ini:ini + 100]], g.node_ids[d[ini:ini + 100]])
+            assert np.array_equal(dist, dist_seq[ini:ini + 100])
+            assert all(np.array_equal(a, b) for a, b in zip(caminos, seq[ini:ini + 100]) if b is not None)
+
+def test_origin_blocks_no_parten_origenes():
+    o = np.sort(np.random.default_rng(0).integers(0, 30, 500))
+    bloques = origin_blocks(o, 40)
+    assert bloques[0].start == 0 and bloques[-1].stop == len(o)
+    assert all(a.stop == b.start for a, b in zip(bloques, bloques[1:]))
+    assert all(o[b.stop - 1] != o[b.stop] for b in bloques[:-1])
+    assert all(b.stop - b.start >= 40 for b in bloques[:-1])
+    assert origin_blocks(np.array([]), 10) == []
+
+def test_unique_pairs_roundtrip():
+    o = np.array([5, 1, 5, 1, 5, 2])
+    d = np.array([7, 3, 7, 3, 8, 3])
+    uo, ud, inversa = unique_pairs(o, d)
+    assert len(uo) == 4
+    assert np.array_equal(uo[inversa], o) and np.array_equal(ud[inversa], d)
+    assert np.bincount(inversa)[np.flatnonzero((uo == 5) & (ud == 7))[0]] == 2
+
+def test_network_distance_matrix_matches_networkx(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    rng = np.random.default_rng(3)
+    o = np.unique(rng.integers(0, len(g), 25))
+    d = np.unique(np.r_[o[:3], rng.integers(0, len(g), 40)])
+    limite = 3000.0
+    M = network_distance_matrix(g, o, d, limit=limite, batch=7)
+
+    assert M.shape == (len(o), len(d))
+    fi, co = np.meshgrid(np.arange(len(o)), np.arange(len(d)), indexing="ij")
+    valores = csr_lookup(M, fi.ravel(), co.ravel()).reshape(fi.shape)
+    for i, u in enumerate(o):
+        largos = nx.single_source_dijkstra_path_length(grid_graph, g.node_ids[u], weight="length")
+        for j, v in enumerate(d):
+            esperado = largos[g.node_ids[v]]
+            if esperado < limite:
+                assert np.isclose(valores[i, j], esperado)
+            else:
+                assert np.isinf(valores[i, j])
+    assert (valores == 0).sum() == len(np.intersect1d(o, d))  # origen == destino: cero explícito
+
+def test_router_astar_matches_networkx(grid_graph):
+    rng = np.random.default_rng(4)
+    ids = np.array(sorted(grid_graph.nodes))
+    # pesos muy por debajo del gran círculo: la escala de la heurística la mantiene admisible
+    G = grid_graph.copy()
+    for _, _, datos in G.edges(data=True):
+        datos["length"] *= rng.uniform(0.05, 1.0)
+    for grafo in (grid_graph, G):
+        router = Router.from_networkx(grafo)
+        assert 0 < router.escala <= 0.999
+        for a, b in rng.choice(ids, (80, 2)):
+            camino, largo = router.route(a, b)
+            assert router.graph.node_ids[camino].tolist() == nx.shortest_path(grafo, a, b, weight="length")
+            assert np.isclose(largo, nx.shortest_path_length(grafo, a, b, weight="length"))
+
+def test_router_sin_camino_y_mismo_nodo():
+    G = nx.MultiDiGraph()
+    for n, (y, x) in enumerate([(-34.60, -58.40), (-34.60, -58.39), (-34.61, -58.39)]):
+        G.add_node(n, y=y, x=x)
+    G.add_edge(0, 1, length=1000.0)
+    router = Router.from_networkx(G)
+    assert router.route(1, 0) == (None, np.inf)
+    assert router.route(0, 2) == (None, np.inf)
+    camino, largo = router.route(2, 2)
+    assert camino.tolist() == [2] and largo == 0.0
+
+def test_router_many_y_distancias(grid_graph, tmp_path):
+    g = CSRGraph.from_networkx(grid_graph)
+    rng = np.random.default_rng(5)
+    o = g.node_ids[rng.integers(0, len(g), 150)]
+    d = g.node_ids[rng.integers(0, len(g), 150)]
+    d[:10] = o[:10]                      # origen = destino: camino de un nodo, sin geometría
+    o[10:20], d[10:20] = o[20], d[20]    # pares repetidos
+    esperado, dist = route_od(g, g.index_of(o), g.index_of(d))
+
+    cache = RouteCache.for_graph(tmp_path / "rutas.sqlite", g)
+    for router in (Router(g), Router(g, cache=cache, batch=7)):
+        caminos, dist_many = router.route_many(o, d)
+        assert np.array_equal(dist_many, dist)
+        assert all(np.array_equal(a, b) for a, b in zip(caminos, esperado))
+        assert np.allclose(router.distance_many(o, d), dist)
+
+        geoms, _ = router.route_many(o, d, geometria=True)
+        assert len(geoms) == len(o) and geoms[0] is None
+        assert geoms[10] is not None and np.allclose(geoms[10].coords, np.c_[g.x[esperado[10]], g.y[esperado[10]]])
+        unicas = geoms.unicas()
+        assert all(geoms[i] is unicas[geoms.pares[i]] for i in range(len(geoms)))
+        assert geoms[10] is geoms[19]
+        sub = geoms[5:15]
+        assert len(sub) == 10 and sub[5] is geoms[10] and sub[0] is None
+        assert [sub.camino(i) for i in range(10)] == [geoms.camino(i) for i in range(5, 15)]
+    assert cache.stats()["hits_memoria"] > 0
+    cache.close()
+
+def test_route_records(grid_graph):
+    router = Router.from_networkx(grid_graph)
+    g = router.graph
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame({"od_id": np.arange(60), "nodo_origen": g.node_ids[rng.integers(0, len(g), 60)],
+                       "nodo_destino": g.node_ids[rng.integers(0, len(g), 60)]})
+    df.loc[:4, "nodo_destino"] = df.loc[:4, "nodo_origen"]     # sin ruta: se descartan
+    traza = LineString([(g.x.min(), g.y.mean()), (g.x.max(), g.y.mean() + 1e-4)])
+    rutas, _ = router.route_many(df["nodo_origen"], df["nodo_destino"], geometria=True)
+
+    out = route_records(df, rutas, traza, columnas=["od_id", "hora_origen"], guardar_nodos=True)
+    con_ruta = [i for i in range(60) if rutas[i] is not None]
+    assert con_ruta[0] == 5 and out["od_id"].tolist() == con_ruta
+    assert out["hora_origen"].isna().all()           # columna que el OD no trae
+    assert out["cruza_sarmiento"].tolist() == [r.crosses(traza) for r in out["ruta"]]
+    assert all(np.array_equal(n, g.node_ids[rutas.camino(i)]) for i, n in zip(con_ruta, out["nodos"]))
+
+def test_route_frame_igual_a_route_records(tmp_path, monkeypatch, grid_graph):
+    monkeypatch.chdir(tmp_path)   # checkpoints en data/interim/checkpoints relativo
+    router = Router.from_networkx(grid_graph)
+    g = router.graph
+    rng = np.random.default_rng(7)
+    n = 80
+    o, d = rng.integers(0, len(g), n), rng.integers(0, len(g), n)
+    df = pd.DataFrame({"lat_origen": g.y[o], "lon_origen": g.x[o], "lat_destino": g.y[d], "lon_destino": g.x[d]})
+    traza = LineString([(g.x.min(), g.y.mean()), (g.x.max(), g.y.mean() + 1e-4)])
+    gpd.GeoDataFrame({"Linea": ["Sarmiento"]}, geometry=[traza], crs="EPSG:4326").to_file(tmp_path / "lineas.geojson")
+    args = add_route_args(argparse.ArgumentParser()).parse_args(["--sin-cache-rutas", "--checkpoint-cada", "20"])
+
+    out = route_frame(df.copy(), g, args, tmp_path / "rutas.parquet", "od", tmp_path / "lineas.geojson")
+    orden = df.assign(od_id=np.arange(n), nodo_origen=g.node_ids[o], nodo_destino=g.node_ids[d])
+    orden = orden.sort_values(["nodo_origen", "nodo_destino"], kind="stable")
+    rutas, _ = router.route_many(orden["nodo_origen"], orden["nodo_destino"], geometria=True)
+    esperado = route_records(orden, rutas, traza).sort_values("od_id")   # compact ordena por od_id
+    assert out["od_id"].tolist() == esperado["od_id"].tolist()
+    assert out["cruza_sarmiento"].tolist() == esperado["cruza_sarmiento"].tolist()
+    assert all(a.equals(b) for a, b in zip(out["ruta"], esperado["ruta"]))
+
+def test_latencia_por_origen_y_por_ruta(tmp_path, grid_graph):
+    router = Router.from_networkx(grid_graph)
+    ids = router.graph.node_ids
+    o = np.repeat(ids[:12], 3)
+    d = ids[np.arange(36) + 50]
+    with RunMetrics("ruteo", out_dir=tmp_path, profile=""):
+        router.route_many(o, d)
+        router.route(ids[0], ids[-1])
+    h = json.loads((tmp_path / "run_report_ruteo.json").read_text())["histogramas"]
+    assert h["latencia_origen_s"]["n"] == 12     # un Dijkstra medido por origen
+    assert h["latencia_ruta_s"]["n"] == 1        # A*
+
+def test_marcar_fuera_de_red_con_nodos_de_otro_grafo(grid_graph):
+    g = CSRGraph.from_networkx(grid_graph)
+    ids = g.node_ids
+    df = pd.DataFrame({
+        "nodo_origen": [ids[0], ids[1], -1],
+        "nodo_destino": [ids[2], ids.max() + 1, ids[3]],
+        "snap_m_origen": [5.0, 5.0, 5.0],
+        "snap_m_destino": [5.0, 5.0, 900.0],
+    })
+    assert np.array_equal(g.contains(df["nodo_origen"]), [True, True, False])
+    assert marcar_fuera_de_red(df.copy(), 500.0)["fuera_de_red"].tolist() == [False, False, True]
+    assert marcar_fuera_de_red(df.copy(), 500.0, g)["fuera_de_red"].tolist() == [False, True, True]
+    assert marcar_fuera_de_red(df.copy(), None, g)["fuera_de_red"].tolist() == [False, True, True]